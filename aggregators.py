@@ -0,0 +1,295 @@
+# -*- coding: utf8 -*-
+import math
+
+import numpy as np
+
+from communes import ENCODING
+from od_matrix import ODMatrix
+from time_histogram import TimeHistogram, get_time_bins
+from writers import DICTIONARY
+
+# trips added at once to origin-destination matrix
+BATCH_SIZE = 65536
+TRIPS_HEADER = 'N°_viajes_expandidos'
+STANDARD_ERROR_HEADER = 'Error_estandar'
+# value of empty fields in trip files
+EMPTY_FIELDS = ('-', b'-', '', b'')
+
+
+class ODAccumulator:
+    """
+    Class to accumulate expanded trips of one file for an aggregator. Trips are split by group and added in batches
+    to one ODMatrix per group.
+    """
+
+    def __init__(self, group_index=None, zone_indexes=None):
+        self.group_index = group_index
+        self.zone_indexes = zone_indexes
+        self.matrices = {}
+        self._batches = {}
+        self._names = {}
+
+    def _name(self, field):
+        try:
+            return self._names[field]
+        except KeyError:
+            name = field.decode(ENCODING) if isinstance(field, bytes) else field
+            name = name.strip()
+            self._names[field] = name
+            return name
+
+    def add(self, row, start_commune, end_commune, trips):
+        if self.zone_indexes is not None:
+            start_commune, end_commune = row[self.zone_indexes[0]], row[self.zone_indexes[1]]
+            if start_commune in EMPTY_FIELDS or end_commune in EMPTY_FIELDS:
+                return
+            start_commune, end_commune = self._name(start_commune), self._name(end_commune)
+        elif not (start_commune and end_commune):
+            return
+        group = None if self.group_index is None else self._name(row[self.group_index])
+        try:
+            od_matrix, origins, destinations, values = self._batches[group]
+        except KeyError:
+            od_matrix = self.matrices[group] = ODMatrix()
+            origins, destinations, values = [], [], []
+            self._batches[group] = od_matrix, origins, destinations, values
+        origins.append(od_matrix.commune_id(start_commune))
+        destinations.append(od_matrix.commune_id(end_commune))
+        values.append(trips)
+        if len(values) == BATCH_SIZE:
+            self._flush(group)
+
+    def _flush(self, group):
+        od_matrix, origins, destinations, values = self._batches[group]
+        od_matrix.add(origins, destinations, values)
+        del origins[:], destinations[:], values[:]
+
+    def result(self):
+        """
+        :return: dict with ODMatrix of each group, group is None when aggregator has no group column
+        """
+        for group in self._batches:
+            self._flush(group)
+        return self.matrices
+
+
+class ODAggregator:
+    """
+    Class to describe an origin-destination aggregation computed while trip files are read. Trips go from commune to
+    commune or from zone to zone when zone columns are given, and they can be split by the value of a group column.
+    """
+
+    def __init__(self, output_name, origin_header, destination_header, zone_columns=None, group_header=None,
+                 group_column=None):
+        self.output_name = output_name
+        self.zone_columns = zone_columns
+        self.group_column = group_column
+        self.header = ['Fecha'] + ([group_header] if group_header else []) + \
+                      [origin_header, destination_header, TRIPS_HEADER]
+        self.column_types = {header: DICTIONARY for header in self.header}
+        self.column_types.update({'Fecha': 'date32', TRIPS_HEADER: 'float64'})
+
+    @property
+    def columns(self):
+        """
+        :return: columns of trip files used by aggregator besides communes and expansion factor
+        """
+        return tuple(self.zone_columns or ()) + ((self.group_column,) if self.group_column is not None else ())
+
+    def accumulator(self, columns):
+        """
+        :param columns: columns read from trip files, they give the position of each column in rows
+        """
+        group_index = columns.index(self.group_column) if self.group_column is not None else None
+        zone_indexes = tuple(columns.index(column) for column in self.zone_columns) if self.zone_columns else None
+        return ODAccumulator(group_index, zone_indexes)
+
+    def rows(self, date, result):
+        """
+        Yield output rows of a day ordered by group, origin and destination ids.
+        """
+        for group in sorted(result, key=lambda x: '' if x is None else x):
+            for origin, destination, trips in result[group].rows():
+                if self.group_column is None:
+                    yield [date, origin, destination, trips]
+                else:
+                    yield [date, group, origin, destination, trips]
+
+
+class TimeAccumulator:
+    """
+    Class to accumulate expanded trips of one file by origin commune and time of day for a time aggregator.
+    Timestamps are parsed in batches with NumPy and trips are added at once when result is requested.
+    """
+
+    def __init__(self, time_index):
+        self.time_index = time_index
+        self.histogram = TimeHistogram()
+        # origin commune, timestamp and expanded trips of trips not parsed yet
+        self._communes = []
+        self._timestamps = []
+        self._values = []
+        self._batches = []
+
+    def add(self, row, start_commune, end_commune, trips):
+        if start_commune:
+            self._communes.append(start_commune)
+            self._timestamps.append(row[self.time_index])
+            self._values.append(trips)
+            if len(self._values) == BATCH_SIZE:
+                self._flush()
+
+    def _flush(self):
+        # communes are interned in batch, new communes get ids in order of first appearance
+        get_id = self.histogram.commune_ids.get
+        ids = [get_id(commune) for commune in self._communes]
+        if None in ids:
+            ids = [self.histogram.commune_id(commune) for commune in self._communes]
+        self._batches.append((np.array(ids, dtype=np.intp), get_time_bins(self._timestamps),
+                              np.array(self._values, dtype=np.float64)))
+        del self._communes[:], self._timestamps[:], self._values[:]
+
+    def result(self):
+        """
+        :return: dict with TimeHistogram, it is empty if no trip has a valid time
+        """
+        self._flush()
+        communes, bins, values = [np.concatenate(arrays) for arrays in zip(*self._batches)]
+        # trips are added in a single batch so the result does not depend on batch size
+        self.histogram.add(communes, bins, values)
+        return {None: self.histogram} if len(self.histogram) else {}
+
+
+class TimeAggregator:
+    """
+    Class to describe an aggregation of expanded trips by origin commune and time of day when trips start, in bins of
+    15 minutes.
+    """
+    zone_columns = None
+    group_column = None
+
+    def __init__(self, output_name, time_column):
+        self.output_name = output_name
+        self.time_column = time_column
+        self.header = ['Fecha', 'Comuna_origen', 'Cuarto_hora', TRIPS_HEADER]
+        self.column_types = {header: DICTIONARY for header in self.header}
+        self.column_types.update({'Fecha': 'date32', TRIPS_HEADER: 'float64'})
+
+    @property
+    def columns(self):
+        return self.time_column,
+
+    def accumulator(self, columns):
+        return TimeAccumulator(columns.index(self.time_column))
+
+    def rows(self, date, result):
+        """
+        Yield output rows of a day ordered by commune id and time.
+        """
+        for histogram in result.values():
+            for commune, time_bin, trips in histogram.rows():
+                yield [date, commune, time_bin, trips]
+
+
+class SampledResult:
+    """
+    Class with estimated expanded trips of a sample and sums of their squares, both are ODMatrix or TimeHistogram
+    with the same cells.
+    """
+
+    def __init__(self, estimates, squares):
+        self.estimates = estimates
+        self.squares = squares
+
+    def __len__(self):
+        return len(self.estimates)
+
+    def merge(self, other):
+        self.estimates += other.estimates
+        self.squares += other.squares
+        return self
+
+    __iadd__ = merge
+
+
+class SampledAccumulator:
+    """
+    Class to accumulate expanded trips of sampled trips scaled by 1 / sample rate, and their squares to estimate
+    standard error.
+    """
+
+    def __init__(self, accumulator, squares_accumulator, sample_rate):
+        self.accumulator = accumulator
+        self.squares_accumulator = squares_accumulator
+        self.sample_rate = sample_rate
+
+    def add(self, row, start_commune, end_commune, trips):
+        trips /= self.sample_rate
+        self.accumulator.add(row, start_commune, end_commune, trips)
+        self.squares_accumulator.add(row, start_commune, end_commune, trips * trips)
+
+    def result(self):
+        squares = self.squares_accumulator.result()
+        return {group: SampledResult(estimates, squares[group]) for group, estimates in
+                self.accumulator.result().items()}
+
+
+class SampledAggregator:
+    """
+    Class to describe an aggregation over a sample of trips, each trip is kept with probability sample rate. Output has
+    estimated expanded trips (Horvitz-Thompson estimator) and their standard error, sampled trips are assumed to be
+    independent.
+    """
+
+    def __init__(self, aggregator, sample_rate):
+        self.aggregator = aggregator
+        self.sample_rate = sample_rate
+        self.output_name = '{0}Estimado'.format(aggregator.output_name)
+        self.zone_columns = aggregator.zone_columns
+        self.group_column = aggregator.group_column
+        self.header = aggregator.header + [STANDARD_ERROR_HEADER]
+        self.column_types = dict(aggregator.column_types, **{STANDARD_ERROR_HEADER: 'float64'})
+
+    @property
+    def columns(self):
+        return self.aggregator.columns
+
+    def accumulator(self, columns):
+        return SampledAccumulator(self.aggregator.accumulator(columns), self.aggregator.accumulator(columns),
+                                  self.sample_rate)
+
+    def rows(self, date, result):
+        """
+        Yield rows of aggregator with standard error of each estimate.
+        """
+        estimates = self.aggregator.rows(date, {group: r.estimates for group, r in result.items()})
+        squares = self.aggregator.rows(date, {group: r.squares for group, r in result.items()})
+        for row, squares_row in zip(estimates, squares):
+            yield row + [math.sqrt((1 - self.sample_rate) * squares_row[-1])]
+
+
+AGGREGATORS = {
+    'commune': ODAggregator('viajesEntreComunas', 'Comuna_origen', 'Comuna_destino'),
+    # trips are assigned to period and day type when they start
+    'period': ODAggregator('viajesEntreComunasPorPeriodo', 'Comuna_origen', 'Comuna_destino',
+                           group_header='Periodo', group_column=18),
+    'day_type': ODAggregator('viajesEntreComunasPorTipoDia', 'Comuna_origen', 'Comuna_destino',
+                             group_header='Tipo_dia', group_column=20),
+    'zone': ODAggregator('viajesEntreZonas', 'Zona_origen', 'Zona_destino', zone_columns=(14, 15)),
+    'time_of_day': TimeAggregator('viajesPorComunaPorCuartoHora', 16),
+}
+AGGREGATIONS = ['commune', 'period', 'day_type', 'zone', 'time_of_day']
+
+
+def get_aggregators(names):
+    return [AGGREGATORS[name] for name in names]
+
+
+def get_sample_rate(aggregators):
+    """
+    :return: sample rate of sampled aggregators or None if aggregators are not sampled
+    """
+    sample_rates = {getattr(aggregator, 'sample_rate', None) for aggregator in aggregators}
+    if len(sample_rates) > 1:
+        raise ValueError('aggregators must have the same sample rate')
+    return sample_rates.pop() if sample_rates else None
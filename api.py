@@ -0,0 +1,93 @@
+import logging
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+
+from aggregators import SampledAggregator, get_aggregators
+from process_general_data import get_daily_transactions
+from process_viajes_data import process_files
+from utils import filter_files_by_date, get_file_date, get_input_files
+from writers import open_table_writer
+
+logger = logging.getLogger(__name__)
+
+
+def _get_bounds(date_range):
+    return (None, None) if date_range is None else date_range
+
+
+def _get_aggregators(aggregations, sample_rate):
+    aggregators = get_aggregators(aggregations)
+    if sample_rate is None:
+        return aggregators
+    return [SampledAggregator(aggregator, sample_rate) for aggregator in aggregators]
+
+
+def aggregate_trips_by_day(paths, date_range=None, aggregations=('commune',), workers=1, parser='fast', cache=None,
+                           prefetch=0, split_size=0, sample_rate=None):
+    """
+    Read each .viajes file once and aggregate its trips with each aggregation.
+    :param paths: directory or file path, or list of them
+    :param date_range: (lower bound, upper bound) as dates, datetimes or YYYY-MM-DD strings, both are included
+    :param cache: DayCache with results of processed files
+    :param split_size: plain files bigger than this bytes are split in byte ranges processed by different workers
+    :param sample_rate: fraction of trips read, results are SampledResult with estimates and sums of their squares
+    :return: iterator over (date, dict with result of each aggregation or None if file is empty, names without
+    commune). Results are dicts of ODMatrix by group, or of TimeHistogram for time_of_day aggregation.
+    """
+    files_path = filter_files_by_date(get_input_files('viajes', paths), *_get_bounds(date_range))
+    for file_path, (results, errors) in process_files(files_path, _get_aggregators(aggregations, sample_rate),
+                                                      workers, parser, cache, prefetch, split_size=split_size):
+        yield get_file_date(file_path), dict(zip(aggregations, results)) if results else None, errors
+
+
+def aggregate_trips(paths, date_range=None, aggregation='commune', **options):
+    """
+    :param options: options of aggregate_trips_by_day
+    :return: iterator over rows of aggregation, they are the same rows of process_viajes_data output,
+    e.g. ['2020-03-01', 'Santiago', 'Recoleta', 1.5], rows have standard error of estimate when sample_rate is given
+    """
+    aggregator = _get_aggregators([aggregation], options.get('sample_rate'))[0]
+    errors = set()
+    # files are sorted by date, rows of each day (and of files with the same date) are sorted in memory
+    for date, day_results in groupby(aggregate_trips_by_day(paths, date_range, (aggregation,), **options),
+                                     key=itemgetter(0)):
+        rows = []
+        for _, results, new_errors in day_results:
+            errors.update(new_errors)
+            if results:
+                rows.extend(aggregator.rows(date, results[aggregation]))
+        rows.sort()
+        for row in rows:
+            yield row
+    for e in errors:
+        logger.warning("{0} has no commune.".format(e))
+
+
+def daily_transactions(paths, date_range=None, index_path=None):
+    """
+    :param index_path: SQLite file with date and transactions of each file, only new or changed files are read
+    :return: list of [date, transactions] ordered by date
+    """
+    files_path = get_input_files('general', paths)
+    return get_daily_transactions(files_path, *_get_bounds(date_range), index_path=index_path)
+
+
+def to_columns(rows, header):
+    """
+    :return: dict with a NumPy array per column, e.g. to create a pandas DataFrame
+    """
+    columns = list(zip(*rows)) or [()] * len(header)
+    return {name: np.array(values) for name, values in zip(header, columns)}
+
+
+def write_rows(rows, output, output_filename, header, column_types=None, **writer_options):
+    """
+    Write rows with header to output, writer_options are the options of process_viajes_data and process_general_data
+    outputs (output_format, compression, compression_level, ...).
+    """
+    with open_table_writer(output, output_filename, header, column_types=column_types, **writer_options) as w:
+        for row in rows:
+            w.writerow(row)
+
@@ -0,0 +1,83 @@
+import fnmatch
+import os
+import zipfile
+
+from s3_files import get_s3_file_stat, is_s3_path
+
+ARCHIVE_EXTENSION = '.zip'
+
+
+def split_archive_path(path):
+    """
+    Paths of files inside zip archives are the archive path followed by the member name,
+    e.g. 2020-03.zip/2020-03-01.viajes
+    :return: (archive path, member name) if path is a member of a zip archive, otherwise None
+    """
+    if is_s3_path(path) or os.path.exists(path):
+        return None
+    separator = ARCHIVE_EXTENSION + os.sep
+    index = path.find(separator)
+    while index != -1:
+        archive = path[:index + len(ARCHIVE_EXTENSION)]
+        if os.path.isfile(archive):
+            return archive, path[index + len(separator):].replace(os.sep, '/')
+        index = path.find(separator, index + 1)
+    return None
+
+
+def get_archive_info(path):
+    """
+    :return: ZipInfo of archive member or None if path is not a member of a zip archive
+    """
+    archive_member = split_archive_path(path)
+    if archive_member is None:
+        return None
+    archive, member = archive_member
+    with zipfile.ZipFile(archive) as zip_file:
+        return zip_file.getinfo(member)
+
+
+def get_archive_members(archive, patterns):
+    """
+    :return: paths of archive members whose name matches any pattern, None if archive can not be read
+    """
+    try:
+        with zipfile.ZipFile(archive) as zip_file:
+            names = [info.filename for info in zip_file.infolist() if not info.is_dir()]
+    except (zipfile.BadZipFile, OSError):
+        return None
+    return [os.path.join(archive, *name.split('/')) for name in names
+            if any(fnmatch.fnmatch(os.path.basename(name), pattern) for pattern in patterns)]
+
+
+def get_file_stat(path):
+    """
+    :return: (size, modification time in nanoseconds) of file, archive members have their uncompressed size and
+    modification time of archive
+    """
+    if is_s3_path(path):
+        return get_s3_file_stat(path)
+    info = get_archive_info(path)
+    if info is None:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    archive, _ = split_archive_path(path)
+    return info.file_size, os.stat(archive).st_mtime_ns
+
+
+def get_file_size(path):
+    """
+    :return: bytes read from disk (or S3) to get file, compressed size for archive members
+    """
+    if is_s3_path(path):
+        size, _ = get_s3_file_stat(path)
+        return size
+    info = get_archive_info(path)
+    return os.path.getsize(path) if info is None else info.compress_size
+
+
+def get_real_path(path):
+    """
+    :return: canonical path of file, S3 paths are already canonical
+    """
+    return path if is_s3_path(path) else os.path.realpath(path)
@@ -1,24 +1,147 @@
+import hashlib
+import io
+import os
+import threading
 import urllib
 
 import boto3
 import botocore.exceptions
+from boto3.s3.transfer import TransferConfig
 from decouple import config
 
+MB = 1024 ** 2
+DEFAULT_PART_SIZE = 8 * MB
+DEFAULT_MAX_CONCURRENCY = 10
+# bytes of each ranged GET used to read objects
+DEFAULT_RANGE_SIZE = 16 * MB
+
+
+def get_transfer_config(part_size=DEFAULT_PART_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    return TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                          max_concurrency=max_concurrency)
+
+
+def compute_etag(file_path, transfer_config):
+    """
+    Compute the ETag that S3 assigns to file when it is uploaded with transfer_config.
+    Single part uploads have file md5 as ETag, multipart uploads have md5 of parts md5 and number of parts.
+    """
+    part_size = transfer_config.multipart_chunksize
+    file_md5 = hashlib.md5()
+    part_digests = []
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(part_size), b''):
+            file_md5.update(chunk)
+            part_digests.append(hashlib.md5(chunk).digest())
+    if os.path.getsize(file_path) < transfer_config.multipart_threshold:
+        return file_md5.hexdigest()
+    return '{0}-{1}'.format(hashlib.md5(b''.join(part_digests)).hexdigest(), len(part_digests))
+
+
+class UploadProgress:
+    """
+    Upload callback that prints progress each time a new tenth of file is uploaded
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.size = os.path.getsize(file_path)
+        self.uploaded = 0
+        self.reported = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        with self.lock:
+            self.uploaded += bytes_amount
+            percentage = 100 * self.uploaded // self.size if self.size else 100
+            if percentage // 10 > self.reported // 10:
+                self.reported = percentage
+                print('{0}: {1}% uploaded'.format(os.path.basename(self.file_path), percentage))
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Seekable raw reader of an S3 object, data is got with ranged GET requests of range size bytes and only the last
+    range is kept in memory.
+    """
+
+    def __init__(self, client, file_key, bucket_name, size, range_size=DEFAULT_RANGE_SIZE):
+        self.client = client
+        self.file_key = file_key
+        self.bucket_name = bucket_name
+        self.size = size
+        self.range_size = range_size
+        self.position = 0
+        self.range_start = 0
+        self.range_data = memoryview(b'')
+        self.requests = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError('invalid whence ({0})'.format(whence))
+        if position < 0:
+            raise ValueError('negative seek position {0}'.format(position))
+        self.position = position
+        return position
+
+    def _get_range(self):
+        end = min(self.position + self.range_size, self.size) - 1
+        response = self.client.get_object(Bucket=self.bucket_name, Key=self.file_key,
+                                          Range='bytes={0}-{1}'.format(self.position, end))
+        self.range_data = memoryview(response['Body'].read())
+        self.range_start = self.position
+        self.requests += 1
+
+    def readinto(self, b):
+        if self.position >= self.size:
+            return 0
+        offset = self.position - self.range_start
+        if not 0 <= offset < len(self.range_data):
+            self._get_range()
+            offset = 0
+        n = min(len(b), len(self.range_data) - offset)
+        b[:n] = self.range_data[offset:offset + n]
+        self.position += n
+        return n
+
 
 class AWSSession:
     """
     Class to interact wit Amazon Web Service (AWS) API through boto3 library
     """
 
-    def __init__(self):
+    def __init__(self, transfer_config=None):
         self.session = boto3.Session(
             aws_access_key_id=config('AWS_ACCESS_KEY_ID'),
             aws_secret_access_key=config('AWS_SECRET_ACCESS_KEY'))
+        self.transfer_config = transfer_config or get_transfer_config()
+        self._s3 = None
+
+    @property
+    def s3(self):
+        # resource is created once and reused by every request
+        if self._s3 is None:
+            self._s3 = self.session.resource('s3')
+        return self._s3
 
     def check_bucket_exists(self, bucket_name):
-        s3 = self.session.resource('s3')
         try:
-            s3.meta.client.head_bucket(Bucket=bucket_name)
+            self.s3.meta.client.head_bucket(Bucket=bucket_name)
             return True
         except botocore.exceptions.ClientError as e:
             # If a client error is thrown, then check that it was a 404 error.
@@ -32,9 +155,52 @@ class AWSSession:
     def _build_url(self, key, bucket_name):
         return ''.join(['https://s3.amazonaws.com/', bucket_name, '/', urllib.parse.quote(key)])
 
-    def send_file_to_bucket(self, file_path, file_key, bucket_name):
-        s3 = self.session.resource('s3')
-        bucket = s3.Bucket(bucket_name)
-        bucket.upload_file(file_path, file_key)
+    def get_etag(self, file_key, bucket_name):
+        """
+        :return: ETag of object or None if object does not exist
+        """
+        try:
+            response = self.s3.meta.client.head_object(Bucket=bucket_name, Key=file_key)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+        return response['ETag'].strip('"')
+
+    def get_object_stat(self, file_key, bucket_name):
+        """
+        :return: (size, last modified datetime) of object
+        """
+        response = self.s3.meta.client.head_object(Bucket=bucket_name, Key=file_key)
+        return response['ContentLength'], response['LastModified']
+
+    def list_objects(self, bucket_name, prefix=''):
+        """
+        :return: iterator over (key, size, last modified datetime) of objects whose key starts with prefix
+        """
+        paginator = self.s3.meta.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key'], obj['Size'], obj['LastModified']
+
+    def open_object(self, file_key, bucket_name, size=None, range_size=DEFAULT_RANGE_SIZE):
+        """
+        :param size: object size, it is requested when it is not given
+        :return: seekable raw reader of object that streams it with ranged GET requests
+        """
+        if size is None:
+            size, _ = self.get_object_stat(file_key, bucket_name)
+        return S3RangeReader(self.s3.meta.client, file_key, bucket_name, size, range_size)
+
+    def is_unchanged(self, file_path, file_key, bucket_name):
+        """
+        :return: True if object in bucket has the same content of file
+        """
+        etag = self.get_etag(file_key, bucket_name)
+        return etag is not None and etag == compute_etag(file_path, self.transfer_config)
+
+    def send_file_to_bucket(self, file_path, file_key, bucket_name, callback=None):
+        bucket = self.s3.Bucket(bucket_name)
+        bucket.upload_file(file_path, file_key, Config=self.transfer_config, Callback=callback)
 
         return self._build_url(file_key, bucket_name)
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import pickle
+
+from archives import get_archive_info, get_file_stat, get_real_path
+from s3_files import get_s3_file_etag, is_s3_path
+
+# change it when cached results format changes
+CACHE_FORMAT_VERSION = 2
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def get_file_hash(file_path):
+    file_hash = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_BUFFER_SIZE), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_file_identity(file_path, use_hash=False):
+    if use_hash:
+        if is_s3_path(file_path):
+            return [get_s3_file_etag(file_path)]
+        info = get_archive_info(file_path)
+        # archive members are identified by checksum of their content saved in archive
+        return [get_file_hash(file_path) if info is None else '{0}:{1}'.format(info.CRC, info.file_size)]
+    return [get_real_path(file_path)] + list(get_file_stat(file_path))
+
+
+class DayCache:
+    """
+    Class to keep processed results of each input file on local disk. Entries are keyed by input file identity and
+    a version, so a changed file or a new version (e.g. a new commune mapping) is processed again.
+    """
+
+    def __init__(self, cache_path, version='', use_hash=False):
+        self.cache_path = cache_path
+        self.version = version
+        self.use_hash = use_hash
+        os.makedirs(cache_path, exist_ok=True)
+
+    def get_key(self, file_path):
+        identity = get_file_identity(file_path, self.use_hash) + [self.version, CACHE_FORMAT_VERSION]
+        return hashlib.sha1(json.dumps(identity).encode('utf-8')).hexdigest()
+
+    def _get_entry_path(self, file_path):
+        return os.path.join(self.cache_path, '{0}.pickle'.format(self.get_key(file_path)))
+
+    def __contains__(self, file_path):
+        return os.path.exists(self._get_entry_path(file_path))
+
+    def get(self, file_path):
+        """
+        :return: cached result for file or None if it is not cached
+        """
+        try:
+            with open(self._get_entry_path(file_path), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def set(self, file_path, result):
+        entry_path = self._get_entry_path(file_path)
+        tmp_path = '{0}.tmp'.format(entry_path)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
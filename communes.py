@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+
+DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+EXTRA_LOCATION_COMMUNES_PATH = os.path.join(DIR_PATH, 'inputs', 'extra_location_communes.json')
+
+# trip files are read as bytes with this encoding
+ENCODING = 'latin-1'
+
+# commune names written without special characters in trip files
+COMMUNE_NAME_FIXES = {
+    'Nunoa': 'Ñuñoa',
+}
+
+
+class CommuneResolver:
+    """
+    Class to translate commune and location names found in trip files to commune names.
+    Each distinct name is normalized only once, names without commune are cached too.
+    Names can be given as str or as bytes read from trip files.
+    """
+
+    def __init__(self, extra_location_communes, commune_name_fixes=None):
+        self.extra_location_communes = extra_location_communes
+        self.commune_name_fixes = COMMUNE_NAME_FIXES if commune_name_fixes is None else commune_name_fixes
+        self._communes = {'-': None, b'-': None}
+        self._locations = {}
+        self._location_names = {}
+        # names normalized and seconds spent normalizing them
+        self.misses = 0
+        self.seconds = 0.0
+
+    @property
+    def version(self):
+        """
+        :return: hash of commune mapping, it changes when mapping changes
+        """
+        mapping = [self.extra_location_communes, self.commune_name_fixes]
+        return hashlib.sha1(json.dumps(mapping, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def from_file(cls, file_path=EXTRA_LOCATION_COMMUNES_PATH):
+        with open(file_path) as communes_json:
+            return cls(json.load(communes_json))
+
+    def commune(self, name):
+        """
+        :return: commune name for commune field or None if field is empty
+        """
+        try:
+            return self._communes[name]
+        except KeyError:
+            start = time.perf_counter()
+            commune = _decode(name).title().rstrip()
+            commune = self.commune_name_fixes.get(commune, commune) or None
+            self._communes[name] = commune
+            self._add_miss(start)
+            return commune
+
+    def location(self, name):
+        """
+        :return: commune name for location field or None if location has no commune
+        """
+        try:
+            return self._locations[name]
+        except KeyError:
+            commune = self.extra_location_communes.get(self.location_name(name), None)
+            self._locations[name] = commune
+            return commune
+
+    def location_name(self, name):
+        try:
+            return self._location_names[name]
+        except KeyError:
+            start = time.perf_counter()
+            location_name = _decode(name).title().rstrip()
+            self._location_names[name] = location_name
+            self._add_miss(start)
+            return location_name
+
+    def _add_miss(self, start):
+        self.misses += 1
+        self.seconds += time.perf_counter() - start
+
+
+def _decode(name):
+    return name.decode(ENCODING) if isinstance(name, bytes) else name
+
+
+@lru_cache(maxsize=None)
+def get_commune_resolver():
+    return CommuneResolver.from_file()
@@ -0,0 +1,268 @@
+import logging
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from aggregators import EMPTY_FIELDS, TimeAggregator
+from archives import get_file_size, get_file_stat
+from communes import ENCODING, get_commune_resolver
+from metrics import METRICS
+from od_matrix import ODMatrix
+from time_histogram import TimeHistogram, get_time_bins
+from utils import COMPACT_EXTENSION, get_binary_file_object, get_columns
+
+logger = logging.getLogger(__name__)
+
+# columns of trip files saved in compact files, columns of a group share a dictionary: stops, communes, zones,
+# boarding and alighting times, period and day type
+COMPACT_DICTIONARIES = ((10, 11), (12, 13), (14, 15), (16, 17), (18,), (20,))
+# expansion factor is saved as float64
+FACTOR_COLUMN = 23
+# change it when compact files format changes
+COMPACT_FORMAT_VERSION = 1
+
+
+def is_compact_file(file_path):
+    return file_path.endswith('.{0}'.format(COMPACT_EXTENSION))
+
+
+def get_compact_path(file_path, output_path):
+    """
+    :return: path of compact file of file, named after its whole file name so files of the same day (e.g. the plain
+    and the compressed one) are saved in different compact files
+    """
+    return os.path.join(output_path, '{0}.{1}'.format(os.path.basename(file_path), COMPACT_EXTENSION))
+
+
+def _get_dictionary_column(column):
+    for group in COMPACT_DICTIONARIES:
+        if column in group:
+            return group[0]
+    raise ValueError('column {0} is not saved in compact files'.format(column))
+
+
+def _encode_rows(rows, columns):
+    """
+    :return: list with dictionary of each group and codes of each column, and expansion factors
+    """
+    dictionaries = {column: {} for column in columns if _get_dictionary_column(column) == column}
+    column_dictionaries = [dictionaries[_get_dictionary_column(column)] for column in columns]
+    codes = [array('i') for _ in columns]
+    factors = array('d')
+    for row in rows:
+        for value, dictionary, column_codes in zip(row, column_dictionaries, codes):
+            column_codes.append(dictionary.setdefault(value, len(dictionary)))
+        factors.append(float(row[-1]))
+    return dictionaries, codes, factors
+
+
+def compact_viajes_file(file_path, output_path):
+    """
+    Save columns used by aggregations of a trip file in a npz file. Each column is saved as codes of a dictionary
+    shared by its group and expansion factor as float64.
+    :return: path of compact file
+    """
+    columns = [column for group in COMPACT_DICTIONARIES for column in group]
+    compact_path = get_compact_path(file_path, output_path)
+    arrays = {'version': np.array(COMPACT_FORMAT_VERSION), 'empty': np.array(False)}
+    with METRICS.stage('compact', file_path, bytes_in=get_file_size(file_path)) as record:
+        f = None
+        try:
+            f = get_binary_file_object(file_path)
+            next(f)  # skip header
+            next(f)
+        except (IndexError, StopIteration):
+            if f is not None:
+                f.close()
+            logging.warning("{0} is empty.".format(os.path.basename(file_path)))
+            arrays['empty'] = np.array(True)
+        else:
+            with f:
+                dictionaries, codes, factors = _encode_rows(get_columns(f, columns + [FACTOR_COLUMN]), columns)
+            for column, dictionary in dictionaries.items():
+                arrays['dictionary_{0}'.format(column)] = np.array(list(dictionary), dtype=bytes)
+            for column, column_codes in zip(columns, codes):
+                size = len(dictionaries[_get_dictionary_column(column)])
+                dtype = np.uint16 if size <= np.iinfo(np.uint16).max + 1 else np.int32
+                arrays['column_{0}'.format(column)] = np.frombuffer(column_codes, dtype=np.int32).astype(dtype)
+            arrays['column_{0}'.format(FACTOR_COLUMN)] = np.frombuffer(factors, dtype=np.float64)
+            record['rows'] = len(factors)
+        tmp_path = '{0}.tmp'.format(compact_path)
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, compact_path)
+        record['bytes_out'] = os.path.getsize(compact_path)
+    return compact_path
+
+
+def compact_viajes_file_with_metrics(file_path, output_path):
+    first_record = len(METRICS.records)
+    compact_path = compact_viajes_file(file_path, output_path)
+    return compact_path, METRICS.pop(first_record)
+
+
+def is_compact_updated(file_path, output_path):
+    """
+    :return: True if compact file of file exists and it was saved after last change of file
+    """
+    try:
+        compact_mtime_ns = os.stat(get_compact_path(file_path, output_path)).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    _, mtime_ns = get_file_stat(file_path)
+    return compact_mtime_ns >= mtime_ns
+
+
+def compact_viajes_files(files_path, output_path, workers=1):
+    """
+    Save a compact file for each file, files whose compact file is updated are skipped.
+    :return: paths of compact files
+    """
+    os.makedirs(output_path, exist_ok=True)
+    pending = [file_path for file_path in files_path if not is_compact_updated(file_path, output_path)]
+    logger.info('{0} files to compact, {1} files already compacted'.format(len(pending),
+                                                                         len(files_path) - len(pending)))
+    if workers > 1 and pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for _, records in executor.map(compact_viajes_file_with_metrics, pending,
+                                           [output_path] * len(pending)):
+                METRICS.extend(records)
+    else:
+        for file_path in pending:
+            compact_viajes_file(file_path, output_path)
+    return [get_compact_path(file_path, output_path) for file_path in files_path]
+
+
+def _get_names(values):
+    return [value.decode(ENCODING).strip() for value in values]
+
+
+class CompactData:
+    """
+    Class to read columns of a compact file, arrays are loaded once and only when they are used.
+    """
+
+    def __init__(self, npz_file):
+        self.npz_file = npz_file
+        self._arrays = {}
+
+    def _get(self, key, convert):
+        try:
+            return self._arrays[key]
+        except KeyError:
+            array = self._arrays[key] = convert(self.npz_file[key])
+            return array
+
+    def dictionary(self, column):
+        return self._get('dictionary_{0}'.format(_get_dictionary_column(column)), np.ndarray.tolist)
+
+    def codes(self, column):
+        return self._get('column_{0}'.format(column), lambda codes: codes.astype(np.intp))
+
+    @property
+    def factors(self):
+        return self._get('column_{0}'.format(FACTOR_COLUMN), np.asarray)
+
+
+def _resolve_communes(data, resolver, errors):
+    """
+    :return: commune names and position in names of start and end commune of each trip, -1 if it has no commune
+    """
+    names = []
+    ids = {}
+
+    def get_positions(values, resolve):
+        positions = np.full(len(values), -1, dtype=np.intp)
+        for i, value in enumerate(values):
+            name = resolve(value)
+            if name:
+                if name not in ids:
+                    ids[name] = len(names)
+                    names.append(name)
+                positions[i] = ids[name]
+        return positions
+
+    stops = data.dictionary(10)
+    commune_positions = get_positions(data.dictionary(12), resolver.commune)
+    location_positions = get_positions(stops, resolver.location)
+    trip_communes = []
+    # communes are taken from stops when commune field is empty
+    for commune_column, stop_column in ((12, 10), (13, 11)):
+        stop_codes = data.codes(stop_column)
+        positions = commune_positions[data.codes(commune_column)]
+        missing = positions < 0
+        positions[missing] = location_positions[stop_codes[missing]]
+        for code in np.unique(stop_codes[positions < 0]).tolist():
+            errors.add(resolver.location_name(stops[code]))
+        trip_communes.append(positions)
+    return names, trip_communes[0], trip_communes[1]
+
+
+def _aggregate_times(aggregator, data, names, origins):
+    """
+    :return: dict with TimeHistogram, timestamps are parsed once for each distinct value
+    """
+    valid = origins >= 0
+    bins = get_time_bins(data.dictionary(aggregator.time_column))[data.codes(aggregator.time_column)]
+    histogram = TimeHistogram()
+    histogram.add_codes(names, origins[valid], bins[valid], data.factors[valid])
+    return {None: histogram} if len(histogram) else {}
+
+
+def _aggregate(aggregator, data, names, origins, destinations):
+    """
+    :return: dict with ODMatrix of each group, the same result of adding trips one by one with aggregator
+    """
+    if isinstance(aggregator, TimeAggregator):
+        return _aggregate_times(aggregator, data, names, origins)
+    if aggregator.zone_columns:
+        origin_column, destination_column = aggregator.zone_columns
+        values = data.dictionary(origin_column)
+        names = _get_names(values)
+        empty = np.array([value in EMPTY_FIELDS for value in values], dtype=bool)
+        origins, destinations = data.codes(origin_column), data.codes(destination_column)
+        valid = ~(empty[origins] | empty[destinations])
+    else:
+        valid = (origins >= 0) & (destinations >= 0)
+    if aggregator.group_column is None:
+        groups = [(None, valid)]
+    else:
+        # values with the same name after stripping them are the same group
+        value_names = _get_names(data.dictionary(aggregator.group_column))
+        group_names = list(dict.fromkeys(value_names))
+        group_positions = np.array([group_names.index(name) for name in value_names], dtype=np.intp)
+        trip_groups = group_positions[data.codes(aggregator.group_column)]
+        groups = [(group, valid & (trip_groups == position)) for position, group in enumerate(group_names)]
+    result = {}
+    factors = data.factors
+    for group, mask in groups:
+        if mask.any():
+            od_matrix = result[group] = ODMatrix()
+            od_matrix.add_codes(names, origins[mask], destinations[mask], factors[mask])
+    return result
+
+
+def aggregate_compact_data(file_path, aggregators, resolver=None):
+    """
+    Aggregate trips of a compact file with vectorized operations over its columns.
+    :return: list with result of each aggregator or None if file is empty, and names without commune
+    """
+    resolver = resolver or get_commune_resolver()
+    errors = set()
+    for aggregator in aggregators:
+        for column in aggregator.columns:
+            _get_dictionary_column(column)
+    with METRICS.stage('aggregate_compact', file_path, bytes_in=get_file_size(file_path)) as record, \
+            np.load(file_path) as npz_file:
+        if npz_file['version'] != COMPACT_FORMAT_VERSION:
+            raise ValueError('{0} was saved with another version, compact it again'.format(file_path))
+        if npz_file['empty']:
+            logging.warning("{0} is empty.".format(os.path.basename(file_path)))
+            return None, errors
+        data = CompactData(npz_file)
+        record['rows'] = len(data.factors)
+        names, origins, destinations = _resolve_communes(data, resolver, errors)
+        results = [_aggregate(aggregator, data, names, origins, destinations) for aggregator in aggregators]
+    return results, errors
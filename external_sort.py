@@ -0,0 +1,111 @@
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+from itertools import chain
+
+# rows saved in each pickle record of a run
+CHUNK_SIZE = 4096
+# max runs read at the same time while rows are merged
+MERGE_FAN_IN = 64
+
+
+def write_run(rows, file_path):
+    """
+    Save rows in a run file in chunks, so they can be read back without loading the whole run.
+    """
+    with open(file_path, 'wb') as f:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == CHUNK_SIZE:
+                pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+                chunk = []
+        if chunk:
+            pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+
+
+def read_run(file_path):
+    """
+    Yield rows of a run file, file is opened when first row is requested.
+    """
+    with open(file_path, 'rb') as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            for row in chunk:
+                yield row
+
+
+class ExternalSorter:
+    """
+    Class to sort rows that do not fit in memory. Rows are added in batches (e.g. rows of a day), each batch is sorted
+    in memory and spilled to a run file, then runs are merged with a heap reading one chunk of each run at a time.
+    Runs that start after the last row of a previous run are read one after the other, so batches added in order are
+    not merged.
+    """
+
+    def __init__(self, tmp_dir=None, fan_in=MERGE_FAN_IN):
+        """
+        :param tmp_dir: directory where the temporary directory with runs is created, system default if it is None
+        """
+        self.directory = tempfile.mkdtemp(prefix='runs-', dir=tmp_dir)
+        self.fan_in = fan_in
+        self.runs = 0
+        # lists of runs whose rows are in order and the last row of each list
+        self.sequences = []
+        self._last_rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _new_run_path(self):
+        self.runs += 1
+        return os.path.join(self.directory, 'run-{0}.pickle'.format(self.runs))
+
+    def add(self, rows):
+        """
+        Sort rows in memory and save them in a new run.
+        """
+        rows = sorted(rows)
+        if not rows:
+            return
+        run_path = self._new_run_path()
+        write_run(rows, run_path)
+        # run is appended to the sequence with the greatest last row that is not greater than its first row
+        candidates = [i for i, last_row in enumerate(self._last_rows) if last_row <= rows[0]]
+        if candidates:
+            i = max(candidates, key=self._last_rows.__getitem__)
+            self.sequences[i].append(run_path)
+            self._last_rows[i] = rows[-1]
+        else:
+            self.sequences.append([run_path])
+            self._last_rows.append(rows[-1])
+
+    def _merge_sequences(self, sequences):
+        return heapq.merge(*[chain.from_iterable(map(read_run, sequence)) for sequence in sequences])
+
+    def __iter__(self):
+        """
+        Yield every row added in order, sequences are merged in several passes when there are more than fan in.
+        """
+        while len(self.sequences) > self.fan_in:
+            sequences, last_rows = [], []
+            for start in range(0, len(self.sequences), self.fan_in):
+                run_path = self._new_run_path()
+                write_run(self._merge_sequences(self.sequences[start:start + self.fan_in]), run_path)
+                for run in chain.from_iterable(self.sequences[start:start + self.fan_in]):
+                    os.remove(run)
+                sequences.append([run_path])
+                last_rows.append(max(self._last_rows[start:start + self.fan_in]))
+            self.sequences, self._last_rows = sequences, last_rows
+        return self._merge_sequences(self.sequences)
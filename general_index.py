@@ -0,0 +1,72 @@
+import os
+import sqlite3
+
+from archives import get_file_stat, get_real_path
+
+
+class GeneralIndex:
+    """
+    Class to keep date and transactions of each .general file in a SQLite database, so files are read only once.
+    Files are identified by path, size and modification time, a changed file is read again.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, '
+                                    'mtime_ns INTEGER, date TEXT, transactions TEXT)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS files_date ON files (date)')
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, file_path):
+        """
+        :return: (size, mtime_ns, date, transactions) of file or None if it is not indexed
+        """
+        return self.connection.execute('SELECT size, mtime_ns, date, transactions FROM files WHERE path = ?',
+                                       (get_real_path(file_path),)).fetchone()
+
+    def set(self, file_path, size, mtime_ns, date, transactions):
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                                (get_real_path(file_path), size, mtime_ns, date, transactions))
+
+    def update(self, files, process, lower_bound=None, upper_bound=None):
+        """
+        Index new or changed files with process function, it returns [date, transactions] or None for empty files.
+        Indexed files with a date outside bounds are skipped without reading them.
+        """
+        with self.connection:
+            for file_path in files:
+                entry = self.get(file_path)
+                if entry is not None and entry[2] is not None and not is_between(entry[2], lower_bound, upper_bound):
+                    continue
+                size, mtime_ns = get_file_stat(file_path)
+                if entry is not None and entry[:2] == (size, mtime_ns):
+                    continue
+                date, transactions = process(file_path) or (None, None)
+                self.set(file_path, size, mtime_ns, date, transactions)
+
+    def get_rows(self, files, lower_bound=None, upper_bound=None):
+        """
+        :return: list of [date, transactions] of files between bounds ordered by date
+        """
+        with self.connection:
+            self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS current_files (path TEXT PRIMARY KEY)')
+            self.connection.execute('DELETE FROM current_files')
+            self.connection.executemany('INSERT OR IGNORE INTO current_files VALUES (?)',
+                                        [(get_real_path(file_path),) for file_path in files])
+            rows = self.connection.execute(
+                'SELECT date, transactions FROM files JOIN current_files USING (path) '
+                'WHERE date IS NOT NULL AND date >= ? AND date <= ? ORDER BY date, path',
+                (format_bound(lower_bound, ''), format_bound(upper_bound, '9999-99-99'))).fetchall()
+        return [list(row) for row in rows]
+
+
+def format_bound(bound, default):
+    return bound.strftime('%Y-%m-%d') if bound else default
+
+
+def is_between(date, lower_bound=None, upper_bound=None):
+    return format_bound(lower_bound, '') <= date <= format_bound(upper_bound, '9999-99-99')
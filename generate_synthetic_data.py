@@ -0,0 +1,224 @@
+# -*- coding: utf8 -*-
+import argparse
+import gzip
+import io
+import logging
+import os
+import sys
+import zipfile
+from datetime import timedelta
+
+import numpy as np
+
+from communes import get_commune_resolver
+from utils import valid_date
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VIAJES_HEADER = (
+    'id_viaje|correlativo_viajes|correlativo_etapas|cantidad_etapas|netapas_sin_bajada|'
+    'ultima_etapa_con_bajada|tiempo_viaje_seg|tiempo_viaje_min|dist_viaje_euclidiana_mts|'
+    'dist_viaje_en_ruta_mts|parada_subida|parada_bajada|comuna_subida|comuna_bajada|zona_subida|'
+    'zona_bajada|tiempo_subida|tiempo_bajada|periodo_subida|periodo_bajada|tipo_dia|media_hora|contrato|'
+    'factor_expansion|tiempo_medio_viaje|periodo_medio_viaje|media_hora_medio_viaje|tipo_dia_medio_viaje|'
+    'tiempo_1era_etapa|dist_1era_etapa|tespera_1era_etapa|ttrasbordo_1era_etapa|tcaminata_1era_etapa|'
+    'dtransbordo_1era_etapa|tiempo_2da_etapa|ddist_2da_etapa|tespera_2da_etapa|ttrasbordo_2da_etapa|'
+    'tcaminata_2da_etapa|dtransbordo_2da_etapa|tiempo_3era_etapa|dist_3era_etapa|tespera_3era_etapa|'
+    'ttrasbordo_3era_etapa|tcaminata_3era_etapa|dtransbordo_3era_etapa|tiempo_4ta_etapa|dist_4ta_etapa|'
+    'tespera_4ta_etapa|ttrasbordo_4ta_etapa|tcaminata_4ta_etapa|dtransbordo_4ta_etapa|op_1era_etapa|'
+    'op_2da_etapa|op_3era_etapa|op_4ta_etapa|tipo_op_1era_etapa|tipo_op_2da_etapa|tipo_op_3era_etapa|'
+    'tipo_op_4ta_etapa|serv_1era_etapa|serv_2da_etapa|serv_3era_etapa|serv_4ta_etapa|'
+    'linea_metro_subida_1|linea_metro_subida_2|linea_metro_subida_3|linea_metro_subida_4|'
+    'linea_metro_bajada_1|linea_metro_bajada_2|linea_metro_bajada_3|linea_metro_bajada_4|'
+    'parada_subida_1era|parada_subida_2da|parada_subida_3era|parada_subida_4ta|tiempo_subida_1era|'
+    'tiempo_subida_2da|tiempo_subida_3era|tiempo_subida_4ta|zona_subida_1era|zona_subida_2da|'
+    'zona_subida_3era|zona_subida_4ta|parada_bajada_1era|parada_bajada_2da|parada_bajada_3era|'
+    'parada_bajada_4ta|tiempo_bajada_1era|tiempo_bajada_2da|tiempo_bajada_3era|tiempo_bajada_4ta|'
+    'zona_bajada_1era|zona_bajada_2da|zona_bajada_3era|zona_bajada_4ta|tipo_transporte_1era|'
+    'tipo_transporte_2da|tipo_transporte_3era|tipo_transporte_4ta|tespera_est_1era|tespera_est_2da|'
+    'tespera_est_3era|tespera_est_4ta|escolar|tviaje_en_vehiculo_min|tipo_corte_etapa_viaje|proposito|'
+    'dviaje_buses'
+)
+GENERAL_HEADER = (
+    'Fecha|TipoDia|version|nExpediciones|minTimepoExpediciones|maxTiempoExpediciones|'
+    'mediaTiempoExpediciones|nPatentes|nGPS|mediaTiempoEntreGPS|nGPSConServicio|nGPSSinServicio|'
+    'nTrxTotales|nTrxTotalesBus(%)|nTrxTotalesMetro(%)|nTrxTotalesMetroTren(%)|nTrxTotalesZonasPagas(%)|'
+    'nTarjetas|nTrxsConServicio|nTrxsSinServicio|nEtapasConBajadaBus(%)|nEtapasConBajadaMetro(%)|'
+    'nEtapasConBajadaMetroTren(%)|nEtapasConBajadaZonasPagas(%)|nViajes|nViajes1E(%)|nViajes2E(%)|'
+    'nViajes3E(%)|nViajes4E(%)|nViajes5E(%)|nViajesSoloMetro(%)|nViajesConAlgunaEtapaEnMetro(%)|'
+    'nViajesSinBajadaFinal(%)|tViajeTotal|dViajeTotal|vViajeTotal|nViajeMediaPM|tViajeMediaPM|'
+    'dViajeMediaPM|vViajeMediaPM|nViajeMediaPT|tViajeMediaPT|dViajeMediaPT|vViajeMediaPT|nTrxPM(%)|'
+    'nTrxPT(%)|nBajadas|nBajadasPM|nBajadasPT|nParadasE|nParadasT|nParadasL|nParadasI|nTrxE(%)|nTrxT(%)|'
+    'nTrxL(%)|nTrxI(%)|par1|par2|par3|par4|par5|par6|par7|par8|par9|par10|trx1|trx2|trx3|trx4|trx5|trx6|'
+    'trx7|trx8|trx9|trx10|parBus1|parBus2|parBus3|parBus4|parBus5|parBus6|parBus7|parBus8|parBus9|'
+    'parBus10|trx1|trx2|trx3|trx4|trx5|trx6|trx7|trx8|trx9|trx10'
+)
+# communes as they are written in trip files
+COMMUNES = ['SANTIAGO', 'PROVIDENCIA', 'LAS CONDES', 'MAIPU', 'PUENTE ALTO', 'LA FLORIDA', 'NUNOA', 'SAN MIGUEL',
+            'ESTACION CENTRAL', 'RECOLETA', 'INDEPENDENCIA', 'QUILICURA', 'PUDAHUEL', 'CERRILLOS', 'LO PRADO',
+            'QUINTA NORMAL', 'RENCA', 'CONCHALI', 'HUECHURABA', 'VITACURA', 'LO BARNECHEA', 'LA REINA', 'PENALOLEN',
+            'MACUL', 'SAN JOAQUIN', 'LA GRANJA', 'LA PINTANA', 'SAN RAMON', 'LA CISTERNA', 'EL BOSQUE',
+            'LO ESPEJO', 'PEDRO AGUIRRE CERDA', 'SAN BERNARDO', 'CERRO NAVIA']
+PERIODS = [(0, '01 - PRE NOCTURNO'), (5, '02 - TRANSICION MANANA'), (7, '03 - PUNTA MANANA'),
+           (9, '04 - FUERA DE PUNTA MANANA'), (12, '05 - PUNTA MEDIODIA'), (14, '06 - FUERA DE PUNTA TARDE'),
+           (17, '07 - PUNTA TARDE'), (21, '08 - TRANSICION NOCTURNO'), (23, '09 - NOCTURNO')]
+DAY_TYPES = ['LABORAL'] * 5 + ['SABADO', 'DOMINGO']
+FORMATS = ['plain', 'gz', 'zip']
+# rows generated at once
+CHUNK_SIZE = 10000
+
+
+def get_commune_weights(n, zipf_exponent):
+    weights = 1.0 / np.arange(1, n + 1) ** zipf_exponent
+    return weights / weights.sum()
+
+
+def get_period(hour, day_type):
+    name = [period for start_hour, period in PERIODS if start_hour <= hour][-1]
+    return name if day_type == 'LABORAL' else '{0} {1}'.format(name, day_type)
+
+
+def generate_viajes_lines(date, rows, zipf_exponent=1.0, missing_share=0.05, seed=0):
+    """
+    Yield chunks of lines with the column layout of .viajes files.
+    Trips whose commune is '-' have a station of extra location communes or an unknown stop as location.
+    """
+    rng = np.random.default_rng(seed)
+    day_type = DAY_TYPES[date.weekday()]
+    date_str = date.strftime('%Y-%m-%d')
+    extra_locations = [location.upper() for location in sorted(get_commune_resolver().extra_location_communes)]
+    weights = get_commune_weights(len(COMMUNES), zipf_exponent)
+    filler = '|'.join(['-'] * (len(VIAJES_HEADER.split('|')) - 24))
+    periods = [get_period(hour, day_type) for hour in range(24)]
+    yield VIAJES_HEADER + '\n'
+    for start in range(0, rows, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, rows - start)
+        communes = rng.choice(len(COMMUNES), size=(size, 2), p=weights)
+        missing = rng.random((size, 2)) < missing_share
+        known_location = rng.random((size, 2)) < 0.8
+        extra_location = rng.integers(0, len(extra_locations), size=(size, 2))
+        start_seconds = rng.integers(0, 24 * 3600 - 2 * 3600, size=size)
+        duration = rng.integers(5 * 60, 2 * 3600, size=size)
+        factors = rng.gamma(2.0, 0.8, size=size)
+        start_times = np.datetime64(date_str) + start_seconds.astype('timedelta64[s]')
+        end_times = np.char.replace(np.datetime_as_string(start_times + duration.astype('timedelta64[s]')), 'T', ' ')
+        start_times = np.char.replace(np.datetime_as_string(start_times), 'T', ' ')
+        start_hours = start_seconds // 3600
+        end_hours = (start_seconds + duration) // 3600
+        # python lists are faster than numpy arrays to access items one by one
+        communes, missing, known_location, extra_location = communes.tolist(), missing.tolist(), \
+            known_location.tolist(), extra_location.tolist()
+        start_times, end_times, start_hours, end_hours = start_times.tolist(), end_times.tolist(), \
+            start_hours.tolist(), end_hours.tolist()
+        start_seconds, duration, factors = start_seconds.tolist(), duration.tolist(), factors.tolist()
+        lines = []
+        for i in range(size):
+            fields = []
+            for j in range(2):
+                if missing[i][j]:
+                    location = extra_locations[extra_location[i][j]] if known_location[i][j] else \
+                        'PARADA SIN COMUNA {0}'.format(extra_location[i][j])
+                    fields.extend([location, '-'])
+                else:
+                    commune = COMMUNES[communes[i][j]]
+                    fields.extend(['PARADA {0} {1}'.format(commune, extra_location[i][j]), commune])
+            lines.append('|'.join([
+                str(start + i + 1), '1', '1', '1', '1', '1', str(duration[i]), '{0:.2f}'.format(duration[i] / 60),
+                '-', '-', fields[0], fields[2], fields[1], fields[3], str(communes[i][0]), str(communes[i][1]),
+                start_times[i], end_times[i],
+                periods[start_hours[i]], periods[end_hours[i]], day_type,
+                '{0:02d}:{1:02d}:00'.format(start_hours[i], 30 * (start_seconds[i] % 3600 // 1800)), '-',
+                '{0:.4f}'.format(factors[i]), filler]))
+        yield '\n'.join(lines) + '\n'
+    logger.info('{0}: {1} trips generated'.format(date_str, rows))
+
+
+def generate_general_lines(date, transactions):
+    """
+    Yield lines with the column layout of .general files, only date and nTrxTotales columns have data.
+    """
+    columns = len(GENERAL_HEADER.split('|'))
+    row = [date.strftime('%Y-%m-%d'), DAY_TYPES[date.weekday()]] + ['0'] * (columns - 2)
+    row[12] = str(transactions)
+    yield GENERAL_HEADER + '\n'
+    yield '|'.join(row) + '\n'
+
+
+def write_files(lines, output, file_name, formats):
+    """
+    Write lines to one file per format, lines are encoded as latin-1 like real files.
+    :return: list of written files
+    """
+    file_objs = {}
+    paths = []
+    for file_format in formats:
+        if file_format == 'plain':
+            path = os.path.join(output, file_name)
+            file_objs[file_format] = open(path, 'wb')
+        elif file_format == 'gz':
+            path = os.path.join(output, '{0}.gz'.format(file_name))
+            file_objs[file_format] = gzip.open(path, 'wb', compresslevel=6)
+        else:
+            path = os.path.join(output, '{0}.zip'.format(file_name))
+            zip_file_obj = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+            file_objs[file_format] = io.BufferedWriter(zip_file_obj.open(file_name, 'w'))
+            file_objs['zip_file'] = zip_file_obj
+        paths.append(path)
+    try:
+        for chunk in lines:
+            data = chunk.encode('latin-1')
+            for file_format in formats:
+                file_objs[file_format].write(data)
+    finally:
+        for file_obj in file_objs.values():
+            file_obj.close()
+    return paths
+
+
+def generate_data(output, start_date, days, rows, formats=('plain',), zipf_exponent=1.0, missing_share=0.05,
+                  seed=0):
+    """
+    Generate one .viajes and one .general file per day and format.
+    :return: list of generated files
+    """
+    os.makedirs(output, exist_ok=True)
+    files = []
+    for day in range(days):
+        date = start_date + timedelta(days=day)
+        date_str = date.strftime('%Y-%m-%d')
+        lines = generate_viajes_lines(date, rows, zipf_exponent, missing_share, seed + day)
+        files.extend(write_files(lines, output, '{0}.viajes'.format(date_str), formats))
+        lines = generate_general_lines(date, rows)
+        files.extend(write_files(lines, output, '{0}.general'.format(date_str), formats))
+    return files
+
+
+def main(argv):
+    """
+    This script will create synthetic .viajes and .general files to measure performance.
+    """
+    parser = argparse.ArgumentParser(description='create synthetic .viajes and .general files.')
+
+    parser.add_argument('output', help='Path where files will be saved.')
+    parser.add_argument('--start-date', help='First date in YYYY-MM-DD format.', default=valid_date('2020-03-01'),
+                        type=valid_date)
+    parser.add_argument('--days', help='Number of days.', default=1, type=int)
+    parser.add_argument('--rows', help='Number of trips per day.', default=100000, type=int)
+    parser.add_argument('--formats', help='File formats.', nargs='+', default=['plain'], choices=FORMATS)
+    parser.add_argument('--zipf-exponent', help='Exponent of zipf distribution of communes, 0 for uniform.',
+                        default=1.0, type=float)
+    parser.add_argument('--missing-share', help='Share of communes written as "-".', default=0.05, type=float)
+    parser.add_argument('--seed', help='Random seed.', default=0, type=int)
+    args = parser.parse_args(argv[1:])
+
+    if not 0 <= args.missing_share <= 1:
+        parser.error('missing-share must be between 0 and 1')
+
+    files = generate_data(args.output, args.start_date, args.days, args.rows, args.formats, args.zipf_exponent,
+                          args.missing_share, args.seed)
+    logger.info('{0} files successfully created!'.format(len(files)))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
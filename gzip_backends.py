@@ -0,0 +1,129 @@
+import gzip
+import io
+import struct
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from isal import igzip, isal_zlib
+except ImportError:
+    igzip = isal_zlib = None
+
+try:
+    from zlib_ng import gzip_ng, zlib_ng
+except ImportError:
+    gzip_ng = zlib_ng = None
+
+# gzip module, zlib module and max compression level of each backend
+GzipBackend = namedtuple('GzipBackend', ['name', 'gzip', 'zlib', 'max_level'])
+GZIP_BACKENDS = {
+    'stdlib': GzipBackend('stdlib', gzip, zlib, 9),
+    'isal': GzipBackend('isal', igzip, isal_zlib, 3),
+    'zlib-ng': GzipBackend('zlib-ng', gzip_ng, zlib_ng, 9),
+}
+# backends used by auto from fastest to slowest
+AUTO_GZIP_BACKENDS = ['isal', 'zlib-ng', 'stdlib']
+GZIP_BACKEND_CHOICES = ['auto'] + AUTO_GZIP_BACKENDS
+# uncompressed bytes of each gzip member written by ParallelGzipWriter
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+def get_gzip_backend(name='auto'):
+    """
+    :return: GzipBackend with the given name, auto gives the fastest installed backend
+    """
+    if name == 'auto':
+        return next(GZIP_BACKENDS[name] for name in AUTO_GZIP_BACKENDS if GZIP_BACKENDS[name].gzip is not None)
+    backend = GZIP_BACKENDS[name]
+    if backend.gzip is None:
+        raise ValueError('{0} package is required to use {0} gzip backend'.format(name))
+    return backend
+
+
+def open_gzip_reader(file_obj, backend='auto'):
+    return get_gzip_backend(backend).gzip.GzipFile(fileobj=file_obj, mode='rb')
+
+
+def open_gzip_writer(raw, file_name, compression_level=9, backend='auto', threads=1):
+    """
+    :return: writable stream that compresses data to raw file object, with more than one thread data is
+    compressed in parallel blocks
+    """
+    backend = get_gzip_backend(backend)
+    compression_level = min(compression_level, backend.max_level)
+    if threads > 1:
+        return ParallelGzipWriter(raw, file_name, compression_level, backend.zlib, threads)
+    return backend.gzip.GzipFile(filename=file_name, mode='wb', fileobj=raw, compresslevel=compression_level,
+                                 mtime=0)
+
+
+def _gzip_header(file_name=None):
+    # modification time is not saved so the same data always gives the same file
+    flags = 0x08 if file_name else 0
+    header = b'\x1f\x8b\x08' + struct.pack('<BIBB', flags, 0, 0, 255)
+    if file_name:
+        header += file_name.encode('latin-1') + b'\x00'
+    return header
+
+
+def _compress_member(block, compression_level, zlib_module, file_name=None):
+    compressor = zlib_module.compressobj(compression_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    trailer = struct.pack('<II', zlib_module.crc32(block) & 0xffffffff, len(block) & 0xffffffff)
+    return b''.join([_gzip_header(file_name), compressor.compress(block), compressor.flush(), trailer])
+
+
+class ParallelGzipWriter(io.BufferedIOBase):
+    """
+    Writable stream that splits data in blocks compressed on a thread pool, each block is written as a gzip member
+    so output is a multi-member gzip file that any gunzip reads as one file. At most two blocks per thread are kept
+    in memory.
+    """
+
+    def __init__(self, raw, file_name=None, compression_level=9, zlib_module=zlib, threads=2,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        super().__init__()
+        self.raw = raw
+        self.file_name = file_name
+        self.compression_level = compression_level
+        self.zlib_module = zlib_module
+        self.block_size = block_size
+        self.max_pending = 2 * threads
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.members = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError('write to closed file')
+        self.buffer += b
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(b)
+
+    def _submit(self, block):
+        # only the first member has the file name
+        file_name = self.file_name if self.members == 0 else None
+        self.pending.append(self.executor.submit(_compress_member, block, self.compression_level, self.zlib_module,
+                                                 file_name))
+        self.members += 1
+        while len(self.pending) >= self.max_pending:
+            self.raw.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.buffer or self.members == 0:
+                self._submit(bytes(self.buffer))
+                self.buffer = bytearray()
+            while self.pending:
+                self.raw.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown()
+            super().close()
@@ -0,0 +1,99 @@
+import cProfile
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """
+    Class to collect seconds and counters (bytes, rows, etc.) of each stage and file of a run
+    """
+
+    def __init__(self):
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, file_path=None, **counters):
+        """
+        Measure seconds of a stage. It yields the record, so counters can be added while the stage runs.
+        """
+        record = OrderedDict([('stage', name), ('file', file_path)])
+        record.update(counters)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self.records.append(record)
+
+    def add(self, name, file_path=None, **counters):
+        record = OrderedDict([('stage', name), ('file', file_path)])
+        record.update(counters)
+        self.records.append(record)
+
+    def extend(self, records):
+        self.records.extend(records)
+
+    def clear(self):
+        self.records = []
+
+    def pop(self, first_record=0):
+        """
+        Remove records saved after first record, worker processes send them to the main process so they are not kept.
+        :return: removed records
+        """
+        records = self.records[first_record:]
+        del self.records[first_record:]
+        return records
+
+    def summary(self):
+        """
+        :return: dict with sum of seconds and counters of each stage
+        """
+        stages = OrderedDict()
+        for record in self.records:
+            totals = stages.setdefault(record['stage'], OrderedDict([('files', 0)]))
+            totals['files'] += 1
+            for key, value in record.items():
+                if key not in ('stage', 'file') and isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        return stages
+
+    def save(self, file_path):
+        with open(file_path, 'w') as f:
+            json.dump({'stages': self.summary(), 'records': self.records}, f, indent=2)
+
+
+# metrics of current process
+METRICS = Metrics()
+
+
+@contextmanager
+def collect_metrics(metrics_json=None, profile=None):
+    """
+    Save metrics collected while the context runs to metrics_json and run it on cProfile if profile path is given.
+    """
+    METRICS.clear()
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
+    try:
+        yield METRICS
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile)
+            logger.info('profile saved at {0}'.format(profile))
+        if metrics_json:
+            METRICS.save(metrics_json)
+            logger.info('metrics saved at {0}'.format(metrics_json))
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument('--metrics-json', help='Path of json file with seconds, bytes and rows of each stage.',
+                        default=None)
+    parser.add_argument('--profile', help='Run with cProfile and save stats to this path.', default=None)
@@ -0,0 +1,160 @@
+import numpy as np
+
+INITIAL_SIZE = 64
+
+
+class CommuneIndex:
+    """
+    Class to intern commune names to integer ids in order of first appearance.
+    """
+
+    def __init__(self):
+        self.communes = []
+        self.commune_ids = {}
+
+    def commune_id(self, commune):
+        try:
+            return self.commune_ids[commune]
+        except KeyError:
+            commune_id = self.commune_ids[commune] = len(self.communes)
+            self.communes.append(commune)
+            self._grow(len(self.communes))
+            return commune_id
+
+    def _grow(self, size):
+        pass
+
+    def intern_codes(self, names, *codes):
+        """
+        Intern names used by codes in bulk, codes are arrays with positions in names of interleaved columns, e.g.
+        origin and destination of each trip. Names get ids in order of first appearance, so the result is the same
+        as interning them one by one.
+        :return: array with id of each name used by codes
+        """
+        end = len(codes) * len(codes[0])
+        first = np.full(len(names), end, dtype=np.intp)
+        for i, column_codes in enumerate(codes):
+            np.minimum.at(first, column_codes, np.arange(i, end, len(codes), dtype=np.intp))
+        used = np.flatnonzero(first < end)
+        ids = np.zeros(len(names), dtype=np.intp)
+        for code in used[np.argsort(first[used])].tolist():
+            ids[code] = self.commune_id(names[code])
+        return ids
+
+
+class CommuneMatrix(CommuneIndex):
+    """
+    Base class of dense float64 matrices whose first axes are indexed by commune id, they grow when new communes are
+    interned. Cells with at least one trip are marked as visited, a cell can have trips and zero expanded trips.
+    """
+    # number of first axes indexed by commune id
+    commune_axes = 1
+
+    def __init__(self):
+        super().__init__()
+        self.values = np.zeros(self._shape(INITIAL_SIZE))
+        self.visited = np.zeros(self._shape(INITIAL_SIZE), dtype=bool)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.visited))
+
+    def _shape(self, size):
+        raise NotImplementedError
+
+    def _used(self, size):
+        return tuple(slice(size) for _ in range(self.commune_axes))
+
+    def _grow(self, size):
+        if size > len(self.values):
+            self._resize(2 * len(self.values))
+
+    def _resize(self, size):
+        values = np.zeros(self._shape(size))
+        visited = np.zeros(self._shape(size), dtype=bool)
+        used = self._used(len(self.values))
+        values[used] = self.values
+        visited[used] = self.visited
+        self.values = values
+        self.visited = visited
+
+    def __getstate__(self):
+        """
+        Only visited cells are pickled, e.g. a zone matrix of a day sent by a worker process or saved in cache keeps
+        its cells with trips instead of the whole dense matrix.
+        """
+        cells = np.nonzero(self.visited)
+        return {
+            'communes': self.communes,
+            'cells': tuple(axis.astype(np.int32) for axis in cells),
+            'values': self.values[cells],
+        }
+
+    def __setstate__(self, state):
+        CommuneMatrix.__init__(self)
+        for commune in state['communes']:
+            self.commune_id(commune)
+        cells = state['cells']
+        self.values[cells] = state['values']
+        self.visited[cells] = True
+
+    def merge(self, other):
+        """
+        Add trips of other matrix to this one.
+        """
+        ids = np.array([self.commune_id(commune) for commune in other.communes], dtype=np.intp)
+        cells = np.ix_(*[ids] * self.commune_axes)
+        used = self._used(len(ids))
+        self.values[cells] += other.values[used]
+        self.visited[cells] |= other.visited[used]
+        return self
+
+    __iadd__ = merge
+
+
+class ODMatrix(CommuneMatrix):
+    """
+    Class to accumulate expanded trips between communes on a dense float64 commune x commune matrix.
+    """
+    commune_axes = 2
+
+    def __init__(self, communes=()):
+        super().__init__()
+        for commune in communes:
+            self.commune_id(commune)
+
+    def _shape(self, size):
+        return size, size
+
+    def add(self, origins, destinations, values):
+        """
+        Add a batch of trips given as origin ids, destination ids and expanded trips.
+        Trips are added in order so the result is the same as adding them one by one.
+        """
+        cells = (np.asarray(origins, dtype=np.intp), np.asarray(destinations, dtype=np.intp))
+        np.add.at(self.values, cells, np.asarray(values, dtype=np.float64))
+        self.visited[cells] = True
+
+    def add_codes(self, names, origins, destinations, values):
+        """
+        Add a batch of trips whose origins and destinations are given as positions in names.
+        """
+        origins = np.asarray(origins, dtype=np.intp)
+        destinations = np.asarray(destinations, dtype=np.intp)
+        ids = self.intern_codes(names, origins, destinations)
+        self.add(ids[origins], ids[destinations], values)
+
+    def rows(self):
+        """
+        Yield (origin, destination, expanded trips) for each cell with trips ordered by origin and destination ids.
+        """
+        n = len(self.communes)
+        origins, destinations = np.nonzero(self.visited[:n, :n])
+        values = self.values[origins, destinations].tolist()
+        for origin, destination, value in zip(origins.tolist(), destinations.tolist(), values):
+            yield self.communes[origin], self.communes[destination], value
+
+    def to_dict(self):
+        data = {}
+        for origin, destination, value in self.rows():
+            data.setdefault(origin, {})[destination] = value
+        return data
@@ -1,17 +1,20 @@
 # -*- coding: utf8 -*-
 import argparse
 import csv
-import gzip
 import logging
 import os
-import shutil
 import sys
 from datetime import datetime
 
 from decouple import config
 from pyfiglet import Figlet
 
-from utils import get_file_object, get_files, send_data_to_s3, valid_date
+from archives import get_file_size
+from general_index import GeneralIndex
+from metrics import METRICS, add_metrics_arguments, collect_metrics
+from utils import add_s3_arguments, get_file_object, get_files, get_s3_options, send_data_to_s3, to_datetime, valid_date
+from watch import DEFAULT_WATCH_INTERVAL, watch
+from writers import add_writer_arguments, get_output_path, get_writer_options, open_table_writer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,41 +22,68 @@ logger = logging.getLogger(__name__)
 DIR_PATH = os.path.dirname(os.path.realpath(__file__))
 INPUTS_PATH = os.path.join(DIR_PATH, 'inputs')
 OUTPUT_PATH = os.path.join(DIR_PATH, 'output')
-BUCKET_NAME = config('MISCELLANEOUS_BUCKET_NAME')
 OUTPUT_NAME = 'transaccionesPorDia'
+OUTPUT_HEADER = ['Fecha', 'Transacciones']
+OUTPUT_COLUMN_TYPES = {
+    'Fecha': 'date32',
+    'Transacciones': 'int64',
+}
+# index file in output path used by watch mode when index path is not given
+WATCH_INDEX_NAME = 'transaccionesPorDia.sqlite'
+
+
+def get_bucket_name():
+    return config('MISCELLANEOUS_BUCKET_NAME')
 
 
 def process_general_data(file_path):
-    try:
-        f = get_file_object(file_path)
-        next(f)  # skip header
-        delimiter = str('|')
-        reader = csv.reader(f, delimiter=delimiter)
-        row = next(reader)
-    except (IndexError, StopIteration):
-        logging.warning("{0} is empty.".format(os.path.basename(file_path)))
-        return None
-    f.close()
-    return [row[0], row[12]]
-
-
-def save_csv_file(data, output, output_filename):
-    name = os.path.join(output, output_filename)
-    csv_name = '{0}.csv'.format(name)
-    gz_name = '{0}.csv.gz'.format(name)
-    gz_actual_name = '{0}.gz'.format(name)
-
-    with open(csv_name, 'w', newline='\n', encoding='UTF-8') as outfile:
-        w = csv.writer(outfile)
-        w.writerow(['Fecha', 'Transacciones'])
-        for d in data:
-            w.writerow(d)
-
-    with open(csv_name, 'rb') as f_in:
-        with gzip.open(gz_name, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-    os.rename(gz_name, gz_actual_name)
-    os.remove(csv_name)
+    with METRICS.stage('process_general_data', file_path, bytes_in=get_file_size(file_path)):
+        try:
+            f = get_file_object(file_path)
+            next(f)  # skip header
+            delimiter = str('|')
+            reader = csv.reader(f, delimiter=delimiter)
+            row = next(reader)
+        except (IndexError, StopIteration):
+            logging.warning("{0} is empty.".format(os.path.basename(file_path)))
+            return None
+        f.close()
+        return [row[0], row[12]]
+
+
+def get_daily_transactions(files_path, lower_bound=None, upper_bound=None, index_path=None):
+    """
+    :param index_path: SQLite file with date and transactions of each file, only new or changed files are read
+    :return: list of [date, transactions] between bounds ordered by date
+    """
+    lower_bound = to_datetime(lower_bound) if lower_bound is not None else None
+    upper_bound = to_datetime(upper_bound) if upper_bound is not None else None
+    if index_path:
+        index = GeneralIndex(index_path)
+        try:
+            index.update(files_path, process_general_data, lower_bound, upper_bound)
+            return index.get_rows(files_path, lower_bound, upper_bound)
+        finally:
+            index.close()
+    files = []
+    for file in files_path:
+        res = process_general_data(file)
+        if res:
+            if lower_bound or upper_bound:
+                date = datetime.strptime(res[0], '%Y-%m-%d')
+                if lower_bound and date < lower_bound or upper_bound and date > upper_bound:
+                    continue
+            files.append(res)
+    files.sort(key=lambda x: x[0])
+    return files
+
+
+def save_csv_file(data, output, output_filename, writer_options=None):
+    with METRICS.stage('write', output_filename, rows=len(data)):
+        with open_table_writer(output, output_filename, OUTPUT_HEADER, column_types=OUTPUT_COLUMN_TYPES,
+                               **(writer_options or {})) as w:
+            for d in data:
+                w.writerow(d)
 
 
 def main(argv):
@@ -66,7 +96,7 @@ def main(argv):
     # Arguments and description
     parser = argparse.ArgumentParser(description='create csv file with number of transactions for each day.')
 
-    parser.add_argument('path', help='Path for .general files.')
+    parser.add_argument('path', help='Path or S3 prefix (s3://bucket/prefix) for .general files.')
     parser.add_argument('--send-to-s3', help='Send file to S3 bucket.', action='store_true')
     parser.add_argument('--output', default=None,
                         help='path where files will be saved, if it is not provided we will use output path')
@@ -74,6 +104,14 @@ def main(argv):
                         type=valid_date)
     parser.add_argument('--upper-bound', help='Upper bound date to process in YYYY-MM-DD format .', default=None,
                         type=valid_date)
+    parser.add_argument('--index', default=None,
+                        help='SQLite file with date and transactions of each file, only new or changed files are read')
+    parser.add_argument('--watch', help='Poll input path every WATCH seconds and create output again when new files '
+                                        'are ready, files already processed are read from index.', nargs='?',
+                        const=DEFAULT_WATCH_INTERVAL, default=None, type=int)
+    add_writer_arguments(parser)
+    add_s3_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args(argv[1:])
 
     input_path = args.path
@@ -81,6 +119,7 @@ def main(argv):
     output_path = args.output if args.output else OUTPUT_PATH
     lower_bound = args.lower_bound
     upper_bound = args.upper_bound
+    writer_options = get_writer_options(args)
 
     if len([x for x in (args.lower_bound, args.upper_bound) if x is not None]) == 1:
         parser.error('--lower-bound and --upper-bound must be given together')
@@ -88,28 +127,36 @@ def main(argv):
     if lower_bound and lower_bound > upper_bound:
         parser.error('lower-bound must be lower than upper-bound ')
 
-    # process data
-    files_path = get_files('general', input_path)
-    files = []
-    for file in files_path:
-        res = process_general_data(file)
-        if res:
-            if lower_bound:
-                if not lower_bound <= datetime.strptime(res[0], '%Y-%m-%d') <= upper_bound:
-                    pass
-                else:
-                    files.append(res)
-            else:
-                files.append(res)
-    files.sort(key=lambda x: x[0])
-    # save output
-    save_csv_file(files, output_path, OUTPUT_NAME)
+    if args.watch is not None and args.watch <= 0:
+        parser.error('watch must be greater than zero')
+
+    # files already processed are read from index when output is created again
+    index_path = args.index or (os.path.join(output_path, WATCH_INDEX_NAME) if args.watch is not None else None)
+
+    def save_output(files_path):
+        files = get_daily_transactions(files_path, lower_bound, upper_bound, index_path)
+        # save output
+        save_csv_file(files, output_path, OUTPUT_NAME, writer_options)
+
+        output_file_path = get_output_path(output_path, OUTPUT_NAME, writer_options['compression'],
+                                           writer_options['output_format'])
+
+        # send to s3
+        if send_to_s3:
+            send_data_to_s3(output_file_path, get_bucket_name(), **get_s3_options(args))
+
+        logger.info('{0} successfully created!'.format(os.path.basename(output_file_path)))
 
-    # send to s3
-    if send_to_s3:
-        send_data_to_s3(os.path.join(output_path, '{0}.gz'.format(OUTPUT_NAME)), BUCKET_NAME)
+    def process(files_path):
+        # metrics are collected again on each pass of watch mode, so they do not grow while it runs
+        with collect_metrics(args.metrics_json, args.profile):
+            save_output(files_path)
 
-    logger.info('{0} successfully created!'.format('{0}.gz'.format(OUTPUT_NAME)))
+    if args.watch is not None:
+        watch('general', input_path, process, args.watch)
+    else:
+        # process data
+        process(get_files('general', input_path))
 
 
 if __name__ == "__main__":
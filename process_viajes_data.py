@@ -1,19 +1,35 @@
 # -*- coding: utf8 -*-
 import argparse
 import csv
-import gzip
-import json
+import io
 import logging
 import os
-import shutil
 import sys
-from collections import defaultdict
-from datetime import datetime
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from operator import itemgetter
 
 from decouple import config
 from pyfiglet import Figlet
 
-from utils import get_file_object, get_files, send_data_to_s3, valid_date
+from aggregators import AGGREGATIONS, AGGREGATORS, SampledAggregator, get_aggregators, get_sample_rate
+from archives import get_file_size
+from aws import MB
+from cache import DayCache
+from compact import aggregate_compact_data, compact_viajes_files, is_compact_file
+from external_sort import ExternalSorter
+from communes import get_commune_resolver
+from metrics import METRICS, add_metrics_arguments, collect_metrics
+from od_matrix import ODMatrix
+from shards import MANIFEST_SUFFIX, get_manifests, get_shard_files, get_shard_name, merge_partial_outputs, \
+    save_manifest, valid_shard
+from utils import DEFAULT_PREFETCH_SIZE, add_s3_arguments, filter_files_by_date, get_binary_file_object, \
+    get_byte_ranges, get_columns, get_file_date, get_files, get_s3_options, is_plain_file, open_byte_range, \
+    prefetch_files, sample_lines, send_data_to_s3, valid_date, valid_sample_rate
+from watch import DEFAULT_WATCH_INTERVAL, watch
+from writers import add_writer_arguments, get_output_path, get_writer_options, open_table_writer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,92 +37,377 @@ logger = logging.getLogger(__name__)
 DIR_PATH = os.path.dirname(os.path.realpath(__file__))
 INPUTS_PATH = os.path.join(DIR_PATH, 'inputs')
 OUTPUT_PATH = os.path.join(DIR_PATH, 'output')
-BUCKET_NAME = config('MISCELLANEOUS_BUCKET_NAME')
-OUTPUT_NAME = 'viajesEntreComunas'
+OUTPUT_NAME = AGGREGATORS['commune'].output_name
+OUTPUT_HEADER = AGGREGATORS['commune'].header
+OUTPUT_COLUMN_TYPES = AGGREGATORS['commune'].column_types
+# name of files that describe partial results of shards
+MANIFEST_NAME = 'viajes'
+# partial results are always saved as gzip csv files
+PARTIAL_WRITER_OPTIONS = {'output_format': 'csv', 'compression': 'gzip'}
+# parada_subida, parada_bajada, comuna_subida, comuna_bajada and factor_expansion
+VIAJES_COLUMNS = (10, 11, 12, 13, 23)
+# directory in output path where compact command saves compact files by default
+COMPACT_NAME = 'compact'
+# cache directory in output path used by watch mode when cache path is not given
+WATCH_CACHE_NAME = 'cache'
 
 
-def get_commune_for_extra_location(row, start_commune, end_commune):
-    errors = set()
-    with open(os.path.join(INPUTS_PATH, 'extra_location_communes.json')) as communes_json:
-        extra_location_communes = json.load(communes_json)
-        if not start_commune:
-            start_commune = extra_location_communes.get(row[10].title().rstrip(), None)
-        if not end_commune:
-            end_commune = extra_location_communes.get(row[11].title().rstrip(), None)
-    if not start_commune:
-        errors.add(row[10].title().rstrip())
-    if not end_commune:
-        errors.add(row[11].title().rstrip())
-    return errors, start_commune, end_commune
-
-
-def process_viajes_data(file_path):
-    trip_data = defaultdict(lambda: defaultdict(float))
+def get_bucket_name():
+    return config('MISCELLANEOUS_BUCKET_NAME')
+
+
+def get_viajes_columns(aggregators):
+    """
+    :return: VIAJES_COLUMNS followed by other columns used by aggregators
+    """
+    columns = list(VIAJES_COLUMNS)
+    for aggregator in aggregators:
+        columns.extend(column for column in aggregator.columns if column not in columns)
+    return tuple(columns)
+
+
+def get_rows(file_path, parser='fast', columns=VIAJES_COLUMNS, file_obj=None, byte_range=None, sample_rate=None):
+    """
+    :param file_obj: binary file object with uncompressed data of file, file is opened when it is not given
+    :param byte_range: (start, end) bytes of a plain file to read, lines are not skipped because ranges start after
+    skipped lines
+    :param sample_rate: fraction of trips to read, trips are sampled by the hash of their id
+    :return: file object and iterator over tuples with columns of each trip
+    """
+    if byte_range is not None:
+        f = open_byte_range(file_path, *byte_range)
+    else:
+        f = get_binary_file_object(file_path) if file_obj is None else file_obj
+    try:
+        if parser == 'csv':
+            f = io.TextIOWrapper(f, encoding='latin-1')
+            if byte_range is None:
+                next(f)  # skip header
+                next(csv.reader(f, delimiter=str('|')))
+            lines = f if sample_rate is None else sample_lines(f, sample_rate)
+            return f, map(itemgetter(*columns), csv.reader(lines, delimiter=str('|')))
+        if byte_range is None:
+            next(f)  # skip header
+            next(f)
+        return f, get_columns(f if sample_rate is None else sample_lines(f, sample_rate), columns)
+    except BaseException:
+        f.close()
+        raise
+
+
+def aggregate_viajes_data(file_path, aggregators, resolver=None, parser='fast', file_obj=None, byte_range=None):
+    """
+    Read file once and add its trips to each aggregator.
+    :param file_obj: binary file object with uncompressed data of file, file is opened when it is not given
+    :param byte_range: (start, end) bytes of a plain file to read, only trips in that range are aggregated
+    :return: list with result of each aggregator or None if file is empty, and names without commune
+    """
+    sample_rate = get_sample_rate(aggregators)
+    if is_compact_file(file_path):
+        if file_obj is not None:
+            file_obj.close()
+        if sample_rate is not None:
+            raise ValueError('compact files can not be sampled, {0} is a compact file'.format(file_path))
+        return aggregate_compact_data(file_path, aggregators, resolver)
+    resolver = resolver or get_commune_resolver()
+    commune = resolver.commune
+    location = resolver.location
+    columns = get_viajes_columns(aggregators)
+    accumulators = [aggregator.accumulator(columns) for aggregator in aggregators]
     errors = set()
+    start = time.perf_counter()
+    misses, resolve_seconds = resolver.misses, resolver.seconds
     try:
-        f = get_file_object(file_path)
-        next(f)  # skip header
-        delimiter = str('|')
-        reader = csv.reader(f, delimiter=delimiter)
-        next(reader)
+        f, rows = get_rows(file_path, parser, columns, file_obj, byte_range, sample_rate)
     except (IndexError, StopIteration):
         logging.warning("{0} is empty.".format(os.path.basename(file_path)))
         return None, errors
 
-    for row in reader:
-        trip_value = float(row[23])
-        start_commune = row[12].title().rstrip() if row[12] != '-' else None
-        end_commune = row[13].title().rstrip() if row[13] != '-' else None
-        if start_commune == 'Nunoa':
-            start_commune = 'Ñuñoa'
-        if end_commune == 'Nunoa':
-            end_commune = 'Ñuñoa'
-        new_errors = set()
-        if not start_commune or not end_commune:
-            new_errors, start_commune, end_commune = get_commune_for_extra_location(row, start_commune,
-                                                                                    end_commune)
-        if not new_errors:
-            trip_data[start_commune][end_commune] += trip_value
-        errors.update(new_errors)
+    if len(accumulators) == 1:
+        add = accumulators[0].add
+    else:
+        def add(row, start_commune, end_commune, trips, adders=[a.add for a in accumulators]):
+            for adder in adders:
+                adder(row, start_commune, end_commune, trips)
+    n_rows = 0
+    unresolved_rows = 0
+    for row in rows:
+        n_rows += 1
+        start_commune = commune(row[2]) or location(row[0])
+        end_commune = commune(row[3]) or location(row[1])
+        if not (start_commune and end_commune):
+            unresolved_rows += 1
+            if not start_commune:
+                errors.add(resolver.location_name(row[0]))
+            if not end_commune:
+                errors.add(resolver.location_name(row[1]))
+        add(row, start_commune, end_commune, float(row[4]))
+    results = [accumulator.result() for accumulator in accumulators]
     f.close()
-    return dict(trip_data), errors
+
+    binary_file = getattr(f, 'buffer', f)
+    resolve_seconds = resolver.seconds - resolve_seconds
+    bytes_in = get_file_size(file_path) if byte_range is None else byte_range[1] - byte_range[0]
+    METRICS.add('decompress', file_path, bytes_in=bytes_in, bytes_out=binary_file.bytes_read,
+                seconds=binary_file.read_seconds)
+    METRICS.add('parse', file_path, rows=n_rows,
+                seconds=time.perf_counter() - start - binary_file.read_seconds - resolve_seconds)
+    METRICS.add('resolve_communes', file_path, misses=resolver.misses - misses, unresolved_rows=unresolved_rows,
+                seconds=resolve_seconds)
+    return results, errors
+
+
+def process_viajes_data(file_path, resolver=None, parser='fast'):
+    """
+    :return: ODMatrix with expanded trips between communes or None if file is empty, and names without commune
+    """
+    results, errors = aggregate_viajes_data(file_path, [AGGREGATORS['commune']], resolver, parser)
+    if results is None:
+        return None, errors
+    return results[0].get(None, ODMatrix()), errors
+
+
+def aggregate_viajes_data_with_metrics(file_path, aggregators, parser='fast', byte_range=None):
+    """
+    Process file and return metrics recorded while it was processed, it is used to get metrics of worker processes
+    """
+    first_record = len(METRICS.records)
+    result = aggregate_viajes_data(file_path, aggregators, parser=parser, byte_range=byte_range)
+    return result, METRICS.pop(first_record)
+
+
+def get_file_byte_ranges(file_path, workers, split_size):
+    """
+    :return: byte ranges of a plain file bigger than split size, one for each worker at most, or an empty list if file
+    is not split
+    """
+    if not split_size or not is_plain_file(file_path):
+        return []
+    parts = min(workers, -(-get_file_size(file_path) // split_size))
+    if parts < 2:
+        return []
+    # header and first row are skipped as they are when the whole file is read
+    byte_ranges = get_byte_ranges(file_path, parts, skip_lines=2)
+    return byte_ranges if len(byte_ranges) > 1 else []
+
+
+def submit_file(executor, file_path, aggregators, parser='fast', workers=1, split_size=0):
+    """
+    Submit file to process pool, big plain files are split in byte ranges processed in parallel.
+    :return: list of futures with result of file or result of each byte range
+    """
+    byte_ranges = get_file_byte_ranges(file_path, workers, split_size) or [None]
+    return [executor.submit(aggregate_viajes_data_with_metrics, file_path, aggregators, parser, byte_range)
+            for byte_range in byte_ranges]
 
 
-def save_csv_file(data, output, output_filename):
-    name = os.path.join(output, output_filename)
-    csv_name = '{0}.csv'.format(name)
-    gz_name = '{0}.csv.gz'.format(name)
-    gz_actual_name = '{0}.gz'.format(name)
-    with open(csv_name, 'w+', newline='\n') as outfile:
-        w = csv.writer(outfile)
-        w.writerow(['Fecha', 'Comuna_origen', 'Comuna_destino', 'N°_viajes_expandidos'])
+def get_file_result(futures):
+    """
+    Wait for results of a file and add metrics recorded by workers. Results of byte ranges are added in range order,
+    origins and destinations keep the order in which they appear in file, but expanded trips are added in another
+    order so sums can differ from sequential sums by float rounding.
+    :return: results and names without commune of the whole file
+    """
+    range_results = []
+    for future in futures:
+        result, records = future.result()
+        METRICS.extend(records)
+        range_results.append(result)
+    results, errors = range_results[0]
+    for range_result, range_errors in range_results[1:]:
+        errors.update(range_errors)
+        for merged, result in zip(results, range_result):
+            for group, od_matrix in result.items():
+                if group in merged:
+                    merged[group] += od_matrix
+                else:
+                    merged[group] = od_matrix
+    return results, errors
+
+
+def process_files(data, aggregators, workers=1, parser='fast', cache=None, prefetch=0,
+                  prefetch_size=DEFAULT_PREFETCH_SIZE, split_size=0):
+    """
+    Process each file and yield its results in the same order of data.
+    When workers is greater than one files are processed on a process pool, and plain files bigger than split size
+    are split in byte ranges processed in parallel. Otherwise next prefetch files are decompressed on background
+    threads while current file is parsed.
+    Files with results in cache are not processed and new results are saved in cache.
+    """
+    pending = [d for d in data if cache is None or d not in cache]
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and pending else None
+    prefetched = None
+    if executor:
+        futures = [submit_file(executor, d, aggregators, parser, workers, split_size) for d in pending]
+        results = (get_file_result(file_futures) for file_futures in futures)
+    elif prefetch > 0:
+        prefetched = prefetch_files(pending, prefetch, prefetch_size)
+        results = (aggregate_viajes_data(d, aggregators, parser=parser, file_obj=file_obj)
+                   for d, file_obj in prefetched)
+    else:
+        results = map(partial(aggregate_viajes_data, aggregators=aggregators, parser=parser), pending)
+    try:
+        for d in data:
+            result = cache.get(d) if cache is not None else None
+            if result is None:
+                result = next(results)
+                if cache is not None:
+                    cache.set(d, result)
+            else:
+                METRICS.add('cache', d, hits=1)
+            yield d, result
+    finally:
+        if executor:
+            # files not started yet are not processed when a file fails or the run is interrupted
+            for file_futures in futures:
+                for future in file_futures:
+                    future.cancel()
+            executor.shutdown()
+        if prefetched:
+            prefetched.close()
+
+
+def save_output_files(data, output, outputs, workers=1, parser='fast', writer_options=None, cache=None, prefetch=0,
+                      prefetch_size=DEFAULT_PREFETCH_SIZE, split_size=0):
+    """
+    Read each file once and write output of each aggregator. Rows are sorted by date, group, origin and destination:
+    rows of each day are sorted and spilled to disk, then they are merged while outputs are written, so memory does
+    not grow with the number of days.
+    :param outputs: list of (aggregator, output filename) pairs
+    :return: names without commune
+    """
     errors = set()
-    for d in data:
-        date = "".join(os.path.basename(d)).split(".")[0]
-        logger.info("Processing date {0}...".format(date))
-        data_dict, new_errors = process_viajes_data(d)
-        errors.update(new_errors)
-        if data_dict:
-            with open(csv_name, 'a+', newline='\n') as outfile:
-                w = csv.writer(outfile)
-                for start_commune in data_dict:
-                    for end_commune in data_dict[start_commune].keys():
-                        w.writerow([date, start_commune, end_commune, data_dict[start_commune][end_commune]])
+    aggregators = [aggregator for aggregator, _ in outputs]
+    rows = [0] * len(outputs)
+    # only time spent sorting and writing rows and closing outputs is measured, files are processed while they are
+    # read
+    write_seconds = [0.0] * len(outputs)
+    with ExitStack() as stack:
+        writers = [stack.enter_context(open_table_writer(output, output_filename, aggregator.header,
+                                                         column_types=aggregator.column_types,
+                                                         **(writer_options or {})))
+                   for aggregator, output_filename in outputs]
+        sorters = [stack.enter_context(ExternalSorter(output)) for _ in outputs]
+        for d, (results, new_errors) in process_files(data, aggregators, workers, parser, cache, prefetch,
+                                                         prefetch_size, split_size):
+            date = get_file_date(d)
+            logger.info("Processing date {0}...".format(date))
+            errors.update(new_errors)
+            for i, (aggregator, sorter, result) in enumerate(zip(aggregators, sorters, results or [])):
+                start = time.perf_counter()
+                sorter.add(aggregator.rows(date, result))
+                rows[i] += sum(len(od_matrix) for od_matrix in result.values())
+                write_seconds[i] += time.perf_counter() - start
+        for i, (w, sorter) in enumerate(zip(writers, sorters)):
+            start = time.perf_counter()
+            for row in sorter:
+                w.writerow(row)
+            write_seconds[i] += time.perf_counter() - start
+        start = time.perf_counter()
+    # outputs are closed together so closing time is split between them
+    close_seconds = (time.perf_counter() - start) / len(outputs)
+    for (_, output_filename), n_rows, seconds in zip(outputs, rows, write_seconds):
+        METRICS.add('write', output_filename, rows=n_rows, seconds=seconds + close_seconds)
     for e in errors:
         logger.warning("{0} has no commune.".format(e))
+    return errors
+
 
-    with open(csv_name, 'rb') as f_in:
-        with gzip.open(gz_name, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
+def save_csv_file(data, output, output_filename, workers=1, parser='fast', writer_options=None, cache=None):
+    save_output_files(data, output, [(AGGREGATORS['commune'], output_filename)], workers, parser, writer_options,
+                      cache)
 
-    os.rename(gz_name, gz_actual_name)
-    os.remove(csv_name)
+
+def merge(argv):
+    """
+    This command will merge partial results of shards in the final outputs.
+    """
+    parser = argparse.ArgumentParser(prog='{0} merge'.format(argv[0]),
+                                     description='merge partial results created with --shard in final outputs.')
+    parser.add_argument('paths', nargs='+', help='Partial result json files or directories with them.')
+    parser.add_argument('--send-to-s3', help='Send file to S3 bucket.', action='store_true')
+    parser.add_argument('--output', default=None,
+                        help='path where files will be saved, if it is not provided we will use output path')
+    add_writer_arguments(parser)
+    add_s3_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv[2:])
+
+    output_path = args.output if args.output else OUTPUT_PATH
+    writer_options = get_writer_options(args)
+
+    try:
+        manifests = get_manifests(args.paths)
+    except ValueError as e:
+        parser.error(str(e))
+
+    output_files_path = []
+    with collect_metrics(args.metrics_json, args.profile):
+        for aggregation in AGGREGATIONS:
+            if aggregation not in manifests[0]['outputs']:
+                continue
+            aggregator = AGGREGATORS[aggregation]
+            files_path = [manifest['outputs'][aggregation] for manifest in manifests]
+            with METRICS.stage('merge', aggregator.output_name, partials=len(files_path)) as record:
+                record['rows'] = merge_partial_outputs(files_path, output_path, aggregator.output_name,
+                                                       aggregator.header, aggregator.column_types, **writer_options)
+            output_files_path.append(get_output_path(output_path, aggregator.output_name,
+                                                     writer_options['compression'], writer_options['output_format']))
+        for e in sorted(set().union(*[manifest['errors'] for manifest in manifests])):
+            logger.warning("{0} has no commune.".format(e))
+
+        # send to s3
+        if args.send_to_s3:
+            for output_file_path in output_files_path:
+                send_data_to_s3(output_file_path, get_bucket_name(), **get_s3_options(args))
+
+    for output_file_path in output_files_path:
+        logger.info('{0} successfully created!'.format(os.path.basename(output_file_path)))
+
+
+def compact(argv):
+    """
+    This command will save columns used by aggregations of each file in a compact file that is aggregated faster.
+    """
+    parser = argparse.ArgumentParser(prog='{0} compact'.format(argv[0]),
+                                     description='save columns used by aggregations of .viajes files in compact '
+                                                 'columnar files, their path can be used as input path.')
+    parser.add_argument('path', help='Path or S3 prefix (s3://bucket/prefix) for .trip files.')
+    parser.add_argument('--output', default=None,
+                        help='path where compact files will be saved, if it is not provided we will use compact '
+                             'directory in output path')
+    parser.add_argument('--lower-bound', help='Lower bound date to process in YYYY-MM-DD format .', default=None,
+                        type=valid_date)
+    parser.add_argument('--upper-bound', help='Upper bound date to process in YYYY-MM-DD format .', default=None,
+                        type=valid_date)
+    parser.add_argument('--workers', help='Number of processes used to compact files in parallel.', default=1,
+                        type=int)
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv[2:])
+
+    output_path = args.output if args.output else os.path.join(OUTPUT_PATH, COMPACT_NAME)
+
+    if args.workers < 1:
+        parser.error('workers must be greater than zero')
+
+    with collect_metrics(args.metrics_json, args.profile):
+        files_path = filter_files_by_date(get_files('viajes', args.path), args.lower_bound, args.upper_bound)
+        compact_viajes_files([file_path for file_path in files_path if not is_compact_file(file_path)], output_path,
+                             args.workers)
+
+    logger.info('compact files successfully created in {0}!'.format(output_path))
 
 
 def main(argv):
     """
     This script will create a csv file with number of expanded trips for each commune per day.
     """
+    if len(argv) > 1 and argv[1] == 'merge':
+        return merge(argv)
+
+    if len(argv) > 1 and argv[1] == 'compact':
+        return compact(argv)
+
     f = Figlet()
     logger.info(f.renderText('Trips for each Commune per Day'))
 
@@ -114,7 +415,7 @@ def main(argv):
     parser = argparse.ArgumentParser(
         description='create csv file with number of expanded trips for each commune per day.')
 
-    parser.add_argument('path', help='Path for .trip files.')
+    parser.add_argument('path', help='Path or S3 prefix (s3://bucket/prefix) for .trip files.')
     parser.add_argument('--send-to-s3', help='Send file to S3 bucket.', action='store_true')
     parser.add_argument('--output', default=None,
                         help='path where files will be saved, if it is not provided we will use output path')
@@ -122,6 +423,32 @@ def main(argv):
                         type=valid_date)
     parser.add_argument('--upper-bound', help='Upper bound date to process in YYYY-MM-DD format .', default=None,
                         type=valid_date)
+    parser.add_argument('--workers', help='Number of processes used to process files in parallel.', default=1,
+                        type=int)
+    parser.add_argument('--parser', help='Row parser, fast parser only splits the required columns.', default='fast',
+                        choices=['fast', 'csv'])
+    parser.add_argument('--cache', help='Path where results of each file are cached, unchanged files are not '
+                                        'processed again.', default=None)
+    parser.add_argument('--prefetch', help='Number of files decompressed in background while current file is '
+                                           'parsed, it is used when workers is 1.', default=0, type=int)
+    parser.add_argument('--prefetch-size', help='Max MB of decompressed data kept in memory for each prefetched file.',
+                        default=DEFAULT_PREFETCH_SIZE // MB, type=int)
+    parser.add_argument('--split-size', help='Plain files bigger than this MB are split in byte ranges processed by '
+                                             'different workers, 0 (default) does not split files.', default=0,
+                        type=int)
+    parser.add_argument('--aggregations', help='Outputs computed reading each file once, commune by default.',
+                        nargs='+', default=['commune'], choices=AGGREGATIONS)
+    parser.add_argument('--watch', help='Poll input path every WATCH seconds and create outputs again when new files '
+                                        'are ready, days already processed are read from cache.', nargs='?',
+                        const=DEFAULT_WATCH_INTERVAL, default=None, type=int)
+    parser.add_argument('--shard', help='Process only shard i of N of the files and save a partial result, partial '
+                                        'results are combined with merge command.', default=None, type=valid_shard)
+    parser.add_argument('--sample-rate', help='Read only this fraction of trips, sampled by trip id, and save '
+                                              'estimated outputs with their standard error.', default=None,
+                        type=valid_sample_rate)
+    add_writer_arguments(parser)
+    add_s3_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args(argv[1:])
 
     input_path = args.path
@@ -129,6 +456,14 @@ def main(argv):
     output_path = args.output if args.output else OUTPUT_PATH
     lower_bound = args.lower_bound
     upper_bound = args.upper_bound
+    writer_options = get_writer_options(args)
+    aggregations = list(dict.fromkeys(args.aggregations))
+    cache_version = '{0}:{1}'.format(get_commune_resolver().version, ','.join(aggregations))
+    if args.sample_rate is not None:
+        cache_version += ':sample-{0}'.format(args.sample_rate)
+    cache = DayCache(args.cache, cache_version) if args.cache else None
+    workers = args.workers
+    row_parser = args.parser
 
     if len([x for x in (lower_bound, upper_bound) if x is not None]) == 1:
         parser.error('--lower-bound and --upper-bound must be given together')
@@ -136,22 +471,78 @@ def main(argv):
     if lower_bound and upper_bound and lower_bound > upper_bound:
         parser.error('lower-bound must be lower than upper-bound ')
 
-    # get data files
-    files_path = get_files('viajes', input_path)
+    if workers < 1:
+        parser.error('workers must be greater than zero')
+
+    if args.split_size < 0:
+        parser.error('split-size must be positive')
+
+    if args.prefetch < 0 or args.prefetch_size < 1:
+        parser.error('prefetch must be positive and prefetch-size greater than zero')
+
+    if args.shard and send_to_s3:
+        parser.error('partial results of --shard can not be sent to S3, send merged outputs')
+
+    if args.watch is not None and args.shard:
+        parser.error('--watch can not be used with --shard')
+
+    if args.sample_rate is not None and args.shard:
+        parser.error('--sample-rate can not be used with --shard')
+
+    if args.sample_rate is not None and any(is_compact_file(file_path) for file_path in
+                                            get_files('viajes', input_path)):
+        parser.error('--sample-rate can not be used with compact files')
+
+    if args.watch is not None and args.watch <= 0:
+        parser.error('watch must be greater than zero')
+
+    if args.watch is not None and cache is None:
+        # results of days already processed are read from cache when outputs are created again
+        cache = DayCache(os.path.join(output_path, WATCH_CACHE_NAME), cache_version)
+
+    def save_outputs(files_path):
+        # filter between dates
+        files_path = filter_files_by_date(files_path, lower_bound, upper_bound)
+        # process data and save outputs
+        aggregators = get_aggregators(aggregations)
+        if args.sample_rate is not None:
+            aggregators = [SampledAggregator(aggregator, args.sample_rate) for aggregator in aggregators]
+        outputs = [(aggregator, aggregator.output_name) for aggregator in aggregators]
+        if args.shard:
+            files_path = get_shard_files(files_path, args.shard)
+            outputs = [(aggregator, get_shard_name(output_filename, args.shard)) for aggregator, output_filename in
+                       outputs]
+            writer_options.update(PARTIAL_WRITER_OPTIONS)
+        errors = save_output_files(files_path, output_path, outputs, workers, row_parser, writer_options, cache,
+                                   args.prefetch, args.prefetch_size * MB, args.split_size * MB)
+
+        output_files_path = [get_output_path(output_path, output_filename, writer_options['compression'],
+                                             writer_options['output_format']) for _, output_filename in outputs]
+        if args.shard:
+            manifest_path = os.path.join(output_path, get_shard_name(MANIFEST_NAME, args.shard) + MANIFEST_SUFFIX)
+            save_manifest(manifest_path, args.shard, files_path,
+                          {aggregation: os.path.basename(output_file_path) for aggregation, output_file_path in
+                           zip(aggregations, output_files_path)}, errors)
+            output_files_path.append(manifest_path)
+
+        # send to s3
+        if send_to_s3:
+            for output_file_path in output_files_path:
+                send_data_to_s3(output_file_path, get_bucket_name(), **get_s3_options(args))
 
-    # filter between dates
-    if lower_bound:
-        files_path = [file for file in files_path if
-                      lower_bound <= datetime.strptime(os.path.basename(file).split(".")[0],
-                                                       '%Y-%m-%d') <= upper_bound]
-    # process data and save output
-    save_csv_file(files_path, output_path, OUTPUT_NAME)
+        for output_file_path in output_files_path:
+            logger.info('{0} successfully created!'.format(os.path.basename(output_file_path)))
 
-    # send to s3
-    if send_to_s3:
-        send_data_to_s3(os.path.join(output_path, '{0}.gz'.format(OUTPUT_NAME)), BUCKET_NAME)
+    def process(files_path):
+        # metrics are collected again on each pass of watch mode, so they do not grow while it runs
+        with collect_metrics(args.metrics_json, args.profile):
+            save_outputs(files_path)
 
-    logger.info('{0} successfully created!'.format('{0}.gz'.format(OUTPUT_NAME)))
+    if args.watch is not None:
+        watch('viajes', input_path, process, args.watch)
+    else:
+        # get data files
+        process(get_files('viajes', input_path))
 
 
 if __name__ == "__main__":
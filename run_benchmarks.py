@@ -0,0 +1,154 @@
+# -*- coding: utf8 -*-
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from generate_synthetic_data import FORMATS, generate_data
+from utils import get_files, valid_date
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+
+
+def get_peak_rss_mb():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes and macOS bytes
+    return peak_rss / 1024 ** 2 if sys.platform == 'darwin' else peak_rss / 1024
+
+
+def benchmark_process_viajes_data(files, output):
+    from process_viajes_data import process_viajes_data
+    for file_path in files:
+        process_viajes_data(file_path)
+
+
+def benchmark_save_csv_file(files, output):
+    from process_viajes_data import save_csv_file
+    save_csv_file(files, output, 'benchmark')
+
+
+def benchmark_process_general_data(files, output):
+    from process_general_data import process_general_data
+    for file_path in files:
+        process_general_data(file_path)
+
+
+# name, file type and function of each benchmark
+BENCHMARKS = [
+    ('process_viajes_data', 'viajes', benchmark_process_viajes_data),
+    ('save_csv_file', 'viajes', benchmark_save_csv_file),
+    ('process_general_data', 'general', benchmark_process_general_data),
+]
+
+
+def run_benchmark(function, files, output):
+    """
+    Run benchmark function, it is called in a new process to measure its peak memory.
+    :return: wall time in seconds and peak resident set size in MB
+    """
+    start = time.perf_counter()
+    function(files, output)
+    return time.perf_counter() - start, get_peak_rss_mb()
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=DIR_PATH,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(data_path, rows, names=None, repeat=1):
+    """
+    :return: list with results of each benchmark and file format
+    """
+    results = []
+    output = tempfile.mkdtemp()
+    context = multiprocessing.get_context('spawn')
+    try:
+        for name, file_type, function in BENCHMARKS:
+            if names and name not in names:
+                continue
+            files = get_files(file_type, data_path)
+            for file_format in FORMATS:
+                extension = '' if file_format == 'plain' else '.{0}'.format(file_format)
+                format_files = [f for f in files if f.endswith('.{0}{1}'.format(file_type, extension))]
+                if not format_files:
+                    continue
+                total_rows = rows * len(format_files) if file_type == 'viajes' else len(format_files)
+                for _ in range(repeat):
+                    with context.Pool(1) as pool:
+                        wall_time, peak_rss = pool.apply(run_benchmark, (function, format_files, output))
+                    result = {
+                        'name': name,
+                        'format': file_format,
+                        'files': len(format_files),
+                        'rows': total_rows,
+                        'wall_time': wall_time,
+                        'rows_per_second': total_rows / wall_time,
+                        'peak_rss_mb': peak_rss,
+                    }
+                    logger.info('{name} ({format}): {rows} rows in {wall_time:.2f}s, {rows_per_second:.0f} rows/s, '
+                                'peak rss {peak_rss_mb:.1f}MB'.format(**result))
+                    results.append(result)
+    finally:
+        shutil.rmtree(output)
+    return results
+
+
+def main(argv):
+    """
+    This script will measure rows/sec, wall time and peak memory of both pipelines on synthetic data.
+    """
+    parser = argparse.ArgumentParser(description='measure performance of both pipelines on synthetic data.')
+
+    parser.add_argument('output', help='Path of json file with results.')
+    parser.add_argument('--data', default=None,
+                        help='path with .viajes and .general files, if it is not provided synthetic files are created')
+    parser.add_argument('--start-date', help='First date in YYYY-MM-DD format.', default=valid_date('2020-03-01'),
+                        type=valid_date)
+    parser.add_argument('--days', help='Number of days.', default=2, type=int)
+    parser.add_argument('--rows', help='Number of trips per day.', default=100000, type=int)
+    parser.add_argument('--formats', help='File formats.', nargs='+', default=FORMATS, choices=FORMATS)
+    parser.add_argument('--benchmarks', help='Benchmarks to run, all by default.', nargs='+', default=None,
+                        choices=[name for name, _, _ in BENCHMARKS])
+    parser.add_argument('--repeat', help='Times each benchmark is run.', default=1, type=int)
+    args = parser.parse_args(argv[1:])
+
+    data_path = args.data or tempfile.mkdtemp()
+    try:
+        if not args.data:
+            generate_data(data_path, args.start_date, args.days, args.rows, args.formats)
+        results = run_benchmarks(data_path, args.rows, args.benchmarks, args.repeat)
+    finally:
+        if not args.data:
+            shutil.rmtree(data_path)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'commit': get_commit(),
+            'date': datetime.now().replace(microsecond=0).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'rows_per_day': args.rows,
+            'results': results,
+        }, f, indent=2)
+    logger.info('{0} successfully created!'.format(args.output))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,78 @@
+import fnmatch
+import os
+
+from aws import AWSSession
+
+S3_SCHEME = 's3://'
+
+# session of each process, boto3 sessions can not be shared with worker processes
+_sessions = {}
+# (size, modification time in nanoseconds) of objects found by last listing
+_object_stats = {}
+
+
+def is_s3_path(path):
+    return path.startswith(S3_SCHEME)
+
+
+def split_s3_path(path):
+    """
+    :return: (bucket name, key) of a path like s3://bucket/key
+    """
+    bucket_name, _, key = path[len(S3_SCHEME):].partition('/')
+    return bucket_name, key
+
+
+def get_s3_session():
+    pid = os.getpid()
+    if pid not in _sessions:
+        _sessions[pid] = AWSSession()
+    return _sessions[pid]
+
+
+def _to_nanoseconds(last_modified):
+    return int(last_modified.timestamp()) * 10 ** 9 + last_modified.microsecond * 1000
+
+
+def list_s3_files(path, patterns):
+    """
+    :param path: S3 path of an object or of a prefix, objects in deeper prefixes are not listed
+    :return: S3 paths of objects whose name matches any pattern
+    """
+    bucket_name, prefix = split_s3_path(path)
+    directory = prefix if not prefix or prefix.endswith('/') else prefix + '/'
+    files = []
+    for key, size, last_modified in get_s3_session().list_objects(bucket_name, prefix):
+        if key != prefix and not (key.startswith(directory) and '/' not in key[len(directory):]):
+            continue
+        if any(fnmatch.fnmatch(key.rsplit('/', 1)[-1], pattern) for pattern in patterns):
+            file_path = '{0}{1}/{2}'.format(S3_SCHEME, bucket_name, key)
+            _object_stats[file_path] = size, _to_nanoseconds(last_modified)
+            files.append(file_path)
+    return files
+
+
+def get_s3_file_stat(path):
+    """
+    :return: (size, modification time in nanoseconds) of object, it is taken from last listing when it is possible
+    """
+    try:
+        return _object_stats[path]
+    except KeyError:
+        bucket_name, key = split_s3_path(path)
+        size, last_modified = get_s3_session().get_object_stat(key, bucket_name)
+        return size, _to_nanoseconds(last_modified)
+
+
+def get_s3_file_etag(path):
+    bucket_name, key = split_s3_path(path)
+    return get_s3_session().get_etag(key, bucket_name)
+
+
+def open_s3_file(path):
+    """
+    :return: seekable raw reader that streams object with ranged GET requests, nothing is saved on disk
+    """
+    bucket_name, key = split_s3_path(path)
+    size, _ = get_s3_file_stat(path)
+    return get_s3_session().open_object(key, bucket_name, size=size)
@@ -0,0 +1,118 @@
+import argparse
+import csv
+import glob
+import heapq
+import io
+import json
+import os
+
+from utils import get_binary_file_object, get_file_date
+from writers import open_table_writer
+
+MANIFEST_SUFFIX = '.json'
+
+
+def valid_shard(s):
+    """
+    :return: (shard number, number of shards) from a string like 2/4, shards are numbered from 1
+    """
+    try:
+        shard, shards = [int(x) for x in s.split('/')]
+    except ValueError:
+        shard, shards = 0, 0
+    if not 1 <= shard <= shards:
+        raise argparse.ArgumentTypeError("Not a valid shard: '{0}', use i/N with 1 <= i <= N.".format(s))
+    return shard, shards
+
+
+def get_shard_name(name, shard):
+    return '{0}.shard-{1}-of-{2}'.format(name, *shard)
+
+
+def get_shard_files(files_path, shard):
+    """
+    :return: contiguous slice of files of shard, every shard must get the same sorted files
+    """
+    number, shards = shard
+    return files_path[(number - 1) * len(files_path) // shards:number * len(files_path) // shards]
+
+
+def save_manifest(manifest_path, shard, files_path, outputs, errors):
+    """
+    Save json file that describes a partial result.
+    :param outputs: dict with file name of partial output of each aggregation, files are in manifest directory
+    """
+    manifest = {
+        'shard': list(shard),
+        'files': list(files_path),
+        'outputs': outputs,
+        'errors': sorted(errors),
+    }
+    tmp_path = '{0}.tmp'.format(manifest_path)
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def get_manifests(paths):
+    """
+    :param paths: manifest files or directories with them
+    :return: manifests sorted by shard with path of each partial output
+    """
+    manifest_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            manifest_paths.extend(glob.glob(os.path.join(path, '*.shard-*-of-*{0}'.format(MANIFEST_SUFFIX))))
+        else:
+            manifest_paths.append(path)
+    manifests = []
+    for manifest_path in sorted(set(manifest_paths)):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        directory = os.path.dirname(manifest_path)
+        manifest['outputs'] = {name: os.path.join(directory, file_name) for name, file_name in
+                               manifest['outputs'].items()}
+        manifests.append(manifest)
+    # rows of a day split between shards are merged in the order of its files
+    manifests.sort(key=lambda m: ([get_file_date(file_path) for file_path in m['files'][:1]], m['shard']))
+    check_manifests(manifests)
+    return manifests
+
+
+def check_manifests(manifests):
+    if not manifests:
+        raise ValueError('there are no partial results to merge')
+    files_path = set()
+    for manifest in manifests:
+        if sorted(manifest['outputs']) != sorted(manifests[0]['outputs']):
+            raise ValueError('partial results have different aggregations')
+        for file_path in manifest['files']:
+            if file_path in files_path:
+                raise ValueError('{0} is in more than one partial result'.format(file_path))
+            files_path.add(file_path)
+
+
+def read_partial_rows(file_path):
+    """
+    Yield rows of a partial output without header, expanded trips are converted to float.
+    """
+    with io.TextIOWrapper(get_binary_file_object(file_path), encoding='UTF-8', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            row[-1] = float(row[-1])
+            yield row
+
+
+def merge_partial_outputs(files_path, output, output_filename, header, column_types=None, **writer_options):
+    """
+    Merge rows of sorted partial outputs in a single output. Rows are streamed and merged in the order of outputs
+    (date, group, origin and destination) so the result is the same output of a run over all files.
+    :return: number of rows
+    """
+    rows = 0
+    with open_table_writer(output, output_filename, header, column_types=column_types, **writer_options) as w:
+        for row in heapq.merge(*[read_partial_rows(file_path) for file_path in files_path]):
+            w.writerow(row)
+            rows += 1
+    return rows
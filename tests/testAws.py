@@ -1,8 +1,16 @@
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 
 import mock
 from botocore.exceptions import ClientError
 
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+
 import aws
 
 
@@ -47,4 +55,44 @@ class AwsTest(TestCase):
     def test_send_file_to_bucket(self, build_url):
         build_url.return_value = 'url'
         self.aws_session.session.resource = mock.MagicMock()
-        self.assertEqual('url', self.aws_session.send_file_to_bucket('path', 'key', 'bucket_name'))
\ No newline at end of file
+        self.assertEqual('url', self.aws_session.send_file_to_bucket('path', 'key', 'bucket_name'))
+
+
+@mock_aws()
+class AwsMotoTest(TestCase):
+
+    def setUp(self):
+        self.aws_session = aws.AWSSession(aws.get_transfer_config(part_size=5 * aws.MB, max_concurrency=2))
+        self.aws_session.s3.create_bucket(Bucket='bucket')
+        self.tmp_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_path, 'file.gz')
+        self.write_file(b'data')
+
+    def write_file(self, data):
+        with open(self.file_path, 'wb') as f:
+            f.write(data)
+
+    def test_send_file_to_bucket(self):
+        callback = mock.MagicMock()
+        self.aws_session.send_file_to_bucket(self.file_path, 'file.gz', 'bucket', callback=callback)
+        callback.assert_called_with(4)
+        body = self.aws_session.s3.Object('bucket', 'file.gz').get()['Body'].read()
+        self.assertEqual(b'data', body)
+
+    def test_is_unchanged(self):
+        self.assertIsNone(self.aws_session.get_etag('file.gz', 'bucket'))
+        self.assertFalse(self.aws_session.is_unchanged(self.file_path, 'file.gz', 'bucket'))
+        self.aws_session.send_file_to_bucket(self.file_path, 'file.gz', 'bucket')
+        self.assertTrue(self.aws_session.is_unchanged(self.file_path, 'file.gz', 'bucket'))
+        self.write_file(b'new data')
+        self.assertFalse(self.aws_session.is_unchanged(self.file_path, 'file.gz', 'bucket'))
+
+    def test_compute_etag_multipart(self):
+        self.write_file(b'a' * (11 * aws.MB))
+        self.aws_session.send_file_to_bucket(self.file_path, 'file.gz', 'bucket')
+        etag = self.aws_session.get_etag('file.gz', 'bucket')
+        self.assertTrue(etag.endswith('-3'))
+        self.assertEqual(etag, aws.compute_etag(self.file_path, self.aws_session.transfer_config))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+from aggregators import AGGREGATORS, ODAggregator, SampledAggregator, get_sample_rate
+
+
+class ODAggregatorTest(TestCase):
+    def setUp(self):
+        self.columns = (10, 11, 12, 13, 23, 14, 15, 18, 16)
+        self.rows = [
+            (b'A', b'B', b'SANTIAGO', b'RECOLETA', b'1.5', b'1', b'2', b'04 - MANANA DOMINGO', b'2020-03-01 10:23:17'),
+            (b'A', b'B', b'SANTIAGO', b'RECOLETA', b'0.5', b'1', b'-', b'03 - TRANSICION DOMINGO MANANA',
+             b'2020-03-01 07:59:59'),
+            (b'A', b'B', b'SANTIAGO', b'-', b'2.0', b'1', b'2', b'04 - MANANA DOMINGO', b'2020-03-01 10:15:00'),
+        ]
+        self.communes = [('Santiago', 'Recoleta'), ('Santiago', 'Recoleta'), ('Santiago', None)]
+
+    def aggregate_result(self, aggregator):
+        accumulator = aggregator.accumulator(self.columns)
+        for row, (start_commune, end_commune) in zip(self.rows, self.communes):
+            accumulator.add(row, start_commune, end_commune, float(row[4]))
+        return accumulator.result()
+
+    def aggregate(self, aggregator):
+        return list(aggregator.rows('2020-03-01', self.aggregate_result(aggregator)))
+
+    def test_commune(self):
+        self.assertEqual([['2020-03-01', 'Santiago', 'Recoleta', 2.0]], self.aggregate(AGGREGATORS['commune']))
+
+    def test_period(self):
+        expected = [['2020-03-01', '03 - TRANSICION DOMINGO MANANA', 'Santiago', 'Recoleta', 0.5],
+                    ['2020-03-01', '04 - MANANA DOMINGO', 'Santiago', 'Recoleta', 1.5]]
+        self.assertEqual(expected, self.aggregate(AGGREGATORS['period']))
+
+    def test_zone(self):
+        self.assertEqual([['2020-03-01', '1', '2', 3.5]], self.aggregate(AGGREGATORS['zone']))
+
+    def test_time_of_day(self):
+        expected = [['2020-03-01', 'Santiago', '07:45:00', 0.5], ['2020-03-01', 'Santiago', '10:15:00', 3.5]]
+        self.assertEqual(expected, self.aggregate(AGGREGATORS['time_of_day']))
+        self.assertEqual(['Fecha', 'Comuna_origen', 'Cuarto_hora', 'N°_viajes_expandidos'],
+                         AGGREGATORS['time_of_day'].header)
+
+    def test_time_of_day_without_times(self):
+        self.rows = [row[:-1] + (b'-',) for row in self.rows]
+        self.assertEqual([], self.aggregate(AGGREGATORS['time_of_day']))
+
+    def test_header(self):
+        aggregator = ODAggregator('output', 'Comuna_origen', 'Comuna_destino', group_header='Periodo',
+                                  group_column=18)
+        self.assertEqual(['Fecha', 'Periodo', 'Comuna_origen', 'Comuna_destino', 'N°_viajes_expandidos'],
+                         aggregator.header)
+        self.assertEqual((18,), aggregator.columns)
+        self.assertEqual('float64', aggregator.column_types['N°_viajes_expandidos'])
+
+    def test_sampled(self):
+        aggregator = SampledAggregator(AGGREGATORS['commune'], 0.5)
+        self.assertEqual('viajesEntreComunasEstimado', aggregator.output_name)
+        self.assertEqual(AGGREGATORS['commune'].header + ['Error_estandar'], aggregator.header)
+        self.assertEqual('float64', aggregator.column_types['Error_estandar'])
+        # trips are scaled by 1 / 0.5 and error is sqrt((1 - 0.5) * (3.0 ** 2 + 1.0 ** 2))
+        self.assertEqual([['2020-03-01', 'Santiago', 'Recoleta', 4.0, 5 ** 0.5]], self.aggregate(aggregator))
+
+    def test_sampled_time_of_day(self):
+        aggregator = SampledAggregator(AGGREGATORS['time_of_day'], 1)
+        expected = [['2020-03-01', 'Santiago', '07:45:00', 0.5, 0.0], ['2020-03-01', 'Santiago', '10:15:00', 3.5, 0.0]]
+        self.assertEqual(expected, self.aggregate(aggregator))
+
+    def test_sampled_result_merge(self):
+        aggregator = SampledAggregator(AGGREGATORS['period'], 0.5)
+        result = self.aggregate_result(aggregator)
+        for group, other in self.aggregate_result(aggregator).items():
+            result[group] += other
+        self.assertEqual(1, len(result['04 - MANANA DOMINGO']))
+        expected = [['2020-03-01', '03 - TRANSICION DOMINGO MANANA', 'Santiago', 'Recoleta', 2.0, 1.0],
+                    ['2020-03-01', '04 - MANANA DOMINGO', 'Santiago', 'Recoleta', 6.0, 3.0]]
+        self.assertEqual(expected, list(aggregator.rows('2020-03-01', result)))
+
+    def test_get_sample_rate(self):
+        self.assertIsNone(get_sample_rate([AGGREGATORS['commune']]))
+        self.assertEqual(0.5, get_sample_rate([SampledAggregator(AGGREGATORS['commune'], 0.5)]))
+        with self.assertRaises(ValueError):
+            get_sample_rate([AGGREGATORS['commune'], SampledAggregator(AGGREGATORS['zone'], 0.5)])
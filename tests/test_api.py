@@ -0,0 +1,69 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import date
+from unittest import TestCase, mock
+
+from aggregators import AGGREGATORS
+from api import aggregate_trips, aggregate_trips_by_day, daily_transactions, to_columns, write_rows
+from process_viajes_data import save_csv_file
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.viajes_path = os.path.join(dir_path, 'viajes_files')
+        self.viajes_files = [os.path.join(self.viajes_path, name) for name in
+                             ['2020-03-01.viajes', '2020-03-01.viajes.gz', '2020-nodata.viajes.gz']]
+        self.general_path = os.path.join(dir_path, 'general_files')
+        self.output = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+
+    def test_import_without_settings(self):
+        env = {key: value for key, value in os.environ.items() if key != 'MISCELLANEOUS_BUCKET_NAME'}
+        subprocess.check_call([sys.executable, '-c', 'import api'],
+                              cwd=os.path.dirname(os.path.dirname(self.viajes_path)), env=env)
+
+    def test_aggregate_trips(self):
+        rows = list(aggregate_trips(self.viajes_files[0]))
+        self.assertEqual(['2020-03-01', 'Recoleta', 'Recoleta', 1.5408], rows[0])
+        self.assertEqual(4, len(rows))
+        self.assertEqual([], list(aggregate_trips(self.viajes_files[0], (date(2020, 3, 2), date(2020, 3, 31)))))
+
+    def test_aggregate_trips_same_as_output(self):
+        # rows of files with the same date are sorted in memory, nothing is spilled to disk
+        with mock.patch('external_sort.tempfile.mkdtemp') as mkdtemp:
+            rows = list(aggregate_trips(self.viajes_files))
+        mkdtemp.assert_not_called()
+        write_rows(rows, self.output, 'api', AGGREGATORS['commune'].header)
+        save_csv_file(self.viajes_files, self.output, 'cli')
+        with open(os.path.join(self.output, 'api.gz'), 'rb') as api_file, \
+                open(os.path.join(self.output, 'cli.gz'), 'rb') as cli_file:
+            self.assertEqual(cli_file.read()[30:], api_file.read()[30:])
+
+    def test_aggregate_trips_by_day(self):
+        days = list(aggregate_trips_by_day(self.viajes_files[1:2], ('2020-03-01', '2020-03-01'),
+                                           aggregations=('commune', 'zone')))
+        self.assertEqual(['2020-03-01'], [day for day, _, _ in days])
+        results = days[0][1]
+        self.assertEqual({'San Miguel': {'Santiago': 1.5236}, 'Santiago': {'San Miguel': 1.4524},
+                          'Recoleta': {'Recoleta': 1.5408}, 'Ñuñoa': {'Ñuñoa': 1.4085}},
+                         results['commune'][None].to_dict())
+        self.assertEqual(4, len(results['zone'][None]))
+
+    def test_daily_transactions(self):
+        expected = [['2018-10-01', '5930344']] * 3
+        self.assertEqual(expected, daily_transactions(self.general_path, ('2018-01-01', '2018-12-31')))
+        index_path = os.path.join(self.output, 'index.sqlite')
+        self.assertEqual(expected, daily_transactions([self.general_path], ('2018-01-01', '2018-12-31'), index_path))
+        self.assertEqual([], daily_transactions(self.general_path, ('2019-01-01', '2019-12-31'), index_path))
+
+    def test_to_columns(self):
+        columns = to_columns([['2018-10-01', 1.5], ['2018-10-02', 2.5]], ['Fecha', 'Valor'])
+        self.assertEqual(['2018-10-01', '2018-10-02'], columns['Fecha'].tolist())
+        self.assertEqual(4.0, columns['Valor'].sum())
+        self.assertEqual(0, len(to_columns([], ['Fecha', 'Valor'])['Valor']))
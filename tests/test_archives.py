@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from archives import get_archive_members, get_file_size, get_file_stat, split_archive_path
+from cache import get_file_identity
+from utils import get_binary_file_object, get_files
+
+
+class ArchivesTest(TestCase):
+
+    def setUp(self):
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.data_path = os.path.join(dir_path, 'general_files')
+        self.tmp_path = tempfile.mkdtemp()
+        self.archive = os.path.join(self.tmp_path, '2018-10.zip')
+        with zipfile.ZipFile(self.archive, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.write(os.path.join(self.data_path, '2018-10-01.general'), '2018-10-02.general')
+            zip_file.write(os.path.join(self.data_path, '2018-10-01.general.gz'), 'days/2018-10-01.general.gz')
+            zip_file.writestr('README.txt', 'other file')
+        shutil.copy(os.path.join(self.data_path, '2018-10-01.general.zip'), self.tmp_path)
+        self.member = os.path.join(self.archive, '2018-10-02.general')
+        self.gz_member = os.path.join(self.archive, 'days', '2018-10-01.general.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_split_archive_path(self):
+        self.assertEqual((self.archive, 'days/2018-10-01.general.gz'), split_archive_path(self.gz_member))
+        self.assertIsNone(split_archive_path(self.archive))
+        self.assertIsNone(split_archive_path(os.path.join(self.tmp_path, 'other.zip', 'file')))
+
+    def test_get_archive_members(self):
+        self.assertEqual([self.member, self.gz_member], get_archive_members(self.archive, ['*general', '*general.gz']))
+
+    def test_get_files(self):
+        expected = [os.path.join(self.tmp_path, '2018-10-01.general.zip'), self.gz_member, self.member]
+        self.assertEqual(expected, get_files('general', self.tmp_path))
+
+    def test_get_binary_file_object(self):
+        with open(os.path.join(self.data_path, '2018-10-01.general'), 'rb') as f:
+            data = f.read()
+        for file_path in [self.member, self.gz_member]:
+            with get_binary_file_object(file_path) as f:
+                self.assertEqual(data.rstrip().splitlines(), f.read().rstrip().splitlines())
+
+    def test_file_stat(self):
+        self.assertEqual(os.path.getsize(os.path.join(self.data_path, '2018-10-01.general')),
+                         get_file_stat(self.member)[0])
+        self.assertLess(get_file_size(self.member), get_file_stat(self.member)[0])
+        self.assertNotEqual(get_file_identity(self.member), get_file_identity(self.gz_member))
+        self.assertNotEqual(get_file_identity(self.member, True), get_file_identity(self.gz_member, True))
@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from cache import DayCache
+
+
+class DayCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.cache_path, '2020-03-01.viajes')
+        with open(self.file_path, 'w') as f:
+            f.write('data')
+        self.cache = DayCache(os.path.join(self.cache_path, 'cache'), 'version')
+
+    def test_get_missing(self):
+        self.assertNotIn(self.file_path, self.cache)
+        self.assertIsNone(self.cache.get(self.file_path))
+
+    def test_set(self):
+        self.cache.set(self.file_path, ({'Santiago': 1.0}, {'error'}))
+        self.assertIn(self.file_path, self.cache)
+        self.assertEqual(({'Santiago': 1.0}, {'error'}), self.cache.get(self.file_path))
+
+    def test_changed_file(self):
+        self.cache.set(self.file_path, 'result')
+        with open(self.file_path, 'a') as f:
+            f.write('new data')
+        self.assertIsNone(self.cache.get(self.file_path))
+
+    def test_changed_version(self):
+        self.cache.set(self.file_path, 'result')
+        cache = DayCache(self.cache.cache_path, 'new version')
+        self.assertIsNone(cache.get(self.file_path))
+
+    def test_use_hash(self):
+        cache = DayCache(self.cache.cache_path, 'version', use_hash=True)
+        cache.set(self.file_path, 'result')
+        os.utime(self.file_path, (0, 0))
+        self.assertEqual('result', cache.get(self.file_path))
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_path)
@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+from communes import CommuneResolver, get_commune_resolver
+
+
+class CommuneResolverTest(TestCase):
+
+    def setUp(self):
+        self.resolver = CommuneResolver({'Estacion Lo Espejo': 'Lo Espejo'})
+
+    def test_commune(self):
+        self.assertEqual('San Miguel', self.resolver.commune('SAN MIGUEL '))
+        self.assertEqual('Ñuñoa', self.resolver.commune('NUNOA'))
+        self.assertIsNone(self.resolver.commune('-'))
+        self.assertIsNone(self.resolver.commune(' '))
+
+    def test_location(self):
+        self.assertEqual('Lo Espejo', self.resolver.location('ESTACION LO ESPEJO'))
+        self.assertIsNone(self.resolver.location('EXAMPLE_WITH_NO_COMMUNE'))
+        self.assertEqual('Example_With_No_Commune', self.resolver.location_name('EXAMPLE_WITH_NO_COMMUNE'))
+
+    def test_location_is_cached(self):
+        self.resolver.location('EXAMPLE_WITH_NO_COMMUNE')
+        self.resolver.extra_location_communes['Example_With_No_Commune'] = 'Santiago'
+        self.assertIsNone(self.resolver.location('EXAMPLE_WITH_NO_COMMUNE'))
+
+    def test_get_commune_resolver(self):
+        resolver = get_commune_resolver()
+        self.assertIs(resolver, get_commune_resolver())
+        self.assertEqual('San Bernardo', resolver.location('ESTACION SAN BERNARDO'))
+
+    def test_extra_locations(self):
+        # trips without commune fields take communes of their boarding and alighting stations
+        resolver = get_commune_resolver()
+        self.assertEqual('San Bernardo', resolver.location(b'ESTACION SAN BERNARDO'))
+        self.assertEqual('Lo Espejo', resolver.location(b'ESTACION LO ESPEJO'))
+        self.assertIsNone(resolver.location(b'EXAMPLE_WITH_NO_COMMUNE'))
+        self.assertEqual('Example_With_No_Commune', resolver.location_name(b'EXAMPLE_WITH_NO_COMMUNE'))
@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from unittest import TestCase, mock
+
+from aggregators import AGGREGATIONS, AGGREGATORS, ODAggregator, SampledAggregator, get_aggregators
+from compact import aggregate_compact_data, compact_viajes_file, compact_viajes_files, get_compact_path, \
+    is_compact_file, is_compact_updated
+from generate_synthetic_data import generate_data
+from process_viajes_data import aggregate_viajes_data, main
+from utils import get_files
+
+
+class CompactTest(TestCase):
+    def setUp(self):
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.data_path = os.path.join(dir_path, 'viajes_files')
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def assertSameResults(self, expected, results):
+        self.assertEqual(len(expected), len(results))
+        for expected_result, result in zip(expected, results):
+            self.assertEqual(sorted(expected_result, key=str), sorted(result, key=str))
+            for group in expected_result:
+                self.assertEqual(list(expected_result[group].rows()), list(result[group].rows()))
+
+    def test_get_compact_path(self):
+        compact_path = get_compact_path(os.path.join(self.data_path, '2020-03-01.viajes.gz'), self.tmp_path)
+        self.assertEqual(os.path.join(self.tmp_path, '2020-03-01.viajes.gz.npz'), compact_path)
+        self.assertTrue(is_compact_file(compact_path))
+        self.assertFalse(is_compact_file(os.path.join(self.data_path, '2020-03-01.viajes.gz')))
+
+    def test_aggregate_compact_data(self):
+        aggregators = get_aggregators(AGGREGATIONS)
+        for name in ['2020-03-01.viajes', '2020-03-01.viajes.gz', '2020-03-01.viajes.zip']:
+            file_path = os.path.join(self.data_path, name)
+            expected, expected_errors = aggregate_viajes_data(file_path, aggregators)
+            results, errors = aggregate_viajes_data(compact_viajes_file(file_path, self.tmp_path), aggregators)
+            self.assertSameResults(expected, results)
+            self.assertEqual(expected_errors, errors)
+
+    def test_aggregate_synthetic_data(self):
+        input_path = os.path.join(self.tmp_path, 'inputs')
+        generate_data(input_path, datetime(2020, 3, 1), 1, 5000, formats=('gz',))
+        file_path = os.path.join(input_path, '2020-03-01.viajes.gz')
+        aggregators = get_aggregators(AGGREGATIONS)
+        expected, expected_errors = aggregate_viajes_data(file_path, aggregators)
+        results, errors = aggregate_compact_data(compact_viajes_file(file_path, self.tmp_path), aggregators)
+        self.assertSameResults(expected, results)
+        self.assertEqual(expected_errors, errors)
+
+    def test_aggregate_empty_file(self):
+        for name in ['2020-nodata.viajes', '2020-nodata.viajes.gz', '2020-nodata.viajes.zip']:
+            compact_path = compact_viajes_file(os.path.join(self.data_path, name), self.tmp_path)
+            self.assertEqual((None, set()), aggregate_compact_data(compact_path, [AGGREGATORS['commune']]))
+
+    def test_column_not_in_compact_file(self):
+        compact_path = compact_viajes_file(os.path.join(self.data_path, '2020-03-01.viajes'), self.tmp_path)
+        aggregator = ODAggregator('viajesPorContrato', 'Comuna_origen', 'Comuna_destino', group_header='Contrato',
+                                  group_column=22)
+        with self.assertRaises(ValueError):
+            aggregate_compact_data(compact_path, [aggregator])
+
+    def test_sampled_compact_file(self):
+        compact_path = compact_viajes_file(os.path.join(self.data_path, '2020-03-01.viajes'), self.tmp_path)
+        with self.assertRaises(ValueError):
+            aggregate_viajes_data(compact_path, [SampledAggregator(AGGREGATORS['commune'], 0.5)])
+
+    def test_main_with_sample_rate(self):
+        compact_viajes_file(os.path.join(self.data_path, '2020-03-01.viajes'), self.tmp_path)
+        with mock.patch('argparse.ArgumentParser.error', side_effect=SystemExit) as error:
+            with self.assertRaises(SystemExit):
+                main(['process_viajes_data', self.tmp_path, '--output', self.tmp_path, '--sample-rate', '0.5'])
+        error.assert_called_once_with('--sample-rate can not be used with compact files')
+
+    def test_compact_files_of_the_same_day(self):
+        input_path = os.path.join(self.tmp_path, 'inputs')
+        os.makedirs(input_path)
+        for name in ['2020-03-01.viajes', '2020-03-01.viajes.gz']:
+            shutil.copy(os.path.join(self.data_path, name), input_path)
+        compact_path = os.path.join(self.tmp_path, 'compact')
+        files_path = get_files('viajes', input_path)
+        compact_files = compact_viajes_files(files_path, compact_path)
+        self.assertEqual(2, len(set(compact_files)))
+        self.assertTrue(all(is_compact_updated(file_path, compact_path) for file_path in files_path))
+        self.assertEqual(sorted(compact_files), sorted(get_files('viajes', compact_path)))
+        outputs = []
+        for path in [input_path, compact_path]:
+            output_path = os.path.join(self.tmp_path, 'output-{0}'.format(len(outputs)))
+            os.makedirs(output_path)
+            main(['process_viajes_data', path, '--output', output_path, '--aggregations'] + AGGREGATIONS)
+            outputs.append(output_path)
+        self.assertEqual(len(AGGREGATIONS), len(os.listdir(outputs[0])))
+        for file_name in os.listdir(outputs[0]):
+            with open(os.path.join(outputs[0], file_name), 'rb') as expected, \
+                    open(os.path.join(outputs[1], file_name), 'rb') as output:
+                self.assertEqual(expected.read(), output.read())
+
+    def test_compact_viajes_files_skips_updated_files(self):
+        file_path = os.path.join(self.tmp_path, '2020-03-01.viajes')
+        shutil.copy(os.path.join(self.data_path, '2020-03-01.viajes'), file_path)
+        output_path = os.path.join(self.tmp_path, 'compact')
+        self.assertFalse(is_compact_updated(file_path, output_path))
+        self.assertEqual([get_compact_path(file_path, output_path)], compact_viajes_files([file_path], output_path))
+        self.assertTrue(is_compact_updated(file_path, output_path))
+        # file changed after it was compacted
+        mtime = time.time() + 10
+        os.utime(file_path, (mtime, mtime))
+        self.assertFalse(is_compact_updated(file_path, output_path))
+
+    def test_main_with_compact_files(self):
+        input_path = os.path.join(self.tmp_path, 'inputs')
+        compact_path = os.path.join(self.tmp_path, 'compact')
+        generate_data(input_path, datetime(2020, 3, 1), 3, 300, formats=('gz',))
+        main(['process_viajes_data', 'compact', input_path, '--output', compact_path, '--lower-bound', '2020-03-02',
+              '--upper-bound', '2020-03-03'])
+        self.assertEqual(['2020-03-02.viajes.gz.npz', '2020-03-03.viajes.gz.npz'], sorted(os.listdir(compact_path)))
+        aggregations = ['--aggregations'] + AGGREGATIONS
+        outputs = []
+        for path in [input_path, compact_path]:
+            output_path = os.path.join(self.tmp_path, 'output-{0}'.format(len(outputs)))
+            os.makedirs(output_path)
+            main(['process_viajes_data', path, '--output', output_path, '--lower-bound', '2020-03-02',
+                  '--upper-bound', '2020-03-03'] + aggregations)
+            outputs.append(output_path)
+        self.assertEqual(len(AGGREGATIONS), len(os.listdir(outputs[0])))
+        for file_name in os.listdir(outputs[0]):
+            with open(os.path.join(outputs[0], file_name), 'rb') as expected, \
+                    open(os.path.join(outputs[1], file_name), 'rb') as output:
+                self.assertEqual(expected.read(), output.read())
@@ -0,0 +1,54 @@
+import os
+import random
+import shutil
+import tempfile
+from unittest import TestCase
+
+from external_sort import ExternalSorter, read_run, write_run
+
+
+class ExternalSorterTest(TestCase):
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_write_and_read_run(self):
+        file_path = os.path.join(self.tmp_path, 'run')
+        rows = [['2020-03-01', str(i), 1.5] for i in range(10000)]
+        write_run(rows, file_path)
+        self.assertEqual(rows, list(read_run(file_path)))
+
+    def test_rows_are_sorted(self):
+        rows = [['2020-03-0{0}'.format(day), str(i), float(i)] for day in range(1, 6) for i in range(100)]
+        random.seed(1)
+        random.shuffle(rows)
+        with ExternalSorter(self.tmp_path) as sorter:
+            for start in range(0, len(rows), 50):
+                sorter.add(rows[start:start + 50])
+            self.assertEqual(10, sorter.runs)
+            self.assertEqual(sorted(rows), list(sorter))
+        self.assertEqual([], os.listdir(self.tmp_path))
+
+    def test_batches_in_order_are_not_merged(self):
+        with ExternalSorter(self.tmp_path) as sorter:
+            sorter.add([['2020-03-01', 'b'], ['2020-03-01', 'a']])
+            sorter.add([['2020-03-03', 'a']])
+            sorter.add([['2020-03-02', 'a']])
+            sorter.add([])
+            sorter.add([['2020-03-04', 'a']])
+            self.assertEqual(2, len(sorter.sequences))
+            self.assertEqual([['2020-03-01', 'a'], ['2020-03-01', 'b'], ['2020-03-02', 'a'], ['2020-03-03', 'a'],
+                              ['2020-03-04', 'a']], list(sorter))
+
+    def test_merge_passes(self):
+        rows = [[(day * 5) % 7, i] for day in range(20) for i in range(3)]
+        with ExternalSorter(self.tmp_path, fan_in=3) as sorter:
+            for day in range(20):
+                sorter.add([[(day * 5) % 7, i] for i in range(3)])
+            self.assertEqual(sorted(rows), list(sorter))
+            self.assertLessEqual(len(sorter.sequences), 3)
+            # rows added after a merge pass are sorted too
+            sorter.add([[0, 3]])
+            self.assertEqual(sorted(rows + [[0, 3]]), list(sorter))
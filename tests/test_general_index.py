@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest import TestCase, mock
+
+from general_index import GeneralIndex
+from process_general_data import process_general_data
+
+
+class GeneralIndexTest(TestCase):
+    def setUp(self):
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = []
+        for name in ['2018-10-01.general', '2018-10-01.general.gz', '2018-nodata.general']:
+            file_path = os.path.join(self.tmp_dir, name)
+            shutil.copy(os.path.join(dir_path, 'general_files', name), file_path)
+            self.files.append(file_path)
+        self.index_path = os.path.join(self.tmp_dir, 'index.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_update_and_get_rows(self):
+        index = GeneralIndex(self.index_path)
+        index.update(self.files, process_general_data)
+        self.assertEqual([['2018-10-01', '5930344'], ['2018-10-01', '5930344']], index.get_rows(self.files))
+        self.assertEqual([['2018-10-01', '5930344']], index.get_rows(self.files[:1]))
+        index.close()
+
+    def test_unchanged_files_are_not_read_again(self):
+        index = GeneralIndex(self.index_path)
+        index.update(self.files, process_general_data)
+        index.close()
+        index = GeneralIndex(self.index_path)
+        process = mock.MagicMock()
+        index.update(self.files, process)
+        process.assert_not_called()
+        os.utime(self.files[0], ns=(0, 0))
+        process.return_value = ['2018-10-02', '1']
+        index.update(self.files, process)
+        process.assert_called_once_with(self.files[0])
+        self.assertEqual([['2018-10-01', '5930344'], ['2018-10-02', '1']], index.get_rows(self.files))
+        index.close()
+
+    def test_files_outside_bounds_are_not_read(self):
+        index = GeneralIndex(self.index_path)
+        index.update(self.files, process_general_data)
+        for file_path in self.files:
+            os.utime(file_path, ns=(0, 0))
+        process = mock.MagicMock(return_value=None)
+        lower_bound, upper_bound = datetime(2019, 1, 1), datetime(2019, 12, 31)
+        index.update(self.files, process, lower_bound, upper_bound)
+        # only the empty file has no date to prune it
+        process.assert_called_once_with(self.files[2])
+        self.assertEqual([], index.get_rows(self.files, lower_bound, upper_bound))
+        self.assertEqual(2, len(index.get_rows(self.files, datetime(2018, 10, 1), datetime(2018, 10, 1))))
+        index.close()
@@ -0,0 +1,53 @@
+import logging
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from generate_synthetic_data import generate_data, main
+from process_general_data import process_general_data
+from process_viajes_data import process_viajes_data
+from run_benchmarks import run_benchmarks
+from utils import get_files, valid_date
+
+
+class GenerateSyntheticDataTest(TestCase):
+
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        logging.disable(logging.CRITICAL)
+
+    def test_generate_data(self):
+        files = generate_data(self.output, valid_date('2020-03-01'), 2, 1000, ['plain', 'gz', 'zip'],
+                              missing_share=0.2)
+        self.assertEqual(12, len(files))
+        self.assertEqual(6, len(get_files('viajes', self.output)))
+        results = [process_viajes_data(file_path) for file_path in get_files('viajes', self.output)[:3]]
+        for od_matrix, errors in results:
+            self.assertEqual(results[0][0].to_dict(), od_matrix.to_dict())
+            self.assertEqual(results[0][1], errors)
+        self.assertTrue(results[0][1])
+        self.assertEqual(['2020-03-02', '1000'], process_general_data(get_files('general', self.output)[-1]))
+
+    def test_generate_data_is_deterministic(self):
+        generate_data(self.output, valid_date('2020-03-01'), 1, 100)
+        with open(os.path.join(self.output, '2020-03-01.viajes'), 'rb') as f:
+            data = f.read()
+        generate_data(self.output, valid_date('2020-03-01'), 1, 100)
+        with open(os.path.join(self.output, '2020-03-01.viajes'), 'rb') as f:
+            self.assertEqual(data, f.read())
+
+    def test_main_with_invalid_missing_share(self):
+        with self.assertRaises(SystemExit):
+            main(['generate_synthetic_data', self.output, '--missing-share', '2'])
+
+    def test_run_benchmarks(self):
+        generate_data(self.output, valid_date('2020-03-01'), 1, 100, ['plain', 'gz'])
+        results = run_benchmarks(self.output, 100, names=['process_general_data'])
+        self.assertEqual(['plain', 'gz'], [result['format'] for result in results])
+        self.assertEqual(1, results[0]['rows'])
+        self.assertTrue(results[0]['peak_rss_mb'] > 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+        logging.disable(logging.NOTSET)
@@ -0,0 +1,47 @@
+import gzip
+import io
+from unittest import TestCase, skipIf
+
+from gzip_backends import ParallelGzipWriter, get_gzip_backend, igzip, open_gzip_reader, open_gzip_writer
+
+
+class GzipBackendsTest(TestCase):
+
+    def setUp(self):
+        self.data = b''.join(b'2020-03-01,Santiago,Recoleta,%d\r\n' % i for i in range(50000))
+
+    def test_get_gzip_backend(self):
+        self.assertEqual('stdlib', get_gzip_backend('stdlib').name)
+        self.assertIsNotNone(get_gzip_backend().gzip)
+
+    @skipIf(igzip is not None, 'isal is installed')
+    def test_get_missing_gzip_backend(self):
+        with self.assertRaises(ValueError):
+            get_gzip_backend('isal')
+
+    def test_parallel_gzip_writer(self):
+        outputs = []
+        for _ in range(2):
+            raw = io.BytesIO()
+            with ParallelGzipWriter(raw, 'test.csv', threads=3, block_size=100000) as f:
+                for i in range(0, len(self.data), 777):
+                    f.write(self.data[i:i + 777])
+            outputs.append(raw.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertIn(b'test.csv\x00', outputs[0][:32])
+        self.assertEqual(self.data, gzip.decompress(outputs[0]))
+        self.assertEqual(self.data, open_gzip_reader(io.BytesIO(outputs[0])).read())
+        # gzip member per block
+        self.assertEqual(len(self.data) // 100000 + 1, outputs[0].count(b'\x1f\x8b\x08'))
+
+    def test_parallel_gzip_writer_empty(self):
+        raw = io.BytesIO()
+        ParallelGzipWriter(raw, threads=2).close()
+        self.assertEqual(b'', gzip.decompress(raw.getvalue()))
+
+    def test_open_gzip_writer(self):
+        for threads in [1, 2]:
+            raw = io.BytesIO()
+            with open_gzip_writer(raw, 'test.csv', compression_level=6, backend='stdlib', threads=threads) as f:
+                f.write(self.data)
+            self.assertEqual(self.data, gzip.decompress(raw.getvalue()))
@@ -0,0 +1,50 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from metrics import METRICS, Metrics, collect_metrics
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_stage(self):
+        with self.metrics.stage('parse', 'file', rows=0) as record:
+            record['rows'] += 10
+        self.assertEqual(1, len(self.metrics.records))
+        self.assertEqual('parse', self.metrics.records[0]['stage'])
+        self.assertEqual(10, self.metrics.records[0]['rows'])
+        self.assertTrue(self.metrics.records[0]['seconds'] >= 0)
+
+    def test_summary(self):
+        self.metrics.add('parse', 'file_1', rows=10, seconds=1.0)
+        self.metrics.add('parse', 'file_2', rows=5, seconds=0.5)
+        self.metrics.add('write', 'output', rows=2, seconds=0.25)
+        expected = {'parse': {'files': 2, 'rows': 15, 'seconds': 1.5},
+                    'write': {'files': 1, 'rows': 2, 'seconds': 0.25}}
+        self.assertEqual(expected, json.loads(json.dumps(self.metrics.summary())))
+
+    def test_pop(self):
+        self.metrics.add('parse', 'file_1', rows=10)
+        self.metrics.add('parse', 'file_2', rows=5)
+        self.metrics.add('write', 'output', rows=2)
+        records = self.metrics.pop(1)
+        self.assertEqual(['file_2', 'output'], [record['file'] for record in records])
+        self.assertEqual(['file_1'], [record['file'] for record in self.metrics.records])
+
+    def test_collect_metrics(self):
+        tmp_path = tempfile.mkdtemp()
+        metrics_json = os.path.join(tmp_path, 'metrics.json')
+        profile = os.path.join(tmp_path, 'profile.prof')
+        try:
+            with collect_metrics(metrics_json, profile):
+                METRICS.add('parse', 'file', rows=1)
+            with open(metrics_json) as f:
+                self.assertEqual({'files': 1, 'rows': 1}, json.load(f)['stages']['parse'])
+            self.assertTrue(os.path.exists(profile))
+        finally:
+            shutil.rmtree(tmp_path)
@@ -0,0 +1,76 @@
+import pickle
+from unittest import TestCase
+
+from od_matrix import INITIAL_SIZE, CommuneIndex, ODMatrix
+
+
+class ODMatrixTest(TestCase):
+
+    def setUp(self):
+        self.od_matrix = ODMatrix()
+        self.santiago = self.od_matrix.commune_id('Santiago')
+        self.recoleta = self.od_matrix.commune_id('Recoleta')
+
+    def test_commune_id(self):
+        self.assertEqual(0, self.santiago)
+        self.assertEqual(1, self.recoleta)
+        self.assertEqual(0, self.od_matrix.commune_id('Santiago'))
+
+    def test_add(self):
+        self.od_matrix.add([self.santiago, self.recoleta, self.santiago], [self.recoleta, self.recoleta, self.recoleta],
+                           [1.5, 0.0, 2.25])
+        expected = {'Santiago': {'Recoleta': 3.75}, 'Recoleta': {'Recoleta': 0.0}}
+        self.assertEqual(expected, self.od_matrix.to_dict())
+        self.assertEqual(2, len(self.od_matrix))
+
+    def test_empty(self):
+        self.assertFalse(self.od_matrix)
+        self.assertEqual([], list(self.od_matrix.rows()))
+
+    def test_resize(self):
+        communes = ['commune {0}'.format(i) for i in range(INITIAL_SIZE + 1)]
+        od_matrix = ODMatrix(communes)
+        od_matrix.add([INITIAL_SIZE], [0], [1.0])
+        self.assertEqual([('commune {0}'.format(INITIAL_SIZE), 'commune 0', 1.0)], list(od_matrix.rows()))
+
+    def test_merge(self):
+        self.od_matrix.add([self.santiago], [self.recoleta], [1.5])
+        other = ODMatrix(['Ñuñoa', 'Santiago', 'Recoleta'])
+        other.add([1, 0], [2, 1], [1.0, 2.0])
+        self.od_matrix += other
+        expected = {'Santiago': {'Recoleta': 2.5}, 'Ñuñoa': {'Santiago': 2.0}}
+        self.assertEqual(expected, self.od_matrix.to_dict())
+
+    def test_add_codes(self):
+        names = ['Maipú', 'Santiago', 'Ñuñoa', 'Recoleta']
+        od_matrix = ODMatrix()
+        od_matrix.add_codes(names, [2, 1, 2], [0, 2, 0], [1.0, 2.0, 0.5])
+        # communes get ids in order of first appearance
+        self.assertEqual(['Ñuñoa', 'Maipú', 'Santiago'], od_matrix.communes)
+        self.assertEqual([('Ñuñoa', 'Maipú', 1.5), ('Santiago', 'Ñuñoa', 2.0)], list(od_matrix.rows()))
+
+    def test_pickle(self):
+        communes = ['zone {0}'.format(i) for i in range(INITIAL_SIZE * 2)]
+        od_matrix = ODMatrix(communes)
+        od_matrix.add([100, 3, 100], [5, 100, 5], [1.0, 0.0, 2.5])
+        data = pickle.dumps(od_matrix, pickle.HIGHEST_PROTOCOL)
+        # only visited cells are pickled
+        self.assertLess(len(data), od_matrix.visited.nbytes)
+        other = pickle.loads(data)
+        self.assertEqual(communes, other.communes)
+        self.assertEqual(list(od_matrix.rows()), list(other.rows()))
+        other.add([other.commune_id('Santiago')], [0], [1.0])
+        self.assertEqual(3, len(other))
+
+
+class CommuneIndexTest(TestCase):
+
+    def test_intern_codes(self):
+        index = CommuneIndex()
+        index.commune_id('Santiago')
+        ids = index.intern_codes(['Maipú', 'Santiago', 'Ñuñoa', 'Recoleta'], [2, 1], [0, 2])
+        # columns are interleaved, destination of first trip appears before origin of second trip
+        self.assertEqual(['Santiago', 'Ñuñoa', 'Maipú'], index.communes)
+        self.assertEqual([2, 0, 1], ids[:3].tolist())
+        index.intern_codes(['Recoleta'], [])
+        self.assertEqual(3, len(index.communes))
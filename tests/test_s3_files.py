@@ -0,0 +1,93 @@
+import gzip
+import io
+import os
+import zipfile
+from unittest import TestCase
+
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+
+import s3_files
+from aws import S3RangeReader
+from cache import get_file_identity
+from process_viajes_data import process_viajes_data
+from s3_files import get_s3_file_stat, is_s3_path, list_s3_files, split_s3_path
+from utils import get_binary_file_object, get_files, get_input_files
+
+
+class S3PathTest(TestCase):
+    def test_is_s3_path(self):
+        self.assertTrue(is_s3_path('s3://bucket/prefix'))
+        self.assertFalse(is_s3_path('/tmp/s3://bucket'))
+
+    def test_split_s3_path(self):
+        self.assertEqual(('bucket', 'a/b/2020-03-01.viajes'), split_s3_path('s3://bucket/a/b/2020-03-01.viajes'))
+        self.assertEqual(('bucket', ''), split_s3_path('s3://bucket'))
+
+
+@mock_aws()
+class S3FilesTest(TestCase):
+    def setUp(self):
+        s3_files._sessions.clear()
+        s3_files._object_stats.clear()
+        self.session = s3_files.get_s3_session()
+        self.session.s3.create_bucket(Bucket='bucket')
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.file_path = os.path.join(dir_path, 'viajes_files', '2020-03-01.viajes')
+        with open(self.file_path, 'rb') as f:
+            self.data = f.read()
+        self.put_object('inputs/2020-03-01.viajes', self.data)
+        self.put_object('inputs/2020-03-02.viajes.gz', gzip.compress(self.data))
+        zip_data = io.BytesIO()
+        with zipfile.ZipFile(zip_data, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr('2020-03-03.viajes', self.data)
+        self.put_object('inputs/2020-03-03.viajes.zip', zip_data.getvalue())
+        self.put_object('inputs/2020-03-01.general', b'')
+        self.put_object('inputs/old/2019-03-01.viajes', self.data)
+        self.put_object('inputs2/2019-03-02.viajes', self.data)
+
+    def put_object(self, key, data):
+        self.session.s3.Object('bucket', key).put(Body=data)
+
+    def test_get_files(self):
+        expected = ['s3://bucket/inputs/2020-03-01.viajes', 's3://bucket/inputs/2020-03-02.viajes.gz',
+                    's3://bucket/inputs/2020-03-03.viajes.zip']
+        self.assertEqual(expected, get_files('viajes', 's3://bucket/inputs'))
+        self.assertEqual(expected, get_files('viajes', 's3://bucket/inputs/'))
+        self.assertEqual(expected[1:2], get_input_files('viajes', [expected[1]]))
+        self.assertEqual(['s3://bucket/inputs/2020-03-01.general'], list_s3_files('s3://bucket/inputs', ['*general']))
+
+    def test_get_binary_file_object(self):
+        for file_path in get_files('viajes', 's3://bucket/inputs'):
+            with get_binary_file_object(file_path) as f:
+                self.assertEqual(self.data, f.read())
+
+    def test_file_stat(self):
+        file_path = 's3://bucket/inputs/2020-03-01.viajes'
+        get_files('viajes', 's3://bucket/inputs')
+        size, mtime_ns = get_s3_file_stat(file_path)
+        s3_files._object_stats.clear()
+        self.assertEqual((len(self.data), mtime_ns), get_s3_file_stat(file_path))
+        self.assertEqual([file_path, size, mtime_ns], get_file_identity(file_path))
+        self.assertEqual([self.session.get_etag('inputs/2020-03-01.viajes', 'bucket')],
+                         get_file_identity(file_path, use_hash=True))
+
+    def test_process_viajes_data(self):
+        expected, errors = process_viajes_data(self.file_path)
+        for file_path in get_files('viajes', 's3://bucket/inputs'):
+            od_matrix, s3_errors = process_viajes_data(file_path)
+            self.assertEqual(expected.to_dict(), od_matrix.to_dict())
+            self.assertEqual(errors, s3_errors)
+
+    def test_range_reader(self):
+        client = self.session.s3.meta.client
+        reader = S3RangeReader(client, 'inputs/2020-03-01.viajes', 'bucket', len(self.data), range_size=100)
+        with io.BufferedReader(reader, 30) as f:
+            self.assertEqual(self.data, f.read())
+            self.assertEqual((len(self.data) + 99) // 100, reader.requests)
+            f.seek(-10, io.SEEK_END)
+            self.assertEqual(self.data[-10:], f.read())
+            f.seek(150)
+            self.assertEqual(self.data[150:170], f.read(20))
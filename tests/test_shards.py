@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+from generate_synthetic_data import generate_data
+from process_viajes_data import main
+from shards import check_manifests, get_shard_files, valid_shard
+
+
+class ShardsTest(TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.input = os.path.join(self.tmp_path, 'input')
+        generate_data(self.input, datetime(2020, 3, 1), 5, 300, formats=('plain', 'gz'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_valid_shard(self):
+        self.assertEqual((2, 4), valid_shard('2/4'))
+        for shard in ['0/4', '5/4', '1', 'a/b']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                valid_shard(shard)
+
+    def test_get_shard_files(self):
+        files = list(range(10))
+        shards = [get_shard_files(files, (i, 3)) for i in range(1, 4)]
+        self.assertEqual(files, sum(shards, []))
+        self.assertEqual([], get_shard_files([1], (1, 2)))
+
+    def test_check_manifests(self):
+        manifest = {'files': ['a/2020-03-01.viajes'], 'outputs': {'commune': 'x'}}
+        check_manifests([manifest, {'files': ['a/2020-03-01.viajes.gz'], 'outputs': {'commune': 'y'}}])
+        with self.assertRaises(ValueError):
+            check_manifests([manifest, {'files': ['a/2020-03-01.viajes'], 'outputs': {'commune': 'y'}}])
+        with self.assertRaises(ValueError):
+            check_manifests([manifest, {'files': [], 'outputs': {'zone': 'y'}}])
+        with self.assertRaises(ValueError):
+            check_manifests([])
+
+    def test_shard_and_merge(self):
+        expected_path = os.path.join(self.tmp_path, 'expected')
+        partials_path = os.path.join(self.tmp_path, 'partials')
+        merged_path = os.path.join(self.tmp_path, 'merged')
+        for path in [expected_path, partials_path, merged_path]:
+            os.makedirs(path)
+        aggregations = ['--aggregations', 'commune', 'period']
+        main(['process_viajes_data', self.input, '--output', expected_path] + aggregations)
+        for shard in ['1/3', '2/3', '3/3']:
+            main(['process_viajes_data', self.input, '--output', partials_path, '--shard', shard] + aggregations)
+        with open(os.path.join(partials_path, 'viajes.shard-2-of-3.json')) as f:
+            self.assertEqual([2, 3], json.load(f)['shard'])
+        main(['process_viajes_data', 'merge', partials_path, '--output', merged_path])
+        self.assertEqual(sorted(os.listdir(expected_path)), sorted(os.listdir(merged_path)))
+        for file_name in os.listdir(expected_path):
+            with open(os.path.join(expected_path, file_name), 'rb') as expected, \
+                    open(os.path.join(merged_path, file_name), 'rb') as merged:
+                self.assertEqual(expected.read(), merged.read())
+
+    def test_merge_without_partials(self):
+        with self.assertRaises(SystemExit):
+            main(['process_viajes_data', 'merge', self.tmp_path])
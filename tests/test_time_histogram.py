@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+import numpy as np
+
+from time_histogram import TimeHistogram, get_bin_label, get_time_bins
+
+
+class TimeHistogramTest(TestCase):
+
+    def test_get_time_bins(self):
+        timestamps = [b'2020-03-01 00:00:00', b'2020-03-01 10:23:17', b'2020-03-01 23:59:59', b'-', b'',
+                      b'2020-03-01 24:00:00', b'2020-03-01 1a:00:00', '2020-03-01 00:15:00']
+        self.assertEqual([0, 41, 95, -1, -1, -1, -1, 1], get_time_bins(timestamps).tolist())
+        self.assertEqual([], get_time_bins([]).tolist())
+
+    def test_get_bin_label(self):
+        self.assertEqual('00:00:00', get_bin_label(0))
+        self.assertEqual('10:15:00', get_bin_label(41))
+        self.assertEqual('23:45:00', get_bin_label(95))
+
+    def test_add(self):
+        histogram = TimeHistogram()
+        santiago = histogram.commune_id('Santiago')
+        recoleta = histogram.commune_id('Recoleta')
+        histogram.add([recoleta, santiago, recoleta, santiago], [41, 0, 41, -1], [1.5, 0.0, 2.0, 5.0])
+        self.assertEqual([('Santiago', '00:00:00', 0.0), ('Recoleta', '10:15:00', 3.5)], list(histogram.rows()))
+        self.assertEqual(2, len(histogram))
+
+    def test_add_codes(self):
+        histogram = TimeHistogram()
+        histogram.add_codes(['Maipú', 'Santiago', 'Ñuñoa'], [2, 1, 2], [3, 4, 3], [1.0, 2.0, 0.5])
+        self.assertEqual(['Ñuñoa', 'Santiago'], histogram.communes)
+        self.assertEqual([('Ñuñoa', '00:45:00', 1.5), ('Santiago', '01:00:00', 2.0)], list(histogram.rows()))
+
+    def test_merge(self):
+        histogram = TimeHistogram()
+        histogram.add([histogram.commune_id('Santiago')], [1], [1.0])
+        other = TimeHistogram()
+        communes = [other.commune_id('commune {0}'.format(i)) for i in range(100)] + [other.commune_id('Santiago')]
+        other.add(communes, [2] * len(communes), np.ones(len(communes)))
+        histogram += other
+        rows = list(histogram.rows())
+        self.assertEqual([('Santiago', '00:15:00', 1.0), ('Santiago', '00:30:00', 1.0)], rows[:2])
+        self.assertEqual(102, len(histogram))
@@ -1,9 +1,15 @@
 import os
 from datetime import datetime
 from unittest import TestCase, mock
+import bz2
 import contextlib
-from io import StringIO
-from utils import get_files, send_data_to_s3, valid_date
+import lzma
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from utils import get_binary_file_object, get_byte_ranges, get_columns, get_file_object, get_files, get_upload_files, \
+    is_plain_file, open_byte_range, prefetch_files, sample_lines, send_data_to_s3, valid_date, valid_sample_rate, \
+    zstandard
 import argparse
 
 
@@ -20,13 +26,135 @@ class TestUtils(TestCase):
                                    '2019-10-nodata.general.zip']))
         self.assertEqual(expected_files, get_files('general', self.data_path))
 
+    def test_get_file_object(self):
+        with open(os.path.join(self.data_path, '2018-10-01.general'), 'rb') as f:
+            data = f.read()
+        for file_name in ['2018-10-01.general', '2018-10-01.general.gz', '2018-10-01.general.zip']:
+            with get_binary_file_object(os.path.join(self.data_path, file_name)) as f:
+                self.assertEqual(data.rstrip().splitlines(), f.read().rstrip().splitlines())
+        with get_file_object(os.path.join(self.data_path, '2018-10-01.general.gz')) as f:
+            self.assertEqual(data.decode('latin-1').splitlines()[0], f.readline().rstrip('\n'))
+
+    def test_get_file_object_other_formats(self):
+        with open(os.path.join(self.data_path, '2018-10-01.general'), 'rb') as f:
+            data = f.read()
+        compressors = {'bz2': bz2.compress, 'xz': lzma.compress}
+        if zstandard is not None:
+            compressors['zst'] = zstandard.ZstdCompressor().compress
+        tmp_path = tempfile.mkdtemp()
+        try:
+            for extension, compress in compressors.items():
+                file_path = os.path.join(tmp_path, '2018-10-01.general.{0}'.format(extension))
+                with open(file_path, 'wb') as f:
+                    f.write(compress(data))
+                with get_binary_file_object(file_path) as f:
+                    self.assertEqual(data, f.read())
+            self.assertEqual(len(compressors), len(get_files('general', tmp_path)))
+        finally:
+            shutil.rmtree(tmp_path)
+
+    def test_prefetch_files(self):
+        files = get_files('general', self.data_path)
+        for max_bytes in [1, 100, 10 ** 6]:
+            prefetched = list(prefetch_files(files, depth=2, max_bytes=max_bytes))
+            self.assertEqual(files, [file_path for file_path, _ in prefetched])
+            self.assertEqual(['2019-10-nodata.general.zip'],
+                             [os.path.basename(file_path) for file_path, f in prefetched if f is None])
+            for file_path, f in prefetched:
+                if f is None:
+                    continue
+                with get_binary_file_object(file_path) as expected:
+                    data = expected.read()
+                self.assertEqual(data, f.read())
+                self.assertEqual(len(data), f.bytes_read)
+                f.close()
+
+    def test_prefetch_files_stop(self):
+        files = get_files('general', self.data_path)
+        prefetched = prefetch_files(files, depth=3)
+        file_path, f = next(prefetched)
+        self.assertEqual(files[0], file_path)
+        f.close()
+        prefetched.close()
+
+    def test_get_byte_ranges(self):
+        file_path = os.path.join(self.data_path, '2018-10-01.general')
+        with open(file_path, 'rb') as f:
+            lines = f.read().splitlines(True)
+        for parts in [1, 2, 3, 100]:
+            byte_ranges = get_byte_ranges(file_path, parts, skip_lines=1)
+            self.assertLessEqual(len(byte_ranges), parts)
+            data = b''
+            for start, end in byte_ranges:
+                with open_byte_range(file_path, start, end) as f:
+                    range_data = f.read()
+                self.assertTrue(range_data.endswith(b'\n') or end == os.path.getsize(file_path))
+                data += range_data
+            self.assertEqual(b''.join(lines[1:]), data)
+        self.assertEqual([], get_byte_ranges(file_path, 2, skip_lines=len(lines)))
+        self.assertEqual([], get_byte_ranges(os.path.join(self.data_path, '2018-nodata.general'), 2))
+
+    def test_is_plain_file(self):
+        self.assertTrue(is_plain_file(os.path.join(self.data_path, '2018-10-01.general')))
+        self.assertFalse(is_plain_file(os.path.join(self.data_path, '2018-10-01.general.gz')))
+
+    def test_get_columns(self):
+        file_obj = BytesIO(b'a|b|c|d\r\n1|"2|x"|3|4\n5|6|7\n')
+        expected = [(b'a', b'c'), (b'1', b'3'), (b'5', b'7')]
+        self.assertEqual(expected, list(get_columns(file_obj, (0, 2))))
+
+    def test_get_columns_single_column(self):
+        file_obj = BytesIO(b'a|b|c|d\n')
+        self.assertEqual([(b'b',)], list(get_columns(file_obj, (1,))))
+
+    def test_sample_lines(self):
+        lines = [str(i).encode() + b'|a|b\n' for i in range(1000)]
+        sample = list(sample_lines(lines, 0.1))
+        self.assertTrue(50 < len(sample) < 150)
+        self.assertEqual(sample, list(sample_lines(lines, 0.1)))
+        self.assertEqual(lines, list(sample_lines(lines, 1)))
+        # lines are kept by trip id, str lines are sampled like bytes
+        self.assertEqual([line.decode() for line in sample],
+                         list(sample_lines([line.decode() for line in lines], 0.1)))
+        other_lines = [line.replace(b'|a|', b'|c|') for line in lines]
+        self.assertEqual([line.replace(b'|a|', b'|c|') for line in sample], list(sample_lines(other_lines, 0.1)))
+
+    def test_get_upload_files(self):
+        file_path = os.path.join(self.data_path, '2018-10-01.general')
+        self.assertEqual([(file_path, '2018-10-01.general')], get_upload_files(file_path))
+        tmp_path = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(tmp_path, 'output', 'year=2020', 'month=3'))
+            file_path = os.path.join(tmp_path, 'output', 'year=2020', 'month=3', 'part-0.parquet')
+            open(file_path, 'w').close()
+            expected = [(file_path, 'output/year=2020/month=3/part-0.parquet')]
+            self.assertEqual(expected, get_upload_files(os.path.join(tmp_path, 'output')))
+        finally:
+            shutil.rmtree(tmp_path)
+
     @mock.patch('utils.AWSSession')
     def test_send_to_s3_bucket_exist(self, awsession):
+        awsession.return_value.is_unchanged.return_value = False
+        file_path = os.path.join(self.data_path, '2018-10-01.general')
         temp_stdout = StringIO()
         with contextlib.redirect_stdout(temp_stdout):
-            send_data_to_s3('path', 'bucket')
+            send_data_to_s3(file_path, 'bucket')
         output = temp_stdout.getvalue().strip()
-        self.assertTrue(len(output) > 0)
+        self.assertIn('finished load of file {0}'.format(file_path), output)
+        awsession.return_value.send_file_to_bucket.assert_called_once_with(file_path, '2018-10-01.general', 'bucket',
+                                                                           callback=mock.ANY)
+
+    @mock.patch('utils.AWSSession')
+    def test_send_to_s3_unchanged_file(self, awsession):
+        awsession.return_value.is_unchanged.return_value = True
+        temp_stdout = StringIO()
+        with contextlib.redirect_stdout(temp_stdout):
+            send_data_to_s3('path', 'bucket')
+        self.assertIn('upload skipped', temp_stdout.getvalue())
+        awsession.return_value.send_file_to_bucket.assert_not_called()
+        with contextlib.redirect_stdout(StringIO()):
+            send_data_to_s3(os.path.join(self.data_path, '2018-10-01.general'), 'bucket', skip_unchanged=False)
+        awsession.return_value.send_file_to_bucket.assert_called_once()
 
     @mock.patch('utils.AWSSession')
     def test_send_to_s3_bucket_does_not_exist(self, awsession):
@@ -42,3 +170,10 @@ class TestUtils(TestCase):
         self.assertEqual(expected_date, valid_date(date))
         with self.assertRaises(argparse.ArgumentTypeError):
             valid_date('1')
+
+    def test_valid_sample_rate(self):
+        self.assertEqual(0.25, valid_sample_rate('0.25'))
+        self.assertEqual(1, valid_sample_rate('1'))
+        for value in ['0', '1.5', 'a']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                valid_sample_rate(value)
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from watch import FileWatcher, watch
+
+
+class FileWatcherTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, name, content):
+        file_path = os.path.join(self.tmp_dir, name)
+        with open(file_path, 'w') as f:
+            f.write(content)
+        return file_path
+
+    def test_files_are_ready_when_they_do_not_change(self):
+        first = self.write_file('2020-03-02.viajes', 'a')
+        watcher = FileWatcher('viajes', self.tmp_dir)
+        self.assertEqual(([], False), watcher.poll())
+        self.assertEqual(([first], True), watcher.poll())
+        self.assertEqual(([first], False), watcher.poll())
+
+        # a new file is ready after two polls
+        second = self.write_file('2020-03-01.viajes', 'a')
+        self.assertEqual(([first], False), watcher.poll())
+        self.assertEqual(([second, first], True), watcher.poll())
+
+        # a file that is being written is not ready
+        self.write_file('2020-03-02.viajes', 'ab')
+        self.assertEqual(([second], True), watcher.poll())
+        self.assertEqual(([second, first], True), watcher.poll())
+
+        os.remove(second)
+        self.assertEqual(([first], True), watcher.poll())
+
+    def test_retry(self):
+        file_path = self.write_file('2020-03-01.general', 'a')
+        watcher = FileWatcher('general', self.tmp_dir)
+        watcher.poll()
+        self.assertEqual(([file_path], True), watcher.poll())
+        watcher.retry()
+        self.assertEqual(([file_path], True), watcher.poll())
+
+
+class WatchTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, '2020-03-01.viajes')
+        with open(self.file_path, 'w') as f:
+            f.write('a')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @mock.patch('watch.time.sleep')
+    def test_watch(self, sleep):
+        callback = mock.MagicMock()
+        watch('viajes', self.tmp_dir, callback, interval=5, polls=4)
+        callback.assert_called_once_with([self.file_path])
+        sleep.assert_has_calls([mock.call(5)] * 3)
+
+    @mock.patch('watch.time.sleep')
+    def test_callback_is_called_again_after_error(self, sleep):
+        callback = mock.MagicMock(side_effect=[ValueError, None])
+        watch('viajes', self.tmp_dir, callback, interval=5, polls=4)
+        self.assertEqual([mock.call([self.file_path])] * 2, callback.call_args_list)
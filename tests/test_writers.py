@@ -0,0 +1,101 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipIf
+
+from writers import DICTIONARY, get_output_path, open_csv_writer, open_table_writer, pyarrow, zstandard
+
+
+class WritersTest(TestCase):
+
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+
+    def test_get_output_path(self):
+        self.assertEqual(os.path.join('output', 'test.gz'), get_output_path('output', 'test'))
+        self.assertEqual(os.path.join('output', 'test.zst'), get_output_path('output', 'test', 'zstd'))
+
+    def test_open_csv_writer(self):
+        with open_csv_writer(self.output, 'test', compression_level=1, buffer_size=1024) as w:
+            w.writerow(['Fecha', 'Transacciones'])
+            w.writerow(['2018-10-01', 5930344])
+        self.assertEqual(['test.gz'], os.listdir(self.output))
+        with gzip.open(os.path.join(self.output, 'test.gz'), 'rb') as f:
+            self.assertEqual(b'Fecha,Transacciones\r\n2018-10-01,5930344\r\n', f.read())
+        with open(os.path.join(self.output, 'test.gz'), 'rb') as f:
+            self.assertIn(b'test.csv\x00', f.read(32))
+
+    def test_open_csv_writer_compression_threads(self):
+        rows = [['2018-10-01', i] for i in range(100000)]
+        for compression_threads in [1, 4]:
+            with open_csv_writer(self.output, 'test', compression_threads=compression_threads) as w:
+                w.writerows(rows)
+            with gzip.open(os.path.join(self.output, 'test.gz'), 'rt') as f:
+                self.assertEqual(len(rows), len(f.read().splitlines()))
+        self.assertEqual(['test.gz'], os.listdir(self.output))
+
+    def test_open_csv_writer_error_keeps_previous_file(self):
+        with open_csv_writer(self.output, 'test') as w:
+            w.writerow(['previous'])
+        with self.assertRaises(ValueError):
+            with open_csv_writer(self.output, 'test') as w:
+                w.writerow(['new'])
+                raise ValueError
+        self.assertEqual(['test.gz'], os.listdir(self.output))
+        with gzip.open(os.path.join(self.output, 'test.gz'), 'rt') as f:
+            self.assertEqual('previous\n', f.read())
+
+    @skipIf(zstandard is None, 'zstandard is not installed')
+    def test_open_csv_writer_zstd(self):
+        with open_csv_writer(self.output, 'test', compression='zstd') as w:
+            w.writerow(['Fecha', 'Transacciones'])
+        with open(os.path.join(self.output, 'test.zst'), 'rb') as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f)
+            self.assertEqual(b'Fecha,Transacciones\r\n', reader.read())
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+
+
+@skipIf(pyarrow is None, 'pyarrow is not installed')
+class PartitionedWritersTest(TestCase):
+
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        self.header = ['Fecha', 'Comuna_origen', 'Viajes']
+        self.column_types = {'Fecha': 'date32', 'Comuna_origen': DICTIONARY}
+        self.rows = [['2020-02-29', 'Santiago', 1.0], ['2020-03-01', 'Santiago', 2.0],
+                     ['2020-03-01', 'Recoleta', 3.0]]
+
+    def test_open_table_writer_parquet(self):
+        with open_table_writer(self.output, 'test', self.header, 'parquet', self.column_types) as w:
+            w.writerows(self.rows)
+        path = os.path.join(self.output, 'test')
+        self.assertEqual(path, get_output_path(self.output, 'test', output_format='parquet'))
+        self.assertEqual(['part-0.parquet'], os.listdir(os.path.join(path, 'year=2020', 'month=3')))
+        table = pyarrow.parquet.read_table(os.path.join(path, 'year=2020', 'month=3'))
+        self.assertEqual(['Santiago', 'Recoleta'], table.column('Comuna_origen').to_pylist())
+        self.assertTrue(pyarrow.types.is_dictionary(table.schema.field('Comuna_origen').type))
+        self.assertEqual(pyarrow.date32(), table.schema.field('Fecha').type)
+        dataset = pyarrow.parquet.read_table(path, columns=['Viajes'], filters=[('month', '=', 2)])
+        self.assertEqual([1.0], dataset.column('Viajes').to_pylist())
+
+    def test_open_table_writer_arrow(self):
+        with open_table_writer(self.output, 'test', self.header, 'arrow', self.column_types) as w:
+            w.writerows(self.rows)
+        file_path = os.path.join(self.output, 'test', 'year=2020', 'month=2', 'part-0.arrow')
+        with pyarrow.ipc.open_file(file_path) as reader:
+            self.assertEqual(['Santiago'], reader.read_all().column('Comuna_origen').to_pylist())
+
+    def test_open_table_writer_replaces_output(self):
+        with open_table_writer(self.output, 'test', self.header, 'parquet', self.column_types) as w:
+            w.writerows(self.rows)
+        with open_table_writer(self.output, 'test', self.header, 'parquet', self.column_types) as w:
+            w.writerows(self.rows[:1])
+        self.assertEqual(['test'], os.listdir(self.output))
+        self.assertEqual(['year=2020'], os.listdir(os.path.join(self.output, 'test')))
+        self.assertEqual(['month=2'], os.listdir(os.path.join(self.output, 'test', 'year=2020')))
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
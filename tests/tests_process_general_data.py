@@ -2,6 +2,8 @@ import csv
 import gzip
 import logging
 import os
+import shutil
+import tempfile
 from unittest import TestCase, mock
 
 from process_general_data import process_general_data, save_csv_file, main
@@ -173,6 +175,39 @@ class ProcessGeneralDataTest(TestCase):
         save_csv_file.side_effect = None
         main(['process_general_data', 'input', '--lower-bound', '2019-10-01', '--upper-bound', '2020-01-01'])
 
+    @mock.patch('process_general_data.save_csv_file')
+    def test_main_with_index(self, save_csv_file):
+        index_path = os.path.join(self.data_path, 'index.sqlite')
+        try:
+            for _ in range(2):
+                main(['process_general_data', self.data_path, '--index', index_path, '--lower-bound', '2018-01-01',
+                      '--upper-bound', '2018-12-31'])
+                data = save_csv_file.call_args[0][0]
+                self.assertEqual([['2018-10-01', '5930344']] * 3, data)
+        finally:
+            os.remove(index_path)
+
+    @mock.patch('process_general_data.save_csv_file')
+    @mock.patch('process_general_data.watch')
+    def test_main_with_watch(self, watch, save_csv_file):
+        output_path = tempfile.mkdtemp()
+        try:
+            main(['process_general_data', self.data_path, '--watch', '10', '--output', output_path])
+            file_type, input_path, save_output, interval = watch.call_args[0]
+            self.assertEqual(('general', self.data_path, 10), (file_type, input_path, interval))
+
+            # files are read from index in output path when output is created again
+            files_path = [os.path.join(self.data_path, '2018-10-01.general')]
+            with mock.patch('process_general_data.process_general_data') as process:
+                process.return_value = ['2018-10-01', '5930344']
+                save_output(files_path)
+                save_output(files_path)
+                process.assert_called_once_with(files_path[0])
+            self.assertEqual([['2018-10-01', '5930344']], save_csv_file.call_args[0][0])
+            self.assertTrue(os.path.exists(os.path.join(output_path, 'transaccionesPorDia.sqlite')))
+        finally:
+            shutil.rmtree(output_path)
+
     def tearDown(self):
         test_gz = os.path.join(self.data_path, 'test.gz')
         if os.path.exists(test_gz):
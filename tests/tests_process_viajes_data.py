@@ -1,10 +1,23 @@
 import csv
 import gzip
+import json
 import logging
 import os
-from unittest import TestCase, mock
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import Future
+from datetime import datetime
+from unittest import TestCase, mock, skipIf
 
-from process_viajes_data import process_viajes_data, get_commune_for_extra_location, save_csv_file, main
+from cache import DayCache
+from generate_synthetic_data import generate_data
+from metrics import METRICS
+from utils import get_files
+from writers import pyarrow
+from aggregators import AGGREGATIONS, AGGREGATORS, SampledAggregator, get_aggregators
+from process_viajes_data import process_viajes_data, save_csv_file, main, \
+    aggregate_viajes_data, process_files, save_output_files
 
 
 class ProcessViajesDataTest(TestCase):
@@ -19,98 +32,81 @@ class ProcessViajesDataTest(TestCase):
         self.file_path_empty_gz = os.path.join(self.data_path, '2020-nodata.viajes.gz')
         logging.disable(logging.CRITICAL)
 
-    def test_get_commune_for_extra_location_start_station(self):
-        extra_location_row = ['43771714', '1', '1', '-', '0', '1', '507.0000', '8.4500', '8979.2012', '0.0000',
-                              'ESTACION SAN BERNARDO', 'ESTACION LO ESPEJO', '-', '-', '434', '411',
-                              '2020-03-01 15:43:08',
-                              '2020-03-01 15:51:35', '05 - MEDIODIA DOMINGO', '05 - MEDIODIA DOMINGO', 'DOMINGO',
-                              '15:30:00',
-                              '-', '1.7604', '2020-03-01 15:47:21', '05 - MEDIODIA DOMINGO', '15:30:00', 'DOMINGO',
-                              '8.4500',
-                              '0.0000', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-',
-                              '-',
-                              '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', 'METROTREN', '-', '-',
-                              '-',
-                              '-', '-', '-', '-', '-', '-', '-', '-', 'ESTACION SAN BERNARDO', '-', '-', '-',
-                              '2020-03-01 15:43:08', '-', '-', '-', '434', '-', '-', '-', 'ESTACION LO ESPEJO', '-',
-                              '-',
-                              '-', '2020-03-01 15:51:35', '-', '-', '-', '411', '-', '-', '-', 'METROTREN', '-', '-',
-                              '-',
-                              '-', '-', '-', '-', '-', '8.4500', 'M40M', 'OTROS', '-']
-
-        expected_start_commune = "San Bernardo"
-        expected_end_commune = "Lo Espejo"
-        errors, start_commune, end_commune = get_commune_for_extra_location(extra_location_row, None,
-                                                                            None)
-        self.assertIsNotNone(errors)
-        self.assertEqual(expected_start_commune, start_commune)
-        self.assertEqual(expected_end_commune, end_commune)
-
-    def test_get_commune_for_extra_location_end_station(self):
-        extra_location_row = ['43771714', '1', '1', '-', '0', '1', '507.0000', '8.4500', '8979.2012', '0.0000',
-                              'ESTACION SAN BERNARDO', 'ESTACION LO ESPEJO', '-', '-', '434', '411',
-                              '2020-03-01 15:43:08',
-                              '2020-03-01 15:51:35', '05 - MEDIODIA DOMINGO', '05 - MEDIODIA DOMINGO', 'DOMINGO',
-                              '15:30:00',
-                              '-', '1.7604', '2020-03-01 15:47:21', '05 - MEDIODIA DOMINGO', '15:30:00', 'DOMINGO',
-                              '8.4500',
-                              '0.0000', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-',
-                              '-',
-                              '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', 'METROTREN', '-', '-',
-                              '-',
-                              '-', '-', '-', '-', '-', '-', '-', '-', 'ESTACION SAN BERNARDO', '-', '-', '-',
-                              '2020-03-01 15:43:08', '-', '-', '-', '434', '-', '-', '-', 'ESTACION LO ESPEJO', '-',
-                              '-',
-                              '-', '2020-03-01 15:51:35', '-', '-', '-', '411', '-', '-', '-', 'METROTREN', '-', '-',
-                              '-',
-                              '-', '-', '-', '-', '-', '8.4500', 'M40M', 'OTROS', '-']
-
-        expected_start_commune = "San Bernardo"
-        expected_end_commune = "Lo Espejo"
-        errors, start_commune, end_commune = get_commune_for_extra_location(extra_location_row, "San Bernardo",
-                                                                            None)
-        self.assertEqual(expected_start_commune, start_commune)
-        self.assertEqual(expected_end_commune, end_commune)
-
-    def test_get_commune_for_extra_location_no_commune(self):
-        row = ['43771714', '1', '1', '-', '0', '1', '507.0000', '8.4500', '8979.2012', '0.0000',
-               'EXAMPLE_WITH_NO_COMMUNE', 'EXAMPLE_WITH_NO_COMMUNE', '-', '-', '434', '411', '2020-03-01 15:43:08',
-               '2020-03-01 15:51:35', '05 - MEDIODIA DOMINGO', '05 - MEDIODIA DOMINGO', 'DOMINGO', '15:30:00',
-               '-', '1.7604', '2020-03-01 15:47:21', '05 - MEDIODIA DOMINGO', '15:30:00', 'DOMINGO', '8.4500',
-               '0.0000', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-',
-               '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', '-', 'METROTREN', '-', '-', '-',
-               '-', '-', '-', '-', '-', '-', '-', '-', 'ESTACION SAN BERNARDO', '-', '-', '-',
-               '2020-03-01 15:43:08', '-', '-', '-', '434', '-', '-', '-', 'ESTACION LO ESPEJO', '-', '-',
-               '-', '2020-03-01 15:51:35', '-', '-', '-', '411', '-', '-', '-', 'METROTREN', '-', '-', '-',
-               '-', '-', '-', '-', '-', '8.4500', 'M40M', 'OTROS', '-']
-
-        errors, start_commune, end_commune = get_commune_for_extra_location(row, None,
-                                                                            None)
-        expected_error = {'Example_With_No_Commune'}
-        self.assertEqual(expected_error, errors)
-        self.assertIsNone(start_commune)
-        self.assertIsNone(end_commune)
-
     def test_process_viajes_data(self):
         expected_dict = {'San Miguel': {'Santiago': 1.5236},
                          'Santiago': {'San Miguel': 1.4524},
                          'Recoleta': {'Recoleta': 1.5408},
                          'Ñuñoa': {'Ñuñoa': 1.4085}}
-        self.assertEqual(expected_dict, process_viajes_data(self.file_path)[0])
+        self.assertEqual(expected_dict, process_viajes_data(self.file_path)[0].to_dict())
 
     def test_process_viajes_data_correct_gz(self):
         expected_dict = {'San Miguel': {'Santiago': 1.5236},
                          'Santiago': {'San Miguel': 1.4524},
                          'Recoleta': {'Recoleta': 1.5408},
                          'Ñuñoa': {'Ñuñoa': 1.4085}}
-        self.assertDictEqual(expected_dict, process_viajes_data(self.file_path_gz)[0])
+        self.assertDictEqual(expected_dict, process_viajes_data(self.file_path_gz)[0].to_dict())
 
     def test_process_viajes_data_correct_zip(self):
         expected_dict = {'San Miguel': {'Santiago': 1.5236},
                          'Santiago': {'San Miguel': 1.4524},
                          'Recoleta': {'Recoleta': 1.5408},
                          'Ñuñoa': {'Ñuñoa': 1.4085}}
-        self.assertDictEqual(expected_dict, process_viajes_data(self.file_path_zip)[0])
+        self.assertDictEqual(expected_dict, process_viajes_data(self.file_path_zip)[0].to_dict())
+
+    def test_process_viajes_data_csv_parser(self):
+        for file_path in [self.file_path, self.file_path_gz, self.file_path_zip]:
+            od_matrix, errors = process_viajes_data(file_path)
+            csv_od_matrix, csv_errors = process_viajes_data(file_path, parser='csv')
+            self.assertEqual(od_matrix.to_dict(), csv_od_matrix.to_dict())
+            self.assertEqual(errors, csv_errors)
+
+    def test_aggregate_viajes_data(self):
+        aggregators = [AGGREGATORS['period'], AGGREGATORS['commune']]
+        for parser in ['fast', 'csv']:
+            (period, commune), errors = aggregate_viajes_data(self.file_path_gz, aggregators, parser=parser)
+            self.assertEqual(process_viajes_data(self.file_path_gz)[0].to_dict(), commune[None].to_dict())
+            self.assertEqual({'Recoleta': {'Recoleta': 1.5408}}, period['05 - MEDIODIA DOMINGO'].to_dict())
+            self.assertEqual(4, len(period))
+            self.assertEqual(1, len(errors))
+
+    def test_aggregate_viajes_data_sampled(self):
+        expected, expected_errors = process_viajes_data(self.file_path_gz)
+        for parser in ['fast', 'csv']:
+            (result,), errors = aggregate_viajes_data(self.file_path_gz, [SampledAggregator(AGGREGATORS['commune'], 1)],
+                                                      parser=parser)
+            self.assertEqual(expected.to_dict(), result[None].estimates.to_dict())
+            self.assertEqual(expected_errors, errors)
+            (result,), _ = aggregate_viajes_data(self.file_path_gz, [SampledAggregator(AGGREGATORS['commune'], 0.5)],
+                                                 parser=parser)
+            sampled_trips = [trips for _, _, trips in result[None].estimates.rows()]
+            self.assertTrue(set(sampled_trips) <= {2 * trips for _, _, trips in expected.rows()})
+
+    def test_main_with_sample_rate(self):
+        output_path = tempfile.mkdtemp()
+        try:
+            shutil.copy(self.file_path, output_path)
+            main(['process_viajes_data', output_path, '--output', output_path, '--sample-rate', '1'])
+            with gzip.open(os.path.join(output_path, 'viajesEntreComunasEstimado.gz'), 'rt') as outfile:
+                rows = list(csv.reader(outfile))
+            self.assertEqual(['Fecha', 'Comuna_origen', 'Comuna_destino', 'N°_viajes_expandidos', 'Error_estandar'],
+                             rows[0])
+            self.assertEqual(['2020-03-01', 'Recoleta', 'Recoleta', '1.5408', '0.0'], rows[1])
+        finally:
+            shutil.rmtree(output_path)
+        for sample_rate in ['0', '2']:
+            with self.assertRaises(SystemExit):
+                main(['process_viajes_data', self.data_path, '--sample-rate', sample_rate])
+        with self.assertRaises(SystemExit):
+            main(['process_viajes_data', self.data_path, '--sample-rate', '0.1', '--shard', '1/2'])
+
+    def test_process_viajes_data_metrics(self):
+        METRICS.clear()
+        process_viajes_data(self.file_path_gz)
+        stages = METRICS.summary()
+        self.assertEqual(['decompress', 'parse', 'resolve_communes'], list(stages))
+        self.assertEqual(os.path.getsize(self.file_path_gz), stages['decompress']['bytes_in'])
+        self.assertEqual(7, stages['parse']['rows'])
+        self.assertEqual(3, stages['resolve_communes']['unresolved_rows'])
 
     def test_process_viajes_data_nodata(self):
         self.assertIsNone(process_viajes_data(self.file_path_without_data)[0])
@@ -127,9 +123,9 @@ class ProcessViajesDataTest(TestCase):
         output_filename = 'test'
         save_csv_file(data, output, output_filename)
         expected = [['Fecha', 'Comuna_origen', 'Comuna_destino', 'N°_viajes_expandidos'],
+                    ['2020-03-01', 'Recoleta', 'Recoleta', '1.5408'],
                     ['2020-03-01', 'San Miguel', 'Santiago', '1.5236'],
                     ['2020-03-01', 'Santiago', 'San Miguel', '1.4524'],
-                    ['2020-03-01', 'Recoleta', 'Recoleta', '1.5408'],
                     ['2020-03-01', 'Ñuñoa', 'Ñuñoa', '1.4085']]
         with gzip.open(os.path.join(self.data_path, output_filename) + '.gz', 'rt') as outfile:
             reader = csv.reader(outfile)
@@ -142,16 +138,172 @@ class ProcessViajesDataTest(TestCase):
         output_filename = 'test'
         save_csv_file(data, output, output_filename)
         expected = [['Fecha', 'Comuna_origen', 'Comuna_destino', 'N°_viajes_expandidos'],
+                    ['2020-03-01', 'Recoleta', 'Recoleta', '1.5408'],
                     ['2020-03-01', 'San Miguel', 'Santiago', '1.5236'],
-                    ['2020-03-01', 'Santiago', 'San Miguel', '1.4524'],
-                    ['2020-03-01', 'Recoleta', 'Recoleta', '1.5408']]
+                    ['2020-03-01', 'Santiago', 'San Miguel', '1.4524']]
         with gzip.open(os.path.join(self.data_path, output_filename) + '.gz', 'rt') as outfile:
             reader = csv.reader(outfile)
             for row in expected:
                 self.assertEqual(row, next(reader))
 
+    def test_save_csv_file_with_workers(self):
+        data = [self.file_path, self.file_path_gz, self.file_path_empty_gz, self.file_path_zip]
+        output = self.data_path
+        save_csv_file(data, output, 'test')
+        with gzip.open(os.path.join(self.data_path, 'test.gz'), 'rb') as outfile:
+            expected = outfile.read()
+        save_csv_file(data, output, 'test', workers=2)
+        with gzip.open(os.path.join(self.data_path, 'test.gz'), 'rb') as outfile:
+            self.assertEqual(expected, outfile.read())
+
+    def test_save_output_files(self):
+        output = tempfile.mkdtemp()
+        try:
+            outputs = [(AGGREGATORS['commune'], 'commune'), (AGGREGATORS['day_type'], 'day_type')]
+            save_output_files([self.file_path, self.file_path_empty_gz], output, outputs)
+            save_csv_file([self.file_path, self.file_path_empty_gz], output, 'test')
+            with gzip.open(os.path.join(output, 'commune.gz'), 'rb') as outfile, \
+                    gzip.open(os.path.join(output, 'test.gz'), 'rb') as expected:
+                self.assertEqual(expected.read(), outfile.read())
+            with gzip.open(os.path.join(output, 'day_type.gz'), 'rt') as outfile:
+                rows = list(csv.reader(outfile))
+            self.assertEqual(['Fecha', 'Tipo_dia', 'Comuna_origen', 'Comuna_destino', 'N°_viajes_expandidos'], rows[0])
+            self.assertEqual(['2020-03-01', 'DOMINGO', 'Recoleta', 'Recoleta', '1.5408'], rows[1])
+            self.assertEqual(5, len(rows))
+        finally:
+            shutil.rmtree(output)
+
+    def test_save_output_files_with_prefetch(self):
+        data = [self.file_path, self.file_path_gz, self.file_path_empty_gz, self.file_path_zip,
+                self.file_path_without_data]
+        outputs = [(AGGREGATORS['commune'], 'test')]
+        save_output_files(data, self.data_path, outputs)
+        with gzip.open(os.path.join(self.data_path, 'test.gz'), 'rb') as outfile:
+            expected = outfile.read()
+        for parser in ['fast', 'csv']:
+            save_output_files(data, self.data_path, outputs, parser=parser, prefetch=2, prefetch_size=100)
+            with gzip.open(os.path.join(self.data_path, 'test.gz'), 'rb') as outfile:
+                self.assertEqual(expected, outfile.read())
+
+    def test_save_output_files_from_archive(self):
+        tmp_path = tempfile.mkdtemp()
+        try:
+            archive = os.path.join(tmp_path, '2020-03.zip')
+            with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                zip_file.write(self.file_path, '2020-03-01.viajes')
+                zip_file.write(self.file_path_gz, '2020-03-02.viajes.gz')
+                zip_file.write(self.file_path_empty_gz, '2020-03-03.viajes.gz')
+            data = get_files('viajes', tmp_path)
+            self.assertEqual(3, len(data))
+            outputs = [(AGGREGATORS['commune'], 'test')]
+            for workers in [1, 2]:
+                save_output_files(data, tmp_path, outputs, workers=workers, prefetch=2)
+                with gzip.open(os.path.join(tmp_path, 'test.gz'), 'rt') as outfile:
+                    rows = list(csv.reader(outfile))
+                self.assertEqual(['2020-03-01', 'Recoleta', 'Recoleta', '1.5408'], rows[1])
+                self.assertEqual(['2020-03-02', 'Recoleta', 'Recoleta', '1.5408'], rows[5])
+                self.assertEqual(9, len(rows))
+        finally:
+            shutil.rmtree(tmp_path)
+
+    def test_save_output_files_sorted(self):
+        tmp_path = tempfile.mkdtemp()
+        try:
+            data = [os.path.join(tmp_path, '2020-03-02.viajes'), os.path.join(tmp_path, '2020-03-01.viajes.gz')]
+            shutil.copy(self.file_path, data[0])
+            shutil.copy(self.file_path_gz, data[1])
+            save_output_files(data, tmp_path, [(AGGREGATORS['commune'], 'test')])
+            with gzip.open(os.path.join(tmp_path, 'test.gz'), 'rt') as outfile:
+                rows = list(csv.reader(outfile))[1:]
+            self.assertEqual(8, len(rows))
+            self.assertEqual(sorted(rows), rows)
+            # temporary runs are removed
+            self.assertEqual(['2020-03-01.viajes.gz', '2020-03-02.viajes', 'test.gz'], sorted(os.listdir(tmp_path)))
+        finally:
+            shutil.rmtree(tmp_path)
+
+    def test_process_files_split_in_byte_ranges(self):
+        tmp_path = tempfile.mkdtemp()
+        try:
+            generate_data(tmp_path, datetime(2020, 3, 1), 2, 3000, formats=('plain', 'gz'))
+            data = get_files('viajes', tmp_path)
+            for aggregators in [get_aggregators(AGGREGATIONS),
+                                [SampledAggregator(AGGREGATORS[name], 0.5) for name in AGGREGATIONS]]:
+                expected = list(process_files(data, aggregators))
+                METRICS.clear()
+                results = list(process_files(data, aggregators, workers=3, split_size=1))
+                # plain files are split in three ranges
+                self.assertEqual(2 * 3 + 2, METRICS.summary()['decompress']['files'])
+                self.assertEqual([d for d, _ in expected], [d for d, _ in results])
+                for (_, (expected_results, expected_errors)), (_, (file_results, errors)) in zip(expected, results):
+                    self.assertEqual(expected_errors, errors)
+                    # matrices of byte ranges are merged, so sums can differ in the last decimals
+                    for aggregator, expected_result, result in zip(aggregators, expected_results, file_results):
+                        self.assertEqual(list(expected_result), list(result))
+                        expected_rows = list(aggregator.rows('2020-03-01', expected_result))
+                        rows = list(aggregator.rows('2020-03-01', result))
+                        self.assertEqual(len(expected_rows), len(rows))
+                        for expected_row, row in zip(expected_rows, rows):
+                            self.assertEqual([value for value in expected_row if not isinstance(value, float)],
+                                             [value for value in row if not isinstance(value, float)])
+                            for expected_value, value in zip(expected_row, row):
+                                if isinstance(value, float):
+                                    self.assertAlmostEqual(expected_value, value, places=6)
+        finally:
+            shutil.rmtree(tmp_path)
+
+    def test_process_files_cancels_pending_files(self):
+        futures = []
+
+        def submit(*args):
+            future = Future()
+            if not futures:
+                future.set_exception(ValueError('file can not be read'))
+            futures.append(future)
+            return future
+
+        data = ['2020-03-01.viajes', '2020-03-02.viajes', '2020-03-03.viajes']
+        with mock.patch('process_viajes_data.ProcessPoolExecutor') as executor:
+            executor.return_value.submit.side_effect = submit
+            with self.assertRaises(ValueError):
+                list(process_files(data, [AGGREGATORS['commune']], workers=2))
+        # files after the failed one are not processed
+        self.assertEqual([False, True, True], [future.cancelled() for future in futures])
+        executor.return_value.shutdown.assert_called_once_with()
+
+    @skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_save_csv_file_parquet(self):
+        output = tempfile.mkdtemp()
+        try:
+            save_csv_file([self.file_path], output, 'test', writer_options={'output_format': 'parquet'})
+            table = pyarrow.parquet.read_table(os.path.join(output, 'test'))
+            self.assertEqual(['Recoleta', 'San Miguel', 'Santiago', 'Ñuñoa'],
+                             table.column('Comuna_origen').to_pylist())
+            self.assertEqual([1.5408, 1.5236, 1.4524, 1.4085], table.column('N°_viajes_expandidos').to_pylist())
+        finally:
+            shutil.rmtree(output)
+
+    def test_save_csv_file_with_cache(self):
+        cache_path = tempfile.mkdtemp()
+        cache = DayCache(cache_path)
+        data = [self.file_path, self.file_path_empty_gz]
+        save_csv_file(data, self.data_path, 'test')
+        with gzip.open(os.path.join(self.data_path, 'test.gz'), 'rb') as outfile:
+            expected = outfile.read()
+        try:
+            save_csv_file(data, self.data_path, 'test', cache=cache)
+            self.assertIn(self.file_path, cache)
+            self.assertIn(self.file_path_empty_gz, cache)
+            with mock.patch('process_viajes_data.aggregate_viajes_data') as process:
+                save_csv_file(data, self.data_path, 'test', workers=2, cache=cache)
+                process.assert_not_called()
+            with gzip.open(os.path.join(self.data_path, 'test.gz'), 'rb') as outfile:
+                self.assertEqual(expected, outfile.read())
+        finally:
+            shutil.rmtree(cache_path)
+
     @mock.patch('process_viajes_data.config')
-    @mock.patch('process_viajes_data.save_csv_file')
+    @mock.patch('process_viajes_data.save_output_files')
     @mock.patch('process_viajes_data.get_files')
     @mock.patch('process_viajes_data.OUTPUT_PATH')
     @mock.patch('process_viajes_data.INPUTS_PATH')
@@ -166,7 +318,7 @@ class ProcessViajesDataTest(TestCase):
         main(['process_viajes_data', 'input'])
 
     @mock.patch('process_viajes_data.send_data_to_s3')
-    @mock.patch('process_viajes_data.save_csv_file')
+    @mock.patch('process_viajes_data.save_output_files')
     @mock.patch('process_viajes_data.process_viajes_data')
     @mock.patch('process_viajes_data.get_files')
     @mock.patch('process_viajes_data.INPUTS_PATH')
@@ -181,7 +333,7 @@ class ProcessViajesDataTest(TestCase):
         main(['process_viajes_data', 'input', '--send-to-s3'])
 
     @mock.patch('process_viajes_data.config')
-    @mock.patch('process_viajes_data.save_csv_file')
+    @mock.patch('process_viajes_data.save_output_files')
     @mock.patch('process_viajes_data.process_viajes_data')
     @mock.patch('process_viajes_data.get_files')
     @mock.patch('process_viajes_data.OUTPUT_PATH')
@@ -199,7 +351,7 @@ class ProcessViajesDataTest(TestCase):
             main(['process_viajes_data', 'input', '--lower-bound', '2020-10-10'])
 
     @mock.patch('process_viajes_data.config')
-    @mock.patch('process_viajes_data.save_csv_file')
+    @mock.patch('process_viajes_data.save_output_files')
     @mock.patch('process_viajes_data.process_viajes_data')
     @mock.patch('process_viajes_data.get_files')
     @mock.patch('process_viajes_data.OUTPUT_PATH')
@@ -217,7 +369,7 @@ class ProcessViajesDataTest(TestCase):
             main(['process_viajes_data', 'input', '--upper-bound', '2020-10-10'])
 
     @mock.patch('process_viajes_data.config')
-    @mock.patch('process_viajes_data.save_csv_file')
+    @mock.patch('process_viajes_data.save_output_files')
     @mock.patch('process_viajes_data.process_viajes_data')
     @mock.patch('process_viajes_data.get_files')
     @mock.patch('process_viajes_data.OUTPUT_PATH')
@@ -235,7 +387,15 @@ class ProcessViajesDataTest(TestCase):
             main(['process_viajes_data', 'input', '--lower-bound', '2021-10-10', '--upper-bound', '2020-10-10'])
 
     @mock.patch('process_viajes_data.config')
-    @mock.patch('process_viajes_data.save_csv_file')
+    @mock.patch('process_viajes_data.save_output_files')
+    @mock.patch('process_viajes_data.get_files')
+    def test_main_with_invalid_workers(self, get_files, save_csv_file, config):
+        get_files.return_value = [self.file_path]
+        with self.assertRaises(SystemExit):
+            main(['process_viajes_data', 'input', '--workers', '0'])
+
+    @mock.patch('process_viajes_data.config')
+    @mock.patch('process_viajes_data.save_output_files')
     @mock.patch('process_viajes_data.process_viajes_data')
     @mock.patch('process_viajes_data.get_files')
     @mock.patch('process_viajes_data.OUTPUT_PATH')
@@ -251,6 +411,48 @@ class ProcessViajesDataTest(TestCase):
         save_csv_file.side_effect = None
         main(['process_viajes_data', 'input', '--lower-bound', '2019-10-01', '--upper-bound', '2020-01-01'])
 
+    @mock.patch('process_viajes_data.save_output_files')
+    @mock.patch('process_viajes_data.watch')
+    def test_main_with_watch(self, watch, save_output_files):
+        output_path = tempfile.mkdtemp()
+        try:
+            save_output_files.return_value = set()
+            main(['process_viajes_data', self.data_path, '--watch', '--output', output_path, '--lower-bound',
+                  '2020-01-01', '--upper-bound', '2020-12-31'])
+            file_type, input_path, save_outputs, interval = watch.call_args[0]
+            self.assertEqual(('viajes', self.data_path, 60), (file_type, input_path, interval))
+            save_output_files.assert_not_called()
+
+            # outputs are created with ready files, processed days are read from cache in output path
+            save_outputs([os.path.join(self.data_path, '2019-12-31.viajes'), self.file_path])
+            data, output, outputs, _, _, _, cache = save_output_files.call_args[0][:7]
+            self.assertEqual([self.file_path], data)
+            self.assertEqual(output_path, output)
+            self.assertEqual(os.path.join(output_path, 'cache'), cache.cache_path)
+        finally:
+            shutil.rmtree(output_path)
+
+    @mock.patch('process_viajes_data.save_output_files')
+    @mock.patch('process_viajes_data.watch')
+    def test_main_with_watch_saves_metrics_of_each_pass(self, watch, save_output_files):
+        output_path = tempfile.mkdtemp()
+        metrics_json = os.path.join(output_path, 'metrics.json')
+        try:
+            save_output_files.side_effect = lambda *args: METRICS.add('parse', self.file_path, rows=1) or set()
+            main(['process_viajes_data', self.data_path, '--watch', '--output', output_path, '--metrics-json',
+                  metrics_json])
+            save_outputs = watch.call_args[0][2]
+            for _ in range(2):
+                save_outputs([self.file_path])
+                with open(metrics_json) as f:
+                    self.assertEqual({'files': 1, 'rows': 1}, json.load(f)['stages']['parse'])
+        finally:
+            shutil.rmtree(output_path)
+
+    def test_main_with_watch_and_shard(self):
+        with self.assertRaises(SystemExit):
+            main(['process_viajes_data', self.data_path, '--watch', '10', '--shard', '1/2'])
+
     def tearDown(self):
         test_gz = os.path.join(self.data_path, 'test.gz')
 
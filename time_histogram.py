@@ -0,0 +1,72 @@
+import numpy as np
+
+from od_matrix import CommuneMatrix
+
+# minutes of each bin and bins in a day
+BIN_MINUTES = 15
+BINS = 24 * 60 // BIN_MINUTES
+# timestamps are written like 2020-03-01 10:23:17
+TIMESTAMP_WIDTH = 19
+
+
+def get_time_bins(timestamps):
+    """
+    Parse time of day of timestamps in bulk, hours and minutes are read from fixed-width digits of timestamps as
+    bytes.
+    :return: array with bin of each timestamp, -1 if timestamp is not valid (e.g. '-')
+    """
+    chars = np.array(timestamps, dtype='S{0}'.format(TIMESTAMP_WIDTH)).view(np.uint8).reshape(-1, TIMESTAMP_WIDTH)
+    digits = chars[:, [11, 12, 14, 15]].astype(np.intp) - ord('0')
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    minutes = digits[:, 2] * 10 + digits[:, 3]
+    valid = np.all((digits >= 0) & (digits <= 9), axis=1) & (chars[:, 13] == ord(':')) & (hours < 24) & \
+        (minutes < 60)
+    return np.where(valid, (hours * 60 + minutes) // BIN_MINUTES, -1)
+
+
+def get_bin_label(time_bin):
+    """
+    :return: start time of bin, e.g. 10:15:00
+    """
+    minutes = time_bin * BIN_MINUTES
+    return '{0:02d}:{1:02d}:00'.format(minutes // 60, minutes % 60)
+
+
+class TimeHistogram(CommuneMatrix):
+    """
+    Class to accumulate expanded trips of each commune in bins of 15 minutes of the day on a dense float64
+    commune x bin matrix.
+    """
+
+    def _shape(self, size):
+        return size, BINS
+
+    def add(self, communes, bins, values):
+        """
+        Add trips given as commune ids, bins and expanded trips, trips whose bin is -1 are skipped.
+        Trips of a cell are added in order with np.bincount so the result is the same as adding them one by one.
+        """
+        bins = np.asarray(bins, dtype=np.intp)
+        valid = bins >= 0
+        cells = np.asarray(communes, dtype=np.intp)[valid] * BINS + bins[valid]
+        size = self.values.size
+        self.values += np.bincount(cells, weights=np.asarray(values, dtype=np.float64)[valid],
+                                   minlength=size).reshape(self.values.shape)
+        self.visited |= np.bincount(cells, minlength=size).reshape(self.values.shape) > 0
+
+    def add_codes(self, names, communes, bins, values):
+        """
+        Add trips whose communes are given as positions in names.
+        """
+        communes = np.asarray(communes, dtype=np.intp)
+        self.add(self.intern_codes(names, communes)[communes], bins, values)
+
+    def rows(self):
+        """
+        Yield (commune, bin start time, expanded trips) for each cell with trips ordered by commune id and bin.
+        """
+        n = len(self.communes)
+        communes, bins = np.nonzero(self.visited[:n])
+        values = self.values[communes, bins].tolist()
+        for commune, time_bin, value in zip(communes.tolist(), bins.tolist(), values):
+            yield self.communes[commune], get_bin_label(time_bin), value
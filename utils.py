@@ -1,59 +1,476 @@
 import argparse
+import bz2
+import collections
+import csv
 import glob
-import gzip
 import io
+import lzma
+import mmap
 import os
+import time
 import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
+from operator import itemgetter
 
-from aws import AWSSession
+from archives import ARCHIVE_EXTENSION, get_archive_members, split_archive_path
+from aws import DEFAULT_MAX_CONCURRENCY, DEFAULT_PART_SIZE, MB, AWSSession, UploadProgress, get_transfer_config
+from gzip_backends import open_gzip_reader
+from metrics import METRICS
+from s3_files import is_s3_path, list_s3_files, open_s3_file
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+READ_BUFFER_SIZE = 1024 * 1024
+# decoded bytes of each file kept in memory by prefetch threads
+DEFAULT_PREFETCH_SIZE = 64 * MB
+
+
+class TimedReader(io.RawIOBase):
+    """
+    Raw reader that counts bytes read from a stream and seconds spent reading (and decoding) them.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        start = time.perf_counter()
+        n = self.stream.readinto(b)
+        self.read_seconds += time.perf_counter() - start
+        self.bytes_read += n or 0
+        return n
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            super().close()
+
+
+class DecodedFileObject(io.BufferedReader):
+    """
+    Buffered reader over decoded data that closes the source file too.
+    """
+
+    def __init__(self, raw, source, buffer_size=READ_BUFFER_SIZE):
+        super().__init__(TimedReader(raw), buffer_size)
+        self.source = source
+
+    @property
+    def bytes_read(self):
+        return self.raw.bytes_read
+
+    @property
+    def read_seconds(self):
+        return self.raw.read_seconds
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.source.close()
+
+
+def open_zip_member(file_obj):
+    zip_file_obj = zipfile.ZipFile(file_obj)
+    # it assumes that zip file has only one file
+    file_name = zip_file_obj.namelist()[0]
+    return zip_file_obj.open(file_name, 'r')
+
+
+# magic bytes of each supported format and the function to decode a binary file object with that format
+DECODERS = [
+    (b'\x1f\x8b', open_gzip_reader),
+    (b'PK\x03\x04', open_zip_member),
+    (b'PK\x05\x06', open_zip_member),  # empty zip file
+    (b'BZh', bz2.BZ2File),
+    (b'\xfd7zXZ\x00', lzma.LZMAFile),
+]
+if zstandard is not None:
+    DECODERS.append((b'\x28\xb5\x2f\xfd', lambda file_obj: zstandard.ZstdDecompressor().stream_reader(
+        file_obj, read_size=READ_BUFFER_SIZE)))
+EXTENSIONS = ['gz', 'zip', 'bz2', 'xz', 'zst']
+# extension of files saved by compact command
+COMPACT_EXTENSION = 'npz'
+
+
+def get_decoder(header):
+    for magic, decoder in DECODERS:
+        if header.startswith(magic):
+            return decoder
+    return None
+
+
+def open_archive_member(archive, member):
+    """
+    Stream member from zip archive without extracting it, member is decoded if it is compressed.
+    :return: binary file object with uncompressed data
+    """
+    zip_file = zipfile.ZipFile(archive)
+    try:
+        file_obj = zip_file.open(member)
+        decoder = get_decoder(file_obj.peek(8))
+    except BaseException:
+        zip_file.close()
+        raise
+    source = ExitStack()
+    source.callback(zip_file.close)
+    source.callback(file_obj.close)
+    return DecodedFileObject(decoder(file_obj) if decoder else file_obj, source)
+
+
+def get_binary_file_object(datafile):
+    """
+    Open file once, detect its format from the first bytes and decode it if it is compressed.
+    Paths of zip archive members (e.g. 2020-03.zip/2020-03-01.viajes) are read from archive and S3 paths
+    (e.g. s3://bucket/2020-03-01.viajes.gz) are streamed from S3.
+    :return: binary file object with uncompressed data
+    """
+    if is_s3_path(datafile):
+        file_obj = io.BufferedReader(open_s3_file(datafile), READ_BUFFER_SIZE)
+    else:
+        archive_member = split_archive_path(datafile)
+        if archive_member is not None:
+            return open_archive_member(*archive_member)
+        file_obj = io.open(datafile, str('rb'), buffering=READ_BUFFER_SIZE)
+    try:
+        decoder = get_decoder(file_obj.peek(8))
+        return DecodedFileObject(decoder(file_obj) if decoder else file_obj, file_obj)
+    except BaseException:
+        file_obj.close()
+        raise
+
+
+class PrefetchedReader(io.RawIOBase):
+    """
+    Raw reader over chunks decoded ahead of time followed by the rest of the decoded stream.
+    """
+
+    def __init__(self, chunks, stream):
+        self.chunks = collections.deque(memoryview(chunk) for chunk in chunks)
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self.chunks:
+            return self.stream.readinto(b)
+        chunk = self.chunks[0]
+        n = min(len(b), len(chunk))
+        b[:n] = chunk[:n]
+        if n == len(chunk):
+            self.chunks.popleft()
+        else:
+            self.chunks[0] = chunk[n:]
+        return n
+
+    def close(self):
+        try:
+            self.chunks.clear()
+            self.stream.close()
+        finally:
+            super().close()
+
+
+def _prefetch_file(datafile, max_bytes):
+    """
+    :return: chunks with first max_bytes of decoded data and file object to read the rest, or None if file can not be
+    opened
+    """
+    start = time.perf_counter()
+    try:
+        file_obj = get_binary_file_object(datafile)
+    except Exception:
+        return None
+    chunks = []
+    size = 0
+    try:
+        while size < max_bytes:
+            chunk = file_obj.read(min(READ_BUFFER_SIZE, max_bytes - size))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+    except BaseException:
+        file_obj.close()
+        raise
+    METRICS.add('prefetch', datafile, bytes_out=size, seconds=time.perf_counter() - start)
+    return chunks, file_obj
+
+
+def prefetch_files(files_path, depth=2, max_bytes=DEFAULT_PREFETCH_SIZE):
+    """
+    Decode next files on a thread pool while current file is used. At most depth files are decoded ahead and each
+    one keeps up to max_bytes in memory, the rest of the file is decoded when it is read.
+    :return: iterator over (file path, binary file object with uncompressed data), file object is None when file can
+    not be opened so errors are raised where file is opened again
+    """
+    files_path = iter(files_path)
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        def submit():
+            for datafile in files_path:
+                pending.append((datafile, executor.submit(_prefetch_file, datafile, max_bytes)))
+                return
 
-def is_gzipfile(file_path):
-    with gzip.open(file_path) as file_obj:
         try:
-            file_obj.read(1)
-            return True
-        except IOError:
-            return False
+            for _ in range(depth):
+                submit()
+            while pending:
+                datafile, future = pending.popleft()
+                prefetched = future.result()
+                # next file is decoded only when there is room for it
+                submit()
+                if prefetched is None:
+                    yield datafile, None
+                    continue
+                chunks, file_obj = prefetched
+                yield datafile, DecodedFileObject(PrefetchedReader(chunks, file_obj), file_obj)
+        finally:
+            for _, future in pending:
+                future.cancel()
+                if not future.cancelled() and future.exception() is None and future.result() is not None:
+                    future.result()[1].close()
+
+
+def is_plain_file(datafile):
+    """
+    :return: True if file is a file on disk without compression
+    """
+    if is_s3_path(datafile) or split_archive_path(datafile) is not None:
+        return False
+    with io.open(datafile, str('rb')) as file_obj:
+        return get_decoder(file_obj.read(8)) is None
+
+
+def get_byte_ranges(datafile, parts, skip_lines=0):
+    """
+    Split plain file in byte ranges that start and end at line boundaries, it uses mmap to find line ends.
+    :param skip_lines: lines at the beginning of file that are not included in any range
+    :return: list of (start, end) byte ranges, it is empty if file has no lines after skipped lines
+    """
+    with io.open(datafile, str('rb')) as file_obj:
+        size = os.fstat(file_obj.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            for _ in range(skip_lines):
+                start = data.find(b'\n', start) + 1
+                if start == 0:
+                    return []
+            bounds = [start]
+            for i in range(1, parts):
+                position = max(start + (size - start) * i // parts, bounds[-1])
+                line_end = data.find(b'\n', max(position - 1, 0))
+                bounds.append(size if line_end == -1 else line_end + 1)
+            bounds.append(size)
+    return [(range_start, range_end) for range_start, range_end in zip(bounds, bounds[1:]) if range_end > range_start]
+
+
+class ByteRangeReader(io.RawIOBase):
+    """
+    Raw reader over a byte range of a plain file mapped in memory.
+    """
+
+    def __init__(self, datafile, start, end):
+        self.file_obj = io.open(datafile, str('rb'))
+        try:
+            self.data = mmap.mmap(self.file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self.file_obj.close()
+            raise
+        self.position = start
+        self.end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(min(len(b), self.end - self.position), 0)
+        b[:n] = self.data[self.position:self.position + n]
+        self.position += n
+        return n
+
+    def close(self):
+        try:
+            self.data.close()
+            self.file_obj.close()
+        finally:
+            super().close()
+
+
+def open_byte_range(datafile, start, end):
+    """
+    :return: binary file object with bytes of file between start and end
+    """
+    reader = ByteRangeReader(datafile, start, end)
+    return DecodedFileObject(reader, reader)
 
 
 def get_file_object(datafile):
     """
     :return: file object
     """
-    if zipfile.is_zipfile(datafile):
-        zip_file_obj = zipfile.ZipFile(datafile)
-        # it assumes that zip file has only one file
-        file_name = zip_file_obj.namelist()[0]
-        file_obj_0 = zip_file_obj.open(file_name, 'r')
-        file_obj = io.TextIOWrapper(file_obj_0, encoding='latin-1')
-    elif is_gzipfile(datafile):
-        file_obj = gzip.open(datafile, str('rt'), encoding='latin-1')
-    else:
-        file_obj = io.open(datafile, str('r'), encoding='latin-1')
+    return io.TextIOWrapper(get_binary_file_object(datafile), encoding='latin-1')
 
-    return file_obj
+
+def get_columns(file_obj, columns, delimiter='|', encoding='latin-1'):
+    """
+    Iterate over lines of a binary file object and yield a tuple with requested columns as bytes.
+    Lines are split only up to the last requested column, lines with quotes are parsed by csv module.
+    """
+    separator = delimiter.encode(encoding)
+    maxsplit = max(columns) + 1
+    getter = itemgetter(*columns)
+    if len(columns) == 1:
+        def getter(row, column=columns[0]):
+            return row[column],
+    for line in file_obj:
+        if b'"' in line:
+            row = next(csv.reader([line.decode(encoding)], delimiter=delimiter))
+            yield tuple(field.encode(encoding) for field in getter(row))
+            continue
+        row = line.split(separator, maxsplit)
+        if len(row) <= maxsplit:
+            row[-1] = row[-1].rstrip(b'\r\n')
+        yield getter(row)
+
+
+def sample_lines(lines, sample_rate, delimiter='|', encoding='latin-1'):
+    """
+    Yield lines whose first field (trip id) has a hash lower than sample rate, the same lines are kept in each run.
+    Rejected lines are not split. Lines can be bytes or str.
+    """
+    threshold = int(sample_rate * 2 ** 32)
+    separator = delimiter.encode(encoding)
+    crc32 = zlib.crc32
+    for line in lines:
+        if isinstance(line, str):
+            key = line[:line.find(delimiter)].encode(encoding)
+        else:
+            key = line[:line.find(separator)]
+        if crc32(key) < threshold:
+            yield line
 
 
 def get_files(file_type, path):
-    types = ('*{}'.format(file_type), '*{0}.gz'.format(file_type), '*{0}.zip'.format(file_type))
+    """
+    :return: files of file type sorted by date in file name. Zip archives with several files are expanded to paths
+    of their members, e.g. 2020-03.zip/2020-03-01.viajes. Path can be an S3 prefix like s3://bucket/prefix
+    """
+    extensions = EXTENSIONS + [COMPACT_EXTENSION] + ['{0}.{1}'.format(extension, COMPACT_EXTENSION) for extension in
+                                                     EXTENSIONS]
+    types = ['*{}'.format(file_type)] + ['*{0}.{1}'.format(file_type, extension) for extension in extensions]
+    if is_s3_path(path):
+        # zip archives in S3 are read as compressed files, they are not expanded
+        return sorted(list_s3_files(path, types), key=get_file_date)
     files = []
     for file in types:
         files.extend(glob.glob(os.path.join(path, file)))
-    files.sort(key=lambda x: ''.join(os.path.basename(x)).split(".")[0])
+    archives = glob.glob(os.path.join(path, '*{0}'.format(ARCHIVE_EXTENSION)))
+    for archive in sorted(archives):
+        members = get_archive_members(archive, types)
+        if members is None:
+            continue
+        if archive in files:
+            # file compressed with zip
+            if len(members) <= 1:
+                continue
+            files.remove(archive)
+        files.extend(members)
+    files.sort(key=get_file_date)
     return files
 
 
-def send_data_to_s3(path, bucket):
-    aws_session = AWSSession()
+def get_file_date(file_path):
+    """
+    :return: date in YYYY-MM-DD format taken from file name
+    """
+    return os.path.basename(file_path).split(".")[0]
+
+
+def get_input_files(file_type, paths):
+    """
+    :param paths: path or list of paths, each one a directory with files, an S3 prefix or a file
+    :return: files of file type sorted by date in file name
+    """
+    files = []
+    for path in [paths] if isinstance(paths, str) else paths:
+        files.extend(get_files(file_type, path) if os.path.isdir(path) or is_s3_path(path) else [path])
+    files.sort(key=get_file_date)
+    return files
+
+
+def filter_files_by_date(files_path, lower_bound=None, upper_bound=None):
+    """
+    :return: files whose date in file name is between bounds, both included
+    """
+    if lower_bound is None and upper_bound is None:
+        return list(files_path)
+    lower_bound = to_datetime(lower_bound) if lower_bound is not None else datetime.min
+    upper_bound = to_datetime(upper_bound) if upper_bound is not None else datetime.max
+    return [file for file in files_path if
+            lower_bound <= datetime.strptime(get_file_date(file), '%Y-%m-%d') <= upper_bound]
+
+
+def send_data_to_s3(path, bucket, transfer_config=None, skip_unchanged=True, aws_session=None):
+    aws_session = aws_session or AWSSession(transfer_config)
     if not aws_session.check_bucket_exists(bucket):
         print('Bucket \'{0}\' does not exist'.format(bucket))
         exit(1)
-    filename = ''.join(path.split('/')[-1]).split(".")[0] + '.gz'
-    print('{0}: uploading file {1}'.format(datetime.now().replace(microsecond=0), path))
-    aws_session.send_file_to_bucket(path, filename, bucket)
-    print('{0}: finished load of file {1}'.format(datetime.now().replace(microsecond=0), path))
+    for file_path, filename in get_upload_files(path):
+        if skip_unchanged and aws_session.is_unchanged(file_path, filename, bucket):
+            print('{0}: file {1} has not changed, upload skipped'.format(datetime.now().replace(microsecond=0),
+                                                                         file_path))
+            continue
+        print('{0}: uploading file {1}'.format(datetime.now().replace(microsecond=0), file_path))
+        with METRICS.stage('send_data_to_s3', file_path, bytes_out=os.path.getsize(file_path)):
+            aws_session.send_file_to_bucket(file_path, filename, bucket, callback=UploadProgress(file_path))
+        print('{0}: finished load of file {1}'.format(datetime.now().replace(microsecond=0), file_path))
+
+
+def get_upload_files(path):
+    """
+    :return: list of (file path, key) to upload, directories are uploaded with every file inside them
+    """
+    if not os.path.isdir(path):
+        return [(path, os.path.basename(path))]
+    files = []
+    parent = os.path.dirname(os.path.normpath(path))
+    for root, _, file_names in os.walk(path):
+        for file_name in sorted(file_names):
+            file_path = os.path.join(root, file_name)
+            files.append((file_path, os.path.relpath(file_path, parent).replace(os.sep, '/')))
+    return sorted(files)
+
+
+def add_s3_arguments(parser):
+    parser.add_argument('--s3-part-size', help='Part size in MB of multipart uploads.', default=DEFAULT_PART_SIZE // MB,
+                        type=int)
+    parser.add_argument('--s3-max-concurrency', help='Number of threads used to upload parts.',
+                        default=DEFAULT_MAX_CONCURRENCY, type=int)
+    parser.add_argument('--force-upload', help='Upload file even if it has not changed.', action='store_true')
+
+
+def get_s3_options(args):
+    return {
+        'transfer_config': get_transfer_config(args.s3_part_size * MB, args.s3_max_concurrency),
+        'skip_unchanged': not args.force_upload,
+    }
 
 
 def valid_date(s):
@@ -62,3 +479,24 @@ def valid_date(s):
     except ValueError:
         msg = "Not a valid date: '{0}'.".format(s)
         raise argparse.ArgumentTypeError(msg)
+
+
+def valid_sample_rate(s):
+    try:
+        sample_rate = float(s)
+    except ValueError:
+        sample_rate = 0
+    if not 0 < sample_rate <= 1:
+        raise argparse.ArgumentTypeError("Not a valid sample rate: '{0}', use 0 < p <= 1.".format(s))
+    return sample_rate
+
+
+def to_datetime(value):
+    """
+    :param value: datetime, date or string in YYYY-MM-DD format
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d")
+    return datetime(value.year, value.month, value.day)
@@ -0,0 +1,70 @@
+import logging
+import time
+
+from archives import get_file_stat
+from utils import get_files
+
+logger = logging.getLogger(__name__)
+
+# seconds between polls of input path
+DEFAULT_WATCH_INTERVAL = 60
+
+
+class FileWatcher:
+    """
+    Class to poll a directory for files of a type. A file is ready when its size and modification time are the same
+    in two consecutive polls, so files that are still being copied are not processed.
+    """
+
+    def __init__(self, file_type, path):
+        self.file_type = file_type
+        self.path = path
+        # (size, modification time) of files in last poll and of files ready to process
+        self.stats = {}
+        self.ready = {}
+
+    def poll(self):
+        """
+        :return: (files ready to process sorted by date, True if they changed since previous poll)
+        """
+        stats = {}
+        for file_path in get_files(self.file_type, self.path):
+            try:
+                stats[file_path] = get_file_stat(file_path)
+            except OSError:
+                # file was removed after listing directory
+                continue
+        ready = {file_path: stat for file_path, stat in stats.items() if self.stats.get(file_path) == stat}
+        changed = ready != self.ready
+        self.stats = stats
+        self.ready = ready
+        return [file_path for file_path in stats if file_path in ready], changed
+
+    def retry(self):
+        """
+        Process ready files again in next poll.
+        """
+        self.ready = {}
+
+
+def watch(file_type, path, callback, interval=DEFAULT_WATCH_INTERVAL, polls=None):
+    """
+    Poll path every interval seconds and call callback with ready files each time new files are ready or ready files
+    change or are removed. If callback fails it is called again in next poll.
+    :param polls: number of polls, None to poll until interrupted
+    """
+    logger.info('watching {0} files in {1} every {2} seconds'.format(file_type, path, interval))
+    poll = 0
+    watcher = FileWatcher(file_type, path)
+    while polls is None or poll < polls:
+        if poll:
+            time.sleep(interval)
+        poll += 1
+        files_path, changed = watcher.poll()
+        if not changed:
+            continue
+        try:
+            callback(files_path)
+        except Exception:
+            logger.exception('files in {0} could not be processed, they will be processed again'.format(path))
+            watcher.retry()
@@ -0,0 +1,194 @@
+import csv
+import io
+import os
+import shutil
+from contextlib import contextmanager
+
+from gzip_backends import GZIP_BACKEND_CHOICES, open_gzip_writer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXTENSIONS = {
+    'gzip': 'gz',
+    'zstd': 'zst',
+}
+DEFAULT_COMPRESSION_LEVELS = {
+    'gzip': 9,
+    'zstd': 3,
+}
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+OUTPUT_FORMATS = ['csv', 'parquet', 'arrow']
+# value to mark columns that are saved dictionary-encoded
+DICTIONARY = 'dictionary'
+
+
+def get_output_path(output, output_filename, compression='gzip', output_format='csv'):
+    """
+    :return: path of csv file or path of directory with partitioned files for parquet and arrow formats
+    """
+    if output_format != 'csv':
+        return os.path.join(output, output_filename)
+    return os.path.join(output, '{0}.{1}'.format(output_filename, EXTENSIONS[compression]))
+
+
+def _open_compressed_stream(raw, csv_name, compression, compression_level, gzip_backend='auto',
+                            compression_threads=1):
+    if compression_level is None:
+        compression_level = DEFAULT_COMPRESSION_LEVELS[compression]
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstandard package is required to use zstd compression')
+        return zstandard.ZstdCompressor(level=compression_level).stream_writer(raw)
+    # file name inside gzip header is the name of csv file
+    return open_gzip_writer(raw, csv_name, compression_level, gzip_backend, compression_threads)
+
+
+@contextmanager
+def open_csv_writer(output, output_filename, compression='gzip', compression_level=None,
+                    buffer_size=DEFAULT_BUFFER_SIZE, gzip_backend='auto', compression_threads=1):
+    """
+    Yield a csv writer whose rows are compressed while they are written. Data goes to a temporary file that
+    replaces the output file only when the writer finishes without errors.
+    """
+    path = get_output_path(output, output_filename, compression)
+    tmp_path = '{0}.tmp'.format(path)
+    raw = open(tmp_path, 'wb', buffering=buffer_size)
+    try:
+        stream = _open_compressed_stream(raw, '{0}.csv'.format(output_filename), compression, compression_level,
+                                         gzip_backend, compression_threads)
+        outfile = io.TextIOWrapper(stream, encoding='UTF-8', newline='\n')
+        yield csv.writer(outfile)
+        outfile.close()
+        raw.close()
+    except BaseException:
+        raw.close()
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+class PartitionedTableWriter:
+    """
+    Class to write rows to parquet or arrow files partitioned by year and month of the date in the first column,
+    e.g. year=2020/month=3/part-0.parquet. Rows are kept in memory until a row of another month arrives.
+    """
+
+    def __init__(self, path, header, output_format='parquet', column_types=None):
+        if pyarrow is None:
+            raise ValueError('pyarrow package is required to use {0} format'.format(output_format))
+        self.path = path
+        self.header = header
+        self.output_format = output_format
+        self.column_types = column_types or {}
+        self.partition = None
+        self.rows = []
+
+    def writerow(self, row):
+        partition = str(row[0])[:7]
+        if partition != self.partition:
+            self.flush()
+            self.partition = partition
+        self.rows.append(row)
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def _get_array(self, name, values):
+        array = pyarrow.array(values)
+        column_type = self.column_types.get(name)
+        if column_type == DICTIONARY:
+            return array.dictionary_encode()
+        if column_type is not None:
+            return array.cast(column_type)
+        return array
+
+    def flush(self):
+        if not self.rows:
+            return
+        columns = zip(*self.rows)
+        table = pyarrow.Table.from_arrays([self._get_array(name, list(values)) for name, values in
+                                           zip(self.header, columns)], names=self.header)
+        year, month = self.partition.split('-')
+        directory = os.path.join(self.path, 'year={0}'.format(int(year)), 'month={0}'.format(int(month)))
+        os.makedirs(directory, exist_ok=True)
+        file_path = os.path.join(directory, 'part-{0}.{1}'.format(len(os.listdir(directory)), self.output_format))
+        if self.output_format == 'parquet':
+            pyarrow.parquet.write_table(table, file_path)
+        else:
+            with pyarrow.ipc.new_file(file_path, table.schema) as writer:
+                writer.write_table(table)
+        self.rows = []
+
+
+@contextmanager
+def open_partitioned_writer(output, output_filename, header, output_format='parquet', column_types=None):
+    """
+    Yield a PartitionedTableWriter that writes to a temporary directory that replaces the output directory only
+    when the writer finishes without errors.
+    """
+    path = get_output_path(output, output_filename, output_format=output_format)
+    tmp_path = '{0}.tmp'.format(path)
+    old_path = '{0}.old'.format(path)
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    try:
+        writer = PartitionedTableWriter(tmp_path, header, output_format, column_types)
+        yield writer
+        writer.flush()
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    os.makedirs(tmp_path, exist_ok=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+@contextmanager
+def open_table_writer(output, output_filename, header, output_format='csv', column_types=None, **options):
+    """
+    Yield a writer with writerow method for the chosen format. Header is written for csv files.
+    """
+    if output_format == 'csv':
+        with open_csv_writer(output, output_filename, **options) as w:
+            w.writerow(header)
+            yield w
+    else:
+        with open_partitioned_writer(output, output_filename, header, output_format, column_types) as w:
+            yield w
+
+
+def add_writer_arguments(parser):
+    parser.add_argument('--format', help='Output format, parquet and arrow files are partitioned by year and month.',
+                        default='csv', choices=OUTPUT_FORMATS)
+    parser.add_argument('--compression', help='Compression of output file.', default='gzip',
+                        choices=sorted(EXTENSIONS))
+    parser.add_argument('--compression-level', help='Compression level, by default 9 for gzip and 3 for zstd.',
+                        default=None, type=int)
+    parser.add_argument('--buffer-size', help='Size in bytes of output file buffer.', default=DEFAULT_BUFFER_SIZE,
+                        type=int)
+    parser.add_argument('--gzip-backend', help='gzip implementation, auto uses the fastest installed one.',
+                        default='auto', choices=GZIP_BACKEND_CHOICES)
+    parser.add_argument('--compression-threads', help='Threads used to compress gzip output in parallel blocks.',
+                        default=1, type=int)
+
+
+def get_writer_options(args):
+    return {
+        'output_format': args.format,
+        'compression': args.compression,
+        'compression_level': args.compression_level,
+        'buffer_size': args.buffer_size,
+        'gzip_backend': args.gzip_backend,
+        'compression_threads': args.compression_threads,
+    }